@@ -13,15 +13,35 @@
 # limitations under the License.
 
 import os
+import re
 import xml.etree.ElementTree as ET
 import json
 import hashlib
 
+# Leading paragraph designations such as "(b)" or "(b)(1)(i)"
+PARAGRAPH_LABEL_PATTERN = re.compile(r'^\s*((?:\([0-9A-Za-z]{1,6}\))+)')
+PARAGRAPH_LABEL_PART_PATTERN = re.compile(r'\(([0-9A-Za-z]{1,6})\)')
+
+# eCFR DIV types that locate a section within Title 21
+HIERARCHY_DIV_TYPES = {
+    "CHAPTER": "chapter",
+    "SUBCHAP": "subchapter",
+    "PART": "part"
+}
+
+ROMAN_NUMERALS = [
+    'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix', 'x',
+    'xi', 'xii', 'xiii', 'xiv', 'xv', 'xvi', 'xvii', 'xviii', 'xix', 'xx',
+    'xxi', 'xxii', 'xxiii', 'xxiv', 'xxv'
+]
+
 class XMLProcessor:
-    def __init__(self, output_directory):
+    def __init__(self, output_directory, index_directory="title21_index"):
         self.output_directory = output_directory
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory)
+        self.index_directory = index_directory
+        for directory in (output_directory, index_directory):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
 
     def generate_document_id(self, section_id: str, section_name: str) -> str:
         clean_section_id = ''.join(c for c in section_id if c.isalnum())
@@ -47,6 +67,82 @@ class XMLProcessor:
                 content += child.tail
         return content
 
+    def paragraph_level(self, label: str, stack: list, italic: bool = False) -> int:
+        """Return the eCFR nesting level (1-based) of a single paragraph label.
+
+        eCFR paragraphs nest as (a) -> (1) -> (i) -> (A) -> (<I>1</I>); letters
+        such as "i", "v" and "x" are roman numerals only when they start or
+        continue a level-3 sequence.
+        """
+        if label.isdigit():
+            return 5 if italic else 2
+        if label.isupper():
+            return 4
+        if label in ROMAN_NUMERALS and len(stack) >= 2:
+            previous = stack[2] if len(stack) >= 3 else None
+            index = ROMAN_NUMERALS.index(label)
+            if index == 0 or previous == ROMAN_NUMERALS[index - 1]:
+                return 3
+        if len(label) == 1:
+            return 1
+        return 3
+
+    def paragraph_labels(self, p: ET.Element, text: str) -> list:
+        """Return (label, italic) pairs designating a paragraph.
+
+        Covers leading labels ("(b)(1) ...") and the common "(a) <I>Heading.</I>
+        (1) ..." form where the first subparagraph starts inline.
+        """
+        match = PARAGRAPH_LABEL_PATTERN.match(text)
+        if match is None:
+            return []
+        children = list(p)
+        italic = bool(
+            children and children[0].tag in ("I", "E")
+            and (p.text or "").strip() == "("
+            and (children[0].tail or "").startswith(")")
+        )
+        labels = [(label, italic) for label in PARAGRAPH_LABEL_PART_PATTERN.findall(match.group(1))]
+        for child in children:
+            if child.tag in ("I", "E") and child.tail and not (child.tail or "").startswith(")"):
+                inline = PARAGRAPH_LABEL_PATTERN.match(child.tail)
+                if inline:
+                    labels += [(label, False) for label in PARAGRAPH_LABEL_PART_PATTERN.findall(inline.group(1))]
+                break
+        return labels
+
+    def split_paragraphs(self, div: ET.Element, content: str) -> list:
+        """Split a section into labelled paragraphs.
+
+        Returns [path, start, end] entries, where path is the full designation
+        (e.g. "(b)(1)") and start/end are character offsets into the section
+        content produced by explore().
+        """
+        paragraphs = []
+        stack = []
+        cursor = 0
+        for p in div.iter("P"):
+            text = self.explore(p)
+            start = content.find(text, cursor) if text else -1
+            if start == -1:
+                continue
+            end = start + len(text)
+            cursor = end
+
+            labels = self.paragraph_labels(p, text)
+            if not labels:
+                # Unlabelled text continues the current paragraph
+                if paragraphs:
+                    paragraphs[-1][2] = end
+                continue
+
+            for label, italic in labels:
+                level = self.paragraph_level(label, stack, italic)
+                stack = stack[:level - 1] + [label]
+            path = ''.join(f"({label})" for label in stack)
+            paragraphs.append([path, start, end])
+        return paragraphs
+
     def process_xml(self, xml_file_path):
         tree = ET.parse(xml_file_path)
         root = tree.getroot()
@@ -54,9 +150,18 @@ class XMLProcessor:
         document_chunks = {}
         visited = set()
 
-        def process_div(div, parent_names=None):
+        def process_div(div, parent_names=None, hierarchy=None):
             if parent_names is None:
                 parent_names = []
+            if hierarchy is None:
+                hierarchy = {"chapter": None, "subchapter": None, "part": None}
+
+            # Track the eCFR chapter/subchapter/part enclosing each section
+            div_type = div.attrib.get("TYPE")
+            if div_type in HIERARCHY_DIV_TYPES:
+                hierarchy = dict(hierarchy, **{HIERARCHY_DIV_TYPES[div_type]: div.attrib.get("N")})
+                if div_type == "CHAPTER":
+                    hierarchy["subchapter"] = None
 
             head = div.find("HEAD")
             if head is not None and head.text:
@@ -65,7 +170,7 @@ class XMLProcessor:
             else:
                 names = parent_names
 
-            if div.attrib.get("TYPE") == "SECTION":
+            if div_type == "SECTION":
                 section_id = div.attrib.get("N", "")
                 if section_id and section_id not in visited:
                     visited.add(section_id)
@@ -76,12 +181,14 @@ class XMLProcessor:
                         "id": document_id,
                         "section_id": section_id,
                         "section_name": section_name,
-                        "content": content
+                        "content": content,
+                        "paragraphs": self.split_paragraphs(div, content),
+                        **hierarchy
                     }
             else:
                 for child_div in div:
                     if child_div.tag.startswith("DIV"):
-                        process_div(child_div, names)
+                        process_div(child_div, names, hierarchy)
 
         for div1 in root.findall("DIV1"):
             process_div(div1)
@@ -95,9 +202,69 @@ class XMLProcessor:
                 json.dump(doc_content, f, ensure_ascii=False, indent=2)
             print(f"Saved document: {file_path}")
 
+    def compute_corpus_version(self, xml_file_path) -> str:
+        hash_object = hashlib.sha256()
+        with open(xml_file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hash_object.update(block)
+        return hash_object.hexdigest()[:16]
+
+    def build_section_index(self, document_chunks, corpus_version):
+        """Map normalized section numbers (e.g. "110.80") to their chunk content.
+
+        Consumed by function-image-inspection to resolve cited sections and
+        paragraphs without a datastore search.
+        """
+        sections = {}
+        for doc in document_chunks.values():
+            key = doc["section_id"].replace("\u00a7", "").strip()
+            sections[key] = {
+                "document_id": doc["id"],
+                "section_name": doc["section_name"],
+                "content": doc["content"],
+                "paragraphs": doc["paragraphs"]
+            }
+        return {
+            "corpus_version": corpus_version,
+            "sections": sections
+        }
+
+    def save_section_index(self, section_index):
+        file_path = os.path.join(self.index_directory, "section_index.json")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(section_index, f, ensure_ascii=False)
+        print(f"Saved section index with {len(section_index['sections'])} sections: {file_path}")
+
+    def build_part_hierarchy(self, document_chunks, corpus_version):
+        """Map each part number to its eCFR chapter and subchapter.
+
+        Consumed by function-image-inspection to build citation URLs such as
+        https://www.ecfr.gov/current/title-21/chapter-I/subchapter-B/part-110
+        """
+        parts = {}
+        for doc in document_chunks.values():
+            if doc["part"] and doc["part"] not in parts:
+                parts[doc["part"]] = {
+                    "chapter": doc["chapter"],
+                    "subchapter": doc["subchapter"]
+                }
+        return {
+            "corpus_version": corpus_version,
+            "parts": parts
+        }
+
+    def save_part_hierarchy(self, part_hierarchy):
+        file_path = os.path.join(self.index_directory, "part_hierarchy.json")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(part_hierarchy, f, ensure_ascii=False, indent=2)
+        print(f"Saved part hierarchy with {len(part_hierarchy['parts'])} parts: {file_path}")
+
     def process_and_save(self, xml_file_path):
         chunks = self.process_xml(xml_file_path)
         self.save_documents(chunks)
+        corpus_version = self.compute_corpus_version(xml_file_path)
+        self.save_section_index(self.build_section_index(chunks, corpus_version))
+        self.save_part_hierarchy(self.build_part_hierarchy(chunks, corpus_version))
 
 if __name__ == "__main__":
     xml_file_path = "title21.xml"
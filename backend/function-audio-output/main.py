@@ -15,6 +15,7 @@
 import functions_framework
 from flask import jsonify, Response, stream_with_context, request
 import base64
+import hashlib
 import logging
 import os
 import mimetypes
@@ -22,13 +23,95 @@ import struct
 import time
 import re
 import json
+import unicodedata
+import uuid
+import wave
+import io
+import math
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from google import genai
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
 from google.genai import types
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Gemini client
+# One client, and so one HTTP connection pool, is shared by every sentence and request on
+# the instance, keeping connections alive instead of paying TLS setup per sentence.
+TTS_MODEL = "gemini-2.5-flash-preview-tts"
+TTS_VOICE = "Zubenelgenubi"
+TTS_MAX_CONNECTIONS = int(os.environ.get('TTS_MAX_CONNECTIONS', '20'))
+TTS_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('TTS_MAX_KEEPALIVE_CONNECTIONS', '10'))
+# httpx closes idle connections after 5s by default, shorter than the gap between requests
+TTS_KEEPALIVE_SECONDS = float(os.environ.get('TTS_KEEPALIVE_SECONDS', '120'))
+TTS_WARMUP = os.environ.get('TTS_WARMUP', 'true').lower() == 'true'
+
+_client = None
+_client_lock = threading.Lock()
+# Setup cost a per-call client would pay: client construction, and a cold request
+# minus a request on a kept-alive connection (measured by the warm-up)
+_client_stats = {'init_seconds': 0.0, 'connection_seconds': 0.0, 'calls': 0}
+
+
+def get_client() -> genai.Client:
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                client_init_start = time.time()
+                _client = genai.Client(
+                    api_key=os.environ.get("GEMINI_API_KEY"),
+                    http_options=types.HttpOptions(client_args={
+                        'limits': httpx.Limits(
+                            max_connections=TTS_MAX_CONNECTIONS,
+                            max_keepalive_connections=TTS_MAX_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=TTS_KEEPALIVE_SECONDS
+                        )
+                    })
+                )
+                _client_stats['init_seconds'] = time.time() - client_init_start
+                print(f"[PERF] Gemini client initialization: {_client_stats['init_seconds']:.4f}s")
+    return _client
+
+
+def warm_up_client():
+    """Open a pooled connection before the first request and measure what reusing it saves."""
+    try:
+        client = get_client()
+        cold_start = time.time()
+        client.models.get(model=TTS_MODEL)
+        cold_seconds = time.time() - cold_start
+        warm_start = time.time()
+        client.models.get(model=TTS_MODEL)
+        warm_seconds = time.time() - warm_start
+        _client_stats['connection_seconds'] = max(0.0, cold_seconds - warm_seconds)
+        print(f"[PERF] Client warm-up: new connection {cold_seconds:.4f}s, reused connection {warm_seconds:.4f}s")
+    except Exception as e:
+        logger.warning(f"Gemini client warm-up failed: {e}")
+
+
+def record_client_reuse():
+    """Count a call on the shared client and report the setup time reuse has saved."""
+    with _client_lock:
+        _client_stats['calls'] += 1
+        calls = _client_stats['calls']
+    saved_per_call = _client_stats['init_seconds'] + _client_stats['connection_seconds']
+    print(f"[PERF] Shared client call {calls}: ~{saved_per_call:.4f}s setup saved per call, "
+          f"~{saved_per_call * calls:.2f}s total")
+
+
+# Warm up in the background so instance start is not delayed
+if TTS_WARMUP and os.environ.get("GEMINI_API_KEY"):
+    threading.Thread(target=warm_up_client, daemon=True).start()
+
 
 def parse_audio_mime_type(mime_type: str) -> dict[str, int | None]:
     """Parses bits per sample and rate from an audio MIME type string.
@@ -106,76 +189,79 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
     return header + audio_data
 
 
+def stream_gemini_audio(text: str):
+    """Yield (mime_type, data) for each audio chunk as Gemini streams it."""
+    client = get_client()
+    record_client_reuse()
+
+    # Prepare contents
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=text),
+            ],
+        ),
+    ]
+
+    # Configure generation
+    generate_content_config = types.GenerateContentConfig(
+        temperature=1,
+        response_modalities=[
+            "audio",
+        ],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    voice_name=TTS_VOICE
+                )
+            )
+        ),
+    )
+
+    stream_start_time = time.time()
+    chunk_count = 0
+    audio_chunk_count = 0
+
+    for chunk in client.models.generate_content_stream(
+        model=TTS_MODEL,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        chunk_count += 1
+        if (
+            chunk.candidates is None
+            or chunk.candidates[0].content is None
+            or chunk.candidates[0].content.parts is None
+        ):
+            continue
+
+        if chunk.candidates[0].content.parts[0].inline_data and chunk.candidates[0].content.parts[0].inline_data.data:
+            inline_data = chunk.candidates[0].content.parts[0].inline_data
+            audio_chunk_count += 1
+            if audio_chunk_count == 1:
+                print(f"[PERF] Time to first audio chunk: {time.time() - stream_start_time:.4f}s")
+            yield inline_data.mime_type, inline_data.data
+
+    print(f"[PERF] Audio streaming complete: {time.time() - stream_start_time:.4f}s, chunks received: {chunk_count}")
+
+
 def generate_gemini_audio(text: str) -> bytes | None:
     """Generate audio content for the given text using Gemini API."""
     try:
         start_time = time.time()
-        
-        # Initialize Gemini client
-        client_init_start = time.time()
-        client = genai.Client(
-            api_key=os.environ.get("GEMINI_API_KEY"),
-        )
-        print(f"[PERF] Gemini client initialization: {time.time() - client_init_start:.4f}s")
-
-        model = "gemini-2.5-flash-preview-tts"
-        
-        # Prepare contents
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text=text),
-                ],
-            ),
-        ]
-        
-        # Configure generation
-        generate_content_config = types.GenerateContentConfig(
-            temperature=1,
-            response_modalities=[
-                "audio",
-            ],
-            speech_config=types.SpeechConfig(
-                voice_config=types.VoiceConfig(
-                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                        voice_name="Zubenelgenubi"
-                    )
-                )
-            ),
-        )
 
         # Collect audio chunks
         audio_chunks = []
         mime_type = None
-        
-        stream_start_time = time.time()
-        chunk_count = 0
-        
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            chunk_count += 1
-            if (
-                chunk.candidates is None
-                or chunk.candidates[0].content is None
-                or chunk.candidates[0].content.parts is None
-            ):
-                continue
-                
-            if chunk.candidates[0].content.parts[0].inline_data and chunk.candidates[0].content.parts[0].inline_data.data:
-                inline_data = chunk.candidates[0].content.parts[0].inline_data
-                audio_chunks.append(inline_data.data)
-                
-                # Get mime type from first chunk
-                if mime_type is None:
-                    mime_type = inline_data.mime_type
-                    print(f"Audio mime type: {mime_type}")
-
-        print(f"[PERF] Audio streaming complete: {time.time() - stream_start_time:.4f}s, chunks received: {chunk_count}")
-        
+        for chunk_mime_type, data in stream_gemini_audio(text):
+            audio_chunks.append(data)
+
+            # Get mime type from first chunk
+            if mime_type is None:
+                mime_type = chunk_mime_type
+                print(f"Audio mime type: {mime_type}")
+
         if not audio_chunks:
             logger.error("No audio data generated")
             return None
@@ -201,6 +287,177 @@ def generate_gemini_audio(text: str) -> bytes | None:
         return None
 
 
+# TTS audio cache
+#
+# Synthesized WAVs are stored under the SHA-256 of (model, voice, normalized text),
+# in an in-memory LRU, then /tmp, then optionally GCS. Lower-tier hits are copied
+# into the tiers above. /tmp is memory-backed on Cloud Functions, so it is capped too.
+TTS_CACHE_MEMORY_MB = float(os.environ.get('TTS_CACHE_MEMORY_MB', '64'))
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', '/tmp/tts-cache')
+TTS_CACHE_DISK_MB = float(os.environ.get('TTS_CACHE_DISK_MB', '128'))
+TTS_CACHE_BUCKET = os.environ.get('TTS_CACHE_BUCKET')
+TTS_CACHE_PREFIX = os.environ.get('TTS_CACHE_PREFIX', 'tts-cache/')
+
+_storage_client = None
+
+
+def get_storage_client():
+    """Get or create storage client."""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client()
+    return _storage_client
+
+
+def normalize_tts_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def tts_cache_key(text: str) -> str:
+    return hashlib.sha256(f"{TTS_MODEL}\n{TTS_VOICE}\n{normalize_tts_text(text)}".encode('utf-8')).hexdigest()
+
+
+class TTSAudioCache:
+    """Tiered content-addressed store of synthesized WAV bytes."""
+
+    def __init__(self, memory_bytes, directory, disk_bytes, bucket):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.bucket = bucket
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bytes | None, str | None]:
+        """Return the cached audio for key and the tier it came from."""
+        audio = self._get_memory(key)
+        if audio is not None:
+            return audio, 'memory'
+        for tier, getter in (('disk', self._get_disk), ('gcs', self._get_gcs)):
+            try:
+                audio = getter(key)
+            except Exception as e:
+                logger.warning(f"TTS cache {tier} read failed: {e}")
+                continue
+            if audio is not None:
+                self._put_memory(key, audio)
+                if tier == 'gcs':
+                    self._put_disk(key, audio)
+                return audio, tier
+        return None, None
+
+    def put(self, key: str, audio: bytes):
+        self._put_memory(key, audio)
+        for tier, putter in (('disk', self._put_disk), ('gcs', self._put_gcs)):
+            try:
+                putter(key, audio)
+            except Exception as e:
+                logger.warning(f"TTS cache {tier} write failed: {e}")
+
+    def _get_memory(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+            return audio
+
+    def _put_memory(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= len(previous)
+            self._memory[key] = audio
+            self._memory_size += len(audio)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def _get_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _put_disk(self, key, audio):
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Remove the oldest cached files while the directory is over its budget."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.wav'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _get_gcs(self, key):
+        if not self.bucket:
+            return None
+        blob = get_storage_client().bucket(self.bucket).blob(f"{TTS_CACHE_PREFIX}{key}.wav")
+        try:
+            return blob.download_as_bytes()
+        except NotFound:
+            return None
+
+    def _put_gcs(self, key, audio):
+        if not self.bucket:
+            return
+        blob = get_storage_client().bucket(self.bucket).blob(f"{TTS_CACHE_PREFIX}{key}.wav")
+        try:
+            # Content-addressed, so an existing object already has this audio
+            blob.upload_from_string(audio, content_type='audio/wav', if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+
+tts_cache = TTSAudioCache(
+    int(TTS_CACHE_MEMORY_MB * 1024 * 1024),
+    TTS_CACHE_DIR,
+    int(TTS_CACHE_DISK_MB * 1024 * 1024),
+    TTS_CACHE_BUCKET
+)
+
+
+def synthesize(text: str) -> tuple[bytes | None, bool]:
+    """Return WAV audio for text from the cache or Gemini, and whether it was cached."""
+    key = tts_cache_key(text)
+    audio, tier = tts_cache.get(key)
+    if audio is not None:
+        print(f"[CACHE] {tier} hit for {text[:50]}")
+        return audio, True
+    audio = generate_gemini_audio(text)
+    if audio:
+        tts_cache.put(key, audio)
+    return audio, False
+
+
 def split_into_sentences(text: str) -> list[str]:
     """
     Splits text into sentences based on common punctuation.
@@ -215,33 +472,99 @@ def split_into_sentences(text: str) -> list[str]:
     return processed_sentences
 
 
-def generate_audio_events(text_to_speak):
+# Look-ahead synthesis
+# Up to K sentences are synthesized concurrently ahead of the one being emitted. K
+# follows the ratio of synthesis time to audio duration: while one sentence plays,
+# K in-flight syntheses must finish at least one more.
+TTS_PIPELINE = os.environ.get('TTS_PIPELINE', 'true').lower() == 'true'
+TTS_MIN_LOOKAHEAD = int(os.environ.get('TTS_MIN_LOOKAHEAD', '1'))
+TTS_MAX_LOOKAHEAD = int(os.environ.get('TTS_MAX_LOOKAHEAD', '4'))
+TTS_INITIAL_LOOKAHEAD = 2
+# Weight of the newest sentence in the latency and duration averages
+TTS_LATENCY_SMOOTHING = 0.5
+
+
+def wav_duration(wav_bytes: bytes) -> float:
+    """Playback length in seconds of a PCM WAV."""
+    with wave.open(io.BytesIO(wav_bytes)) as wav:
+        return wav.getnframes() / wav.getframerate() if wav.getframerate() else 0.0
+
+
+def timed_synthesis(sentence: str) -> tuple[bytes | None, float, bool]:
+    start_time = time.time()
+    audio_bytes, cached = synthesize(sentence)
+    return audio_bytes, time.time() - start_time, cached
+
+
+class LookaheadController:
+    """Adapts how many sentences are synthesized ahead to observed TTS latency."""
+
+    def __init__(self, adaptive: bool):
+        self.adaptive = adaptive
+        self.lookahead = min(TTS_MAX_LOOKAHEAD, max(TTS_MIN_LOOKAHEAD, TTS_INITIAL_LOOKAHEAD)) if adaptive else 1
+        self.latency = None
+        self.duration = None
+
+    def observe(self, synthesis_seconds: float, audio_seconds: float):
+        if not self.adaptive or audio_seconds <= 0:
+            return
+        if self.latency is None:
+            self.latency, self.duration = synthesis_seconds, audio_seconds
+        else:
+            self.latency += TTS_LATENCY_SMOOTHING * (synthesis_seconds - self.latency)
+            self.duration += TTS_LATENCY_SMOOTHING * (audio_seconds - self.duration)
+        # One extra slot absorbs latency spikes
+        needed = math.ceil(self.latency / self.duration) + 1
+        self.lookahead = min(TTS_MAX_LOOKAHEAD, max(TTS_MIN_LOOKAHEAD, needed))
+
+
+def generate_audio_events(text_to_speak, pipelined=TTS_PIPELINE):
     """Generator function for SSE events."""
+    pool = None
     try:
         sentences = split_into_sentences(text_to_speak)
         if not sentences:
             yield f"event: stream_error\ndata: {json.dumps({'error': 'No sentences to process'})}\n\n"
             return
 
-        print(f"[SSE] Processing {len(sentences)} sentences")
-        
+        print(f"[SSE] Processing {len(sentences)} sentences, pipelined: {pipelined}")
+        controller = LookaheadController(pipelined)
+        pool = ThreadPoolExecutor(max_workers=TTS_MAX_LOOKAHEAD if pipelined else 1)
+        pending = {}
+        # Repeated sentences share one synthesis, even before it reaches the cache
+        submitted = {}
+        next_index = 0
+
         for i, sentence in enumerate(sentences):
+            # Keep the look-ahead window full; chunks are still emitted in sentence order
+            while next_index < len(sentences) and next_index < i + controller.lookahead:
+                key = tts_cache_key(sentences[next_index])
+                if key not in submitted:
+                    submitted[key] = pool.submit(timed_synthesis, sentences[next_index])
+                pending[next_index] = submitted[key]
+                next_index += 1
+
             print(f"[SSE] Processing sentence {i+1}/{len(sentences)}: {sentence[:50]}...")
             start_time = time.time()
-            
-            # Generate audio for this sentence
-            audio_bytes = generate_gemini_audio(sentence)
-            
+
+            # Wait for this sentence's audio
+            audio_bytes, synthesis_seconds, cached = pending.pop(i).result()
+
             if audio_bytes:
+                # Cache hits say nothing about TTS latency
+                if not cached:
+                    controller.observe(synthesis_seconds, wav_duration(audio_bytes))
                 base64_audio = base64.b64encode(audio_bytes).decode('utf-8')
                 event_data = {
                     'audio': base64_audio,
                     'sentence_index': i,
                     'total_sentences': len(sentences),
-                    'sentence_text': sentence[:100]  # First 100 chars for debugging
+                    'sentence_text': sentence[:100],  # First 100 chars for debugging
+                    'cached': cached
                 }
                 yield f"event: audio_chunk\ndata: {json.dumps(event_data)}\n\n"
-                print(f"[SSE] Sent audio chunk for sentence {i+1} in {time.time() - start_time:.2f}s")
+                print(f"[SSE] Sent audio chunk for sentence {i+1} after waiting {time.time() - start_time:.2f}s "
+                      f"(synthesis {synthesis_seconds:.2f}s, look-ahead {controller.lookahead})")
             else:
                 # Send error event for this chunk
                 error_data = {
@@ -250,14 +573,164 @@ def generate_audio_events(text_to_speak):
                 }
                 yield f"event: chunk_error\ndata: {json.dumps(error_data)}\n\n"
                 print(f"[SSE] Failed to generate audio for sentence {i+1}")
-        
+
         # Signal end of stream
         yield f"event: stream_end\ndata: {json.dumps({'message': 'Stream finished'})}\n\n"
         print("[SSE] Stream finished")
-        
+
     except Exception as e:
         print(f"[SSE] Error in stream: {e}")
         yield f"event: stream_error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        # A disconnected client closes the generator; drop syntheses it will never receive
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# PCM streaming
+# In pcm format, each sentence is announced by an audio_header event and then sent
+# as raw audio/L16 pcm_chunk events as Gemini produces them, so playback can start
+# after one TTS chunk instead of one sentence. Every event carries a stream-wide seq.
+TTS_STREAM_FORMAT = os.environ.get('TTS_STREAM_FORMAT', 'wav')
+
+
+def wav_to_pcm(wav_bytes: bytes) -> tuple[str, bytes]:
+    """Split a PCM WAV into an audio/L16-style MIME type and its raw samples.
+
+    The header is parsed rather than assumed to be 44 bytes, so WAVs with extra
+    chunks (LIST, fact) never have header bytes played as audio.
+    """
+    with wave.open(io.BytesIO(wav_bytes)) as wav:
+        mime_type = f"audio/L{wav.getsampwidth() * 8};rate={wav.getframerate()}"
+        return mime_type, wav.readframes(wav.getnframes())
+
+
+def stream_sentence_pcm(sentence: str, chunks: queue.Queue):
+    """Put a sentence's audio on chunks as it arrives, from the cache or Gemini.
+
+    Items are ('audio', mime_type, data, cached), ('error', message) and finally
+    ('end', seconds).
+    """
+    start_time = time.time()
+    try:
+        key = tts_cache_key(sentence)
+        audio, tier = tts_cache.get(key)
+        if audio is not None:
+            print(f"[CACHE] {tier} hit for {sentence[:50]}")
+            chunks.put(('audio', *wav_to_pcm(audio), True))
+        else:
+            pcm_chunks = []
+            mime_type = None
+            for mime_type, data in stream_gemini_audio(sentence):
+                pcm_chunks.append(data)
+                chunks.put(('audio', mime_type, data, False))
+            if pcm_chunks:
+                tts_cache.put(key, convert_to_wav(b"".join(pcm_chunks), mime_type))
+            else:
+                chunks.put(('error', 'No audio data generated'))
+    except Exception as e:
+        logger.error(f"Error streaming audio with Gemini: {e}")
+        chunks.put(('error', str(e)))
+    finally:
+        chunks.put(('end', time.time() - start_time))
+
+
+def sse_event(event_type: str, seq: int, data: dict) -> str:
+    return f"event: {event_type}\nid: {seq}\ndata: {json.dumps({'seq': seq, **data})}\n\n"
+
+
+def generate_pcm_events(text_to_speak, pipelined=TTS_PIPELINE):
+    """Generator function for SSE events carrying raw PCM audio."""
+    pool = None
+    seq = 0
+    try:
+        sentences = split_into_sentences(text_to_speak)
+        if not sentences:
+            yield f"event: stream_error\ndata: {json.dumps({'error': 'No sentences to process'})}\n\n"
+            return
+
+        print(f"[SSE] Streaming PCM for {len(sentences)} sentences, pipelined: {pipelined}")
+        controller = LookaheadController(pipelined)
+        pool = ThreadPoolExecutor(max_workers=TTS_MAX_LOOKAHEAD if pipelined else 1)
+        pending = {}
+        next_index = 0
+        stream_start_time = time.time()
+
+        for i, sentence in enumerate(sentences):
+            # Later sentences buffer their chunks while this one is forwarded
+            while next_index < len(sentences) and next_index < i + controller.lookahead:
+                pending[next_index] = queue.Queue()
+                pool.submit(stream_sentence_pcm, sentences[next_index], pending[next_index])
+                next_index += 1
+
+            chunks = pending.pop(i)
+            wait_start_time = time.time()
+            header_sent = False
+            cached = False
+            pcm_bytes = 0
+            bytes_per_second = 0
+            # 16-bit samples must not be split across events
+            remainder = b""
+            while True:
+                item = chunks.get()
+                if item[0] == 'end':
+                    synthesis_seconds = item[1]
+                    break
+                if item[0] == 'error':
+                    seq += 1
+                    yield sse_event('chunk_error', seq, {'sentence_index': i, 'error': item[1]})
+                    continue
+
+                _, mime_type, data, cached = item
+                if not header_sent:
+                    parameters = parse_audio_mime_type(mime_type)
+                    bytes_per_second = parameters['rate'] * parameters['bits_per_sample'] // 8
+                    seq += 1
+                    yield sse_event('audio_header', seq, {
+                        'sentence_index': i,
+                        'total_sentences': len(sentences),
+                        'sentence_text': sentence[:100],
+                        'mime_type': mime_type,
+                        'encoding': 'pcm_s16le',
+                        'sample_rate': parameters['rate'],
+                        'bits_per_sample': parameters['bits_per_sample'],
+                        'channels': 1
+                    })
+                    header_sent = True
+                    if i == 0:
+                        print(f"[PERF] Time to first audio: {time.time() - stream_start_time:.4f}s")
+
+                data = remainder + data
+                split = len(data) - len(data) % 2
+                remainder = data[split:]
+                if split:
+                    seq += 1
+                    pcm_bytes += split
+                    yield sse_event('pcm_chunk', seq, {
+                        'sentence_index': i,
+                        'pcm': base64.b64encode(data[:split]).decode('utf-8')
+                    })
+
+            if header_sent:
+                if not cached and bytes_per_second:
+                    controller.observe(synthesis_seconds, pcm_bytes / bytes_per_second)
+                seq += 1
+                yield sse_event('sentence_end', seq, {'sentence_index': i, 'bytes': pcm_bytes, 'cached': cached})
+                print(f"[SSE] Streamed sentence {i+1}/{len(sentences)} ({pcm_bytes} bytes) after waiting "
+                      f"{time.time() - wait_start_time:.2f}s (look-ahead {controller.lookahead})")
+
+        # Signal end of stream
+        seq += 1
+        yield sse_event('stream_end', seq, {'message': 'Stream finished'})
+        print("[SSE] PCM stream finished")
+
+    except Exception as e:
+        print(f"[SSE] Error in PCM stream: {e}")
+        yield f"event: stream_error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        # A disconnected client closes the generator; drop syntheses it will never receive
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
 
 
 @functions_framework.http
@@ -292,9 +765,15 @@ def fda_generate_audio(request):
         # Handle streaming request
         if is_stream_request:
             print("Handling streaming audio request")
+            pipelined = bool(request_json.get('pipelined', TTS_PIPELINE))
+            # pcm streams raw audio as it is synthesized; wav sends one complete file per sentence
+            if request_json.get('format', TTS_STREAM_FORMAT) == 'pcm':
+                events = generate_pcm_events(text, pipelined)
+            else:
+                events = generate_audio_events(text, pipelined)
             # Create streaming response
             response = Response(
-                stream_with_context(generate_audio_events(text)),
+                stream_with_context(events),
                 mimetype='text/event-stream',
                 headers={
                     'Access-Control-Allow-Origin': '*',
@@ -311,7 +790,7 @@ def fda_generate_audio(request):
             
             # Generate audio
             audio_gen_start = time.time()
-            audio_data = generate_gemini_audio(text)
+            audio_data, _ = synthesize(text)
             print(f"[PERF] Audio generation call: {time.time() - audio_gen_start:.4f}s")
             
             if not audio_data:
@@ -0,0 +1,46 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""WAV and PCM conversion"""
+
+import struct
+
+import main
+
+PCM = bytes(range(256)) * 96  # 24576 bytes: 0.512 s of 16-bit mono at 24 kHz
+
+def with_list_chunk(wav_bytes):
+    """Insert a LIST chunk between fmt and data, as many encoders do"""
+    info = b'INFOISFT\x06\x00\x00\x00Lavf\x00\x00'
+    list_chunk = b'LIST' + struct.pack('<I', len(info)) + info
+    body = wav_bytes[12:36] + list_chunk + wav_bytes[36:]
+    return b'RIFF' + struct.pack('<I', 4 + len(body)) + b'WAVE' + body
+
+def test_parse_audio_mime_type():
+    assert main.parse_audio_mime_type('audio/L16;rate=24000') == {'bits_per_sample': 16, 'rate': 24000}
+    assert main.parse_audio_mime_type('audio/L24; rate=16000') == {'bits_per_sample': 24, 'rate': 16000}
+    assert main.parse_audio_mime_type('audio/L16;rate=') == {'bits_per_sample': 16, 'rate': 24000}
+
+def test_convert_to_wav_round_trips_to_pcm():
+    wav_bytes = main.convert_to_wav(PCM, 'audio/L16;rate=24000')
+
+    assert main.wav_to_pcm(wav_bytes) == ('audio/L16;rate=24000', PCM)
+    assert main.wav_duration(wav_bytes) == len(PCM) / 2 / 24000
+
+def test_extra_chunks_are_not_played_as_audio():
+    wav_bytes = with_list_chunk(main.convert_to_wav(PCM, 'audio/L16;rate=24000'))
+
+    mime_type, pcm = main.wav_to_pcm(wav_bytes)
+    assert pcm == PCM
+    assert main.wav_duration(wav_bytes) == len(PCM) / 2 / 24000
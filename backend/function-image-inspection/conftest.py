@@ -0,0 +1,51 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared test setup: main is imported with only its network clients replaced.
+
+Run from this directory:
+    python -m pytest -q
+"""
+
+from unittest import mock
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1.batch import WriteBatch
+
+with mock.patch('google.cloud.firestore.Client'), \
+        mock.patch('google.cloud.discoveryengine.SearchServiceClient'), \
+        mock.patch('google.cloud.discoveryengine.DocumentServiceClient'), \
+        mock.patch('google.genai.Client'):
+    import main
+
+def capture_commits(monkeypatch, record):
+    """Use a real Firestore client whose batch commits go to record instead of the network"""
+    monkeypatch.setattr(main, 'db', firestore.Client(project='test-project', credentials=AnonymousCredentials()))
+    monkeypatch.setattr(WriteBatch, 'commit', lambda batch, *args, **kwargs: record(list(batch._write_pbs)))
+
+@pytest.fixture
+def committed(monkeypatch):
+    """Every committed write, in order"""
+    writes = []
+    capture_commits(monkeypatch, writes.extend)
+    return writes
+
+@pytest.fixture
+def batches(monkeypatch):
+    """The writes of each committed batch"""
+    batches = []
+    capture_commits(monkeypatch, batches.append)
+    return batches
@@ -13,27 +13,41 @@
 # limitations under the License.
 
 import base64
+import hashlib
 import io
+import itertools
 import os
 import json
 import logging
+import math
+import queue
+import re
+import signal
 import threading
 import time
 import uuid
-from datetime import datetime
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 import flask
 import functions_framework
+import numpy as np
 from flask import jsonify, request
 from PIL import Image, ImageDraw, ImageFont
 
 from google import genai
 from google.api_core.client_options import ClientOptions
-from google.api_core.exceptions import NotFound, PermissionDenied, ResourceExhausted
+from google.api_core.exceptions import NotFound, PermissionDenied, PreconditionFailed, ResourceExhausted
 from google.cloud import discoveryengine
 from google.cloud import firestore
+from google.cloud import storage
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
 from google.genai import types
 
+from boxes import draw_boxes, to_pixels
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -83,45 +97,409 @@ COMMON_SAFETY_SETTINGS = [
 # Grounding tool for Google Search
 GROUNDING_TOOL = [types.Tool(google_search=types.GoogleSearch())]
 
+# Title 21 section index, built by create-title21-rag-datastore/xml_chunker.py
+SECTION_INDEX_PATH = os.environ.get(
+    'SECTION_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'title21_index', 'section_index.json')
+)
+PART_HIERARCHY_PATH = os.environ.get(
+    'PART_HIERARCHY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'title21_index', 'part_hierarchy.json')
+)
+ECFR_BASE_URL = "https://www.ecfr.gov/current/title-21"
+SECTION_REFERENCE_PATTERN = re.compile(r'(\d+)\s*\.\s*(\d+[a-z]?)((?:\s*\([0-9A-Za-z]{1,6}\))*)')
+PARAGRAPH_LABEL_PATTERN = re.compile(r'\(([0-9A-Za-z]{1,6})\)')
+CFR_PREFIX_PATTERN = re.compile(r'\b21\s*C\.?\s*F\.?\s*R\.?', re.IGNORECASE)
+
+# Verification prompts carry only the spans of Title 21 text that best match
+# the citation reason, up to this many (estimated) tokens
+VERIFICATION_CONTEXT_TOKENS = int(os.environ.get('VERIFICATION_CONTEXT_TOKENS', '2000'))
+CHARS_PER_TOKEN = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+TERM_PATTERN = re.compile(r'[a-z0-9]+')
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.;:])\s+(?=[A-Z(])')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their "
+    "this to was were which with not no any all such shall may must be been being".split()
+)
+
+# Global variables for section index caching
+_section_index = None
+_section_ids_by_document = None
+_section_index_lock = threading.Lock()
+_part_hierarchy = None
+
 # Firestore helper functions
-def create_job(inspection_type):
-    """Create a new job document in Firestore"""
+#
+# Layout:
+#   inspection_jobs/{job_id}                    status and last_event_seq
+#   inspection_jobs/{job_id}/events/{seq}       one document per event, in order
+#
+# Citation images are not stored in Firestore; events carry URLs to /image.
+JOBS_COLLECTION = 'inspection_jobs'
+EVENTS_SUBCOLLECTION = 'events'
+
+# Running jobs renew a lease on every event and checkpoint; jobs whose lease
+# lapses while created/processing are resumed by another worker
+ACTIVE_JOB_STATUSES = ('created', 'processing')
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+RESUME_SWEEP_INTERVAL_SECONDS = int(os.environ.get('RESUME_SWEEP_INTERVAL_SECONDS', '120'))
+INSTANCE_ID = f"{os.environ.get('K_REVISION', 'local')}-{uuid.uuid4().hex[:8]}"
+
+# Idle streams send heartbeats starting at the min interval, doubling up to the max
+HEARTBEAT_MIN_INTERVAL_SECONDS = float(os.environ.get('HEARTBEAT_MIN_INTERVAL_SECONDS', '2'))
+HEARTBEAT_MAX_INTERVAL_SECONDS = float(os.environ.get('HEARTBEAT_MAX_INTERVAL_SECONDS', '15'))
+
+# Per-job event sequence counters for jobs running on this instance
+_event_sequences = {}
+_event_sequences_lock = threading.Lock()
+# Citations of one job are verified concurrently; their events are written one at a time
+_job_event_locks = {}
+
+def get_job_ref(job_id):
+    return db.collection(JOBS_COLLECTION).document(job_id)
+
+def lease_expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+
+def checkpoint_field(*path):
+    """Field path for a stage output under the job's checkpoint map"""
+    return FieldPath('checkpoint', *path).to_api_repr()
+
+def save_checkpoint(job_id, fields):
+    """Record completed stage outputs so a resumed job can skip them.
+
+    Checkpoints mark stage boundaries, so buffered events are committed with them.
+    """
+    event_writer.update(job_id, {**fields, 'lease_expires_at': lease_expiry()})
+    event_writer.flush(job_id)
+
+def create_job(inspection_type, upload_key=None, image_base_url=None, result_cache=None):
+    """Create a new job document in Firestore.
+
+    The document is buffered; callers flush it together with the job's first event.
+    """
     job_id = str(uuid.uuid4())
-    job_ref = db.collection('inspection_jobs').document(job_id)
-    job_ref.set({
+    event_writer.create(job_id, {
         'job_id': job_id,
         'status': 'created',
         'created_at': firestore.SERVER_TIMESTAMP,
         'inspection_type': inspection_type,
-        'events': [],
+        'upload_key': upload_key,
+        'image_base_url': image_base_url,
+        'result_cache': result_cache,
+        'last_event_seq': 0,
+        'checkpoint': {},
+        'lease_owner': INSTANCE_ID,
+        'lease_expires_at': lease_expiry(),
         'result': None
     })
+    with _event_sequences_lock:
+        _event_sequences[job_id] = itertools.count(1)
+    event_bus.open(job_id)
     return job_id
 
-def add_event_to_job(job_id, event_type, content=None, data=None):
-    """Add an event to the job document"""
-    job_ref = db.collection('inspection_jobs').document(job_id)
-    event = {
-        'timestamp': datetime.utcnow(),
-        'type': event_type,
-        'content': content or '',
-        'data': data or {}
-    }
-    job_ref.update({
-        'events': firestore.ArrayUnion([event]),
-        'status': 'processing'
-    })
-    logger.info(f"Added event to job {job_id}: {event_type}")
+def next_event_seq(job_id):
+    """Return the next event sequence number for a job"""
+    with _event_sequences_lock:
+        counter = _event_sequences.get(job_id)
+        if counter is None:
+            # Job was created elsewhere; continue after its last stored event
+            job_doc = get_job_ref(job_id).get()
+            last_seq = (job_doc.to_dict() or {}).get('last_event_seq', 0) if job_doc.exists else 0
+            counter = itertools.count(last_seq + 1)
+            _event_sequences[job_id] = counter
+        return next(counter)
+
+def job_event_lock(job_id):
+    with _event_sequences_lock:
+        return _job_event_locks.setdefault(job_id, threading.Lock())
+
+def add_event_to_job(job_id, event_type, content=None, data=None, job_fields=None):
+    """Append an event to the job's events subcollection.
+
+    job_fields are job document updates committed in the same batch as the event.
+    """
+    # Keep sequence numbers, bus order and last_event_seq monotonic across verification threads
+    with job_event_lock(job_id):
+        seq = next_event_seq(job_id)
+        event = {
+            'seq': seq,
+            'timestamp': datetime.utcnow(),
+            'type': event_type,
+            'content': content or '',
+            'data': data or {}
+        }
+        # Local subscribers get the event immediately; Firestore serves everyone else
+        event_bus.publish(job_id, event)
+        event_writer.append(job_id, event, job_fields)
+    logger.info(f"Added event {seq} to job {job_id}: {event_type}")
 
 def update_job_result(job_id, result, status='completed'):
     """Update the job status only (results are streamed, not stored)"""
-    job_ref = db.collection('inspection_jobs').document(job_id)
+    event_bus.close(job_id, status)
     # Only update status and timestamp, not the actual results
     # This avoids Firestore's 1MB document size limit
-    job_ref.update({
+    event_writer.update(job_id, {
         'status': status,
-        'completed_at': firestore.SERVER_TIMESTAMP
+        'completed_at': firestore.SERVER_TIMESTAMP,
+        'lease_owner': firestore.DELETE_FIELD,
+        'lease_expires_at': firestore.DELETE_FIELD
     })
+    # Remaining events are committed before the terminal status
+    event_writer.flush(job_id)
+    event_writer.forget(job_id)
+    with _event_sequences_lock:
+        _event_sequences.pop(job_id, None)
+        _job_event_locks.pop(job_id, None)
+
+def commit_new_job(job_id):
+    """Commit a new job and its first events, dropping the job entirely if that fails"""
+    try:
+        event_writer.flush(job_id, keep_on_failure=False)
+    except Exception:
+        # The client gets an error, so the job must not be written later and picked up by the sweeper
+        event_bus.close(job_id, 'error')
+        with _event_sequences_lock:
+            _event_sequences.pop(job_id, None)
+            _job_event_locks.pop(job_id, None)
+        raise
+
+# In-process event bus
+class JobEventBus:
+    """Fans out events of jobs running on this instance to local stream subscribers.
+
+    Subscribers on the same instance as the worker get events straight from
+    memory; Firestore stays the durable path for other instances and for
+    clients that connect after the job has been evicted here.
+    """
+
+    def __init__(self, retention_seconds):
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def open(self, job_id):
+        with self._lock:
+            self._evict_finished()
+            self._jobs[job_id] = {
+                'events': [],
+                'subscribers': set(),
+                'status': 'processing',
+                'finished_at': None
+            }
+
+    def publish(self, job_id, event):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['events'].append(event)
+            for subscriber in job['subscribers']:
+                subscriber.put(('event', event))
+
+    def close(self, job_id, status):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = status
+            job['finished_at'] = time.time()
+            state = self._job_state(job)
+            for subscriber in job['subscribers']:
+                subscriber.put(('job', state))
+
+    def subscribe(self, job_id, after_seq, subscriber):
+        """Queue events after after_seq and all later ones on subscriber.
+
+        Returns the job state, or None if the job is not known locally.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            for event in job['events']:
+                if event['seq'] > after_seq:
+                    subscriber.put(('event', event))
+            job['subscribers'].add(subscriber)
+            return self._job_state(job)
+
+    def history(self, job_id):
+        """Return the events published for job_id, or None if the job is not known locally"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return list(job['events']) if job is not None else None
+
+    def unsubscribe(self, job_id, subscriber):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['subscribers'].discard(subscriber)
+
+    def _job_state(self, job):
+        last_event_seq = max((event['seq'] for event in job['events']), default=0)
+        return {'status': job['status'], 'last_event_seq': last_event_seq}
+
+    def _evict_finished(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]:
+            del self._jobs[job_id]
+
+# Finished jobs stay on the bus briefly so streams opened right after completion skip Firestore
+event_bus = JobEventBus(retention_seconds=float(os.environ.get('EVENT_BUS_RETENTION_SECONDS', '120')))
+
+# Batched event writes
+#
+# Event writes are buffered per job and committed in WriteBatches, every
+# EVENT_FLUSH_INTERVAL_SECONDS or when the pipeline flushes at a stage
+# boundary, so Firestore round trips stay off the worker's critical path.
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('EVENT_FLUSH_INTERVAL_SECONDS', '0.25'))
+# Firestore allows 500 writes per batch; two are kept for the job document's create and update
+MAX_EVENTS_PER_BATCH = 498
+
+class JobEventWriter:
+    """Buffers job document and event writes and commits them per job in WriteBatches"""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush_locks = {}
+        # Jobs whose lease was handed back; their writes no longer renew it
+        self._released = set()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def create(self, job_id, document):
+        with self._lock:
+            self._pending_for(job_id)['create'] = document
+
+    def append(self, job_id, event, fields=None):
+        with self._lock:
+            pending = self._pending_for(job_id)
+            pending['events'].append(event)
+            pending['fields'].update(fields or {})
+            pending['fields'].update({'status': 'processing', 'last_event_seq': event['seq']})
+            if job_id not in self._released:
+                pending['fields']['lease_expires_at'] = lease_expiry()
+        self._ensure_started()
+
+    def update(self, job_id, fields):
+        with self._lock:
+            if job_id in self._released and fields.get('lease_expires_at') is not firestore.DELETE_FIELD:
+                fields = {key: value for key, value in fields.items() if key != 'lease_expires_at'}
+            self._pending_for(job_id)['fields'].update(fields)
+        self._ensure_started()
+
+    def release(self, job_id):
+        """Expire the job's lease now and stop renewing it, so another instance can claim it"""
+        with self._lock:
+            self._released.add(job_id)
+            self._pending_for(job_id)['fields']['lease_expires_at'] = datetime.now(timezone.utc)
+        self._ensure_started()
+
+    def flush(self, job_id, keep_on_failure=True):
+        """Commit everything buffered for job_id; on failure the uncommitted writes stay buffered and the error is raised.
+
+        With keep_on_failure=False a failed job's writes are dropped instead, so
+        a job that was never committed is not written later by the flusher.
+        """
+        with self._lock:
+            flush_lock = self._flush_locks.setdefault(job_id, threading.Lock())
+        # Flushes of one job are serialized so batches land in sequence order
+        with flush_lock:
+            with self._lock:
+                pending = self._pending.pop(job_id, None)
+            if pending is None:
+                return
+            try:
+                self._commit(job_id, pending)
+            except Exception:
+                with self._lock:
+                    if not keep_on_failure:
+                        self._pending.pop(job_id, None)
+                        self._flush_locks.pop(job_id, None)
+                        self._released.discard(job_id)
+                        raise
+                    newer = self._pending.get(job_id)
+                    if newer is not None:
+                        pending['events'].extend(newer['events'])
+                        pending['fields'].update(newer['fields'])
+                    self._pending[job_id] = pending
+                raise
+
+    def flush_all(self):
+        with self._lock:
+            job_ids = list(self._pending)
+        for job_id in job_ids:
+            try:
+                self.flush(job_id)
+            except Exception as e:
+                logger.error(f"Error writing events for job {job_id}: {str(e)}")
+
+    def forget(self, job_id):
+        with self._lock:
+            self._flush_locks.pop(job_id, None)
+            self._released.discard(job_id)
+
+    def _pending_for(self, job_id):
+        pending = self._pending.get(job_id)
+        if pending is None:
+            pending = self._pending[job_id] = {'create': None, 'events': [], 'fields': {}}
+        return pending
+
+    def _commit(self, job_id, pending):
+        """Commit pending in batches, removing each batch's writes from it once committed.
+
+        If a batch fails, pending holds exactly the writes still to commit.
+        """
+        job_ref = get_job_ref(job_id)
+        committed_events = 0
+        batches = 0
+        while True:
+            chunk = pending['events'][:MAX_EVENTS_PER_BATCH]
+            last = len(chunk) == len(pending['events'])
+            batch = db.batch()
+            if pending['create'] is not None:
+                batch.set(job_ref, pending['create'])
+            for event in chunk:
+                batch.set(job_ref.collection(EVENTS_SUBCOLLECTION).document(f"{event['seq']:08d}"), event)
+            if last and pending['fields']:
+                batch.update(job_ref, pending['fields'])
+            batch.commit()
+            pending['create'] = None
+            del pending['events'][:len(chunk)]
+            committed_events += len(chunk)
+            batches += 1
+            if last:
+                pending['fields'] = {}
+                break
+        logger.info(f"Committed {committed_events} events for job {job_id} in {batches} batch(es)")
+
+    def _ensure_started(self):
+        # Started lazily so no thread exists before the server forks
+        with self._lock:
+            if self._thread is not None or self._stopped.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush_all()
+
+    def stop(self, timeout=None):
+        """Stop the background flusher, then commit whatever is still buffered"""
+        self._stopped.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush_all()
+
+event_writer = JobEventWriter(EVENT_FLUSH_INTERVAL_SECONDS)
 
 # RAG Utility Functions
 def search_datastore(query: str, data_store_id: str) -> list:
@@ -175,66 +553,618 @@ def extract_safe(obj: object, *keys: str) -> object:
             return None
     return obj
 
-def process_search_results(search_results: list, target_string: str) -> list:
+def process_search_results(search_results: list, exclude_section_ids=()) -> list:
     matching_documents = []
     for i, result in enumerate(search_results):
         logging.debug(f"Processing search result {i+1}: {result}")
 
         doc_id = extract_safe(result, 'document', 'id')
-        full_doc = get_document_by_id(doc_id, DATA_STORE_ID)
-        
-        if full_doc and full_doc.content and full_doc.content.raw_bytes:
+        indexed_doc = lookup_document_content(doc_id)
+        if indexed_doc:
+            content = indexed_doc['content']
+            section_id = indexed_doc['section_id']
+            section_name = indexed_doc['section']
+            paragraphs = indexed_doc['paragraphs']
+        else:
+            full_doc = get_document_by_id(doc_id, DATA_STORE_ID)
+            if not (full_doc and full_doc.content and full_doc.content.raw_bytes):
+                logging.warning(f"No content found for document {doc_id}")
+                continue
             content = full_doc.content.raw_bytes.decode('utf-8')
             section_id = full_doc.struct_data.get('section_id', 'N/A')
             section_name = full_doc.struct_data.get('section_name', 'N/A')
-            
-            if any(word.lower() in content.lower() for word in target_string.split()):
-                matching_documents.append({
-                    'id': doc_id,
-                    'section_id': section_id,
-                    'section': section_name,
-                    'content': content
-                })
-        else:
-            logging.warning(f"No content found for document {doc_id}")
+            paragraphs = None
+
+        # Skip sections already supplied from the section index
+        section_id = section_id.replace('\u00a7', '').strip()
+        if section_id in exclude_section_ids:
+            continue
+
+        # Relevance is decided per span by select_relevant_spans
+        matching_documents.append({
+            'id': doc_id,
+            'section_id': section_id,
+            'section': section_name,
+            'content': content,
+            'paragraphs': paragraphs
+        })
 
     return matching_documents
 
-def get_relevant_codes(query: str, data_store_id: str) -> str:
+def get_relevant_codes(query: str, data_store_id: str, cited_section=None, token_budget=VERIFICATION_CONTEXT_TOKENS) -> str:
+    """Return the Title 21 spans most relevant to query, labelled with their section IDs.
+
+    cited_section is a lookup_section_text result; its spans are listed first
+    and may use up to half of token_budget.
+    """
+    cited_spans = []
+    exclude_section_ids = ()
+    if cited_section:
+        entry = load_section_index()['sections'][cited_section['section_id']]
+        cited_spans = split_section_spans(
+            cited_section['section_id'], entry['content'], entry['paragraphs'], cited_section['paragraph']
+        )
+        exclude_section_ids = (cited_section['section_id'],)
+
     search_results = search_datastore(query, data_store_id)
-    matching_documents = process_search_results(search_results, query)
+    matching_documents = process_search_results(search_results, exclude_section_ids)
+    retrieved_spans = [
+        span
+        for doc in matching_documents
+        for span in split_section_spans(doc['section_id'], doc['content'], doc['paragraphs'])
+    ]
     
+    selected = select_relevant_spans(query, cited_spans, retrieved_spans, token_budget)
     relevant_codes = []
-    for doc in matching_documents:
-        relevant_codes.append(f"Section {doc['section_id']}: {doc['content']}")
+    for index in selected:
+        if index < len(cited_spans):
+            label, text = cited_spans[index]
+            relevant_codes.append(f"Section {label} (cited): {text}")
+        else:
+            label, text = retrieved_spans[index - len(cited_spans)]
+            relevant_codes.append(f"Section {label}: {text}")
     
     return "\n".join(relevant_codes)
 
-def plot_bounding_box(img, citation, verified_section, index):
-    draw = ImageDraw.Draw(img)
-    width, height = img.size
+# Section index lookups
+def load_section_index():
+    """Load the Title 21 section index once and cache it."""
+    global _section_index, _section_ids_by_document
+
+    if _section_index is not None:
+        return _section_index
+
+    with _section_index_lock:
+        if _section_index is not None:
+            return _section_index
+        try:
+            with open(SECTION_INDEX_PATH, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            logger.info(f"Loaded section index with {len(index.get('sections', {}))} sections "
+                        f"(corpus version {index.get('corpus_version')})")
+        except FileNotFoundError:
+            logger.warning(f"Section index not found at {SECTION_INDEX_PATH}; cited sections will be resolved by search only")
+            index = {'corpus_version': None, 'sections': {}}
+        except Exception as e:
+            logger.error(f"Error loading section index: {str(e)}")
+            index = {'corpus_version': None, 'sections': {}}
+
+        _section_ids_by_document = {
+            entry['document_id']: section_id
+            for section_id, entry in index['sections'].items()
+        }
+        _section_index = index
+    return _section_index
+
+def normalize_section_reference(reference: str) -> tuple[str, str] | None:
+    """Normalize a citation such as "21 CFR § 110.80 (b)(1)" to ("110.80", "(b)(1)")."""
+    if not reference:
+        return None
+    text = CFR_PREFIX_PATTERN.sub(' ', str(reference).replace('\u00a7', ' '))
+    match = SECTION_REFERENCE_PATTERN.search(text)
+    if match is None:
+        return None
+    section_id = f"{match.group(1)}.{match.group(2)}"
+    paragraph = ''.join(f"({label})" for label in PARAGRAPH_LABEL_PATTERN.findall(match.group(3)))
+    return section_id, paragraph
+
+def lookup_section_text(reference: str) -> dict | None:
+    """Resolve a cited section or paragraph to its text using the section index.
+
+    Falls back to the closest enclosing paragraph, then to the whole section,
+    when the exact paragraph is not present in the index.
+    """
+    normalized = normalize_section_reference(reference)
+    if normalized is None:
+        return None
+    section_id, paragraph = normalized
+
+    entry = load_section_index()['sections'].get(section_id)
+    if entry is None:
+        return None
+
+    content = entry['content']
+    labels = PARAGRAPH_LABEL_PATTERN.findall(paragraph)
+    while labels:
+        path = ''.join(f"({label})" for label in labels)
+        spans = [p for p in entry['paragraphs'] if p[0] == path or p[0].startswith(path + '(')]
+        if spans:
+            return {
+                'section_id': section_id,
+                'paragraph': path,
+                'section_name': entry['section_name'],
+                'text': content[spans[0][1]:max(span[2] for span in spans)]
+            }
+        labels.pop()
+
+    return {
+        'section_id': section_id,
+        'paragraph': '',
+        'section_name': entry['section_name'],
+        'text': content
+    }
+
+def lookup_document_content(doc_id: str) -> dict | None:
+    """Return indexed content for a datastore document ID, avoiding a get_document call."""
+    load_section_index()
+    section_id = _section_ids_by_document.get(doc_id)
+    if section_id is None:
+        return None
+    entry = _section_index['sections'][section_id]
+    return {
+        'section_id': section_id,
+        'section': entry['section_name'],
+        'content': entry['content'],
+        'paragraphs': entry['paragraphs']
+    }
+
+def load_part_hierarchy():
+    """Load the part -> chapter/subchapter table once and cache it."""
+    global _part_hierarchy
+
+    if _part_hierarchy is not None:
+        return _part_hierarchy
+
+    try:
+        with open(PART_HIERARCHY_PATH, 'r', encoding='utf-8') as f:
+            _part_hierarchy = json.load(f)
+        logger.info(f"Loaded part hierarchy with {len(_part_hierarchy.get('parts', {}))} parts")
+    except FileNotFoundError:
+        logger.warning(f"Part hierarchy not found at {PART_HIERARCHY_PATH}; citation URLs will omit chapter/subchapter")
+        _part_hierarchy = {'corpus_version': None, 'parts': {}}
+    except Exception as e:
+        logger.error(f"Error loading part hierarchy: {str(e)}")
+        _part_hierarchy = {'corpus_version': None, 'parts': {}}
+    return _part_hierarchy
+
+def build_ecfr_url(reference: str) -> str | None:
+    """Build the eCFR URL for a cited section, e.g. for "110.80(b)(1)":
+    https://www.ecfr.gov/current/title-21/chapter-I/subchapter-B/part-110#p-110.80(b)(1)
+    """
+    normalized = normalize_section_reference(reference)
+    if normalized is None:
+        return None
+    section_id, paragraph = normalized
+    part = section_id.split('.')[0]
+
+    url = ECFR_BASE_URL
+    location = load_part_hierarchy()['parts'].get(part)
+    if location:
+        if location.get('chapter'):
+            url += f"/chapter-{location['chapter']}"
+        if location.get('subchapter'):
+            url += f"/subchapter-{location['subchapter']}"
+    url += f"/part-{part}"
+
+    # eCFR anchors paragraphs as "p-110.80(b)(1)" and whole sections as "110.80"
+    if paragraph:
+        return f"{url}#p-{section_id}{paragraph}"
+    return f"{url}#{section_id}"
+
+# Snippet selection
+def split_section_spans(section_id, content, paragraphs=None, paragraph=''):
+    """Split section content into (label, text) spans for scoring.
+
+    Indexed sections split on their labelled paragraphs, limited to paragraph
+    and its subparagraphs when one is given; other content splits into sentences.
+    """
+    spans = []
+    if paragraphs:
+        first_start = min(start for _, start, _ in paragraphs)
+        if not paragraph and content[:first_start].strip():
+            spans.append((section_id, content[:first_start].strip()))
+        for path, start, end in paragraphs:
+            if paragraph and path != paragraph and not path.startswith(paragraph + '('):
+                continue
+            text = content[start:end].strip()
+            if text:
+                spans.append((f"{section_id}{path}", text))
+    if not spans:
+        spans = [
+            (section_id, sentence.strip())
+            for sentence in SENTENCE_BOUNDARY_PATTERN.split(content)
+            if sentence.strip()
+        ]
+    return spans
+
+def tokenize_terms(text):
+    return [term for term in TERM_PATTERN.findall(text.lower()) if len(term) > 1 and term not in STOPWORDS]
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def bm25_scores(query_terms, documents):
+    """Okapi BM25 score of each tokenized document for the query terms"""
+    if not documents:
+        return []
+    average_length = sum(len(terms) for terms in documents) / len(documents) or 1
+    document_frequency = Counter()
+    for terms in documents:
+        document_frequency.update(set(terms))
+    idf = {
+        term: math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+        for term in set(query_terms)
+    }
+
+    scores = []
+    for terms in documents:
+        frequencies = Counter(terms)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / average_length)
+        scores.append(sum(
+            weight * frequencies[term] * (BM25_K1 + 1) / (frequencies[term] + length_norm)
+            for term, weight in idf.items()
+            if frequencies[term]
+        ))
+    return scores
+
+def select_relevant_spans(query, cited_spans, retrieved_spans, token_budget):
+    """Pick the best-scoring spans that fit in token_budget.
+
+    Indexes below len(cited_spans) refer to cited_spans, the rest to
+    retrieved_spans. Cited spans fill up to half the budget first; retrieved
+    spans then compete with the remaining cited spans for the rest, and must
+    share at least one term with the query. Returns indexes in source order.
+    """
+    spans = cited_spans + retrieved_spans
+    scores = bm25_scores(tokenize_terms(query), [tokenize_terms(text) for _, text in spans])
+    ranked = sorted(range(len(spans)), key=lambda index: scores[index], reverse=True)
+
+    selected = set()
+    used_tokens = 0
+    for index in ranked:
+        if index >= len(cited_spans):
+            continue
+        tokens = estimate_tokens(spans[index][1])
+        if used_tokens + tokens <= token_budget // 2:
+            selected.add(index)
+            used_tokens += tokens
+    for index in ranked:
+        if index in selected or (index >= len(cited_spans) and scores[index] <= 0):
+            continue
+        tokens = estimate_tokens(spans[index][1])
+        if used_tokens + tokens <= token_budget:
+            selected.add(index)
+            used_tokens += tokens
+
+    logger.info(f"Selected {len(selected)} of {len(spans)} spans ({used_tokens} estimated tokens)")
+    return sorted(selected)
+
+# Title 21 context cache
+#
+# Inspections whose background matches a profile can verify citations against
+# the full text of that profile's Title 21 parts, registered once as Gemini
+# cached content, instead of retrieving sections for every citation. Caches
+# are named after the profile and corpus version, so a rebuilt section index
+# gets new caches and old ones simply expire.
+CONTEXT_CACHE_ENABLED = os.environ.get('CONTEXT_CACHE_ENABLED', 'false').lower() == 'true'
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get('CONTEXT_CACHE_TTL_SECONDS', '3600'))
+# Caches closer than this to expiry are replaced rather than used
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300
+# After a failed cache creation, retrieval is used for this long before retrying
+CONTEXT_CACHE_RETRY_SECONDS = 300
+DEFAULT_CONTEXT_CACHE_PROFILES = {
+    "food": {
+        "keywords": ["food", "restaurant", "kitchen", "bakery", "dairy", "seafood", "produce", "beverage", "warehouse"],
+        "parts": ["110", "117"]
+    },
+    "pharmaceutical": {
+        "keywords": ["pharma", "drug", "medication", "tablet", "capsule", "sterile", "compounding"],
+        "parts": ["210", "211"]
+    }
+}
+# Profiles are matched in order against the lowercased inspection background
+CONTEXT_CACHE_PROFILES = json.loads(os.environ.get('CONTEXT_CACHE_PROFILES') or json.dumps(DEFAULT_CONTEXT_CACHE_PROFILES))
+
+_context_caches = {}
+# Futures of cache lookups in progress, by display name
+_context_cache_loads = {}
+_context_caches_lock = threading.Lock()
+
+def match_context_profile(inspection_type):
+    """Return the name of the first profile whose keywords appear in inspection_type, or None"""
+    background = (inspection_type or '').lower()
+    for profile, settings in CONTEXT_CACHE_PROFILES.items():
+        if any(keyword in background for keyword in settings['keywords']):
+            return profile
+    return None
+
+def build_part_context(parts):
+    """Full text of every indexed section in parts, in section order"""
+    sections = load_section_index()['sections']
+    section_ids = [section_id for section_id in sections if section_id.split('.')[0] in parts]
+    section_ids.sort(key=lambda section_id: [int(number) if number.isdigit() else number
+                                             for number in re.split(r'(\d+)', section_id)])
+    return "\n\n".join(
+        f"Section {section_id} {sections[section_id]['section_name']}\n{sections[section_id]['content']}"
+        for section_id in section_ids
+    )
+
+def get_context_cache(inspection_type):
+    """Return {'name', 'profile', 'parts'} for inspection_type's cached context, or None.
+
+    None means verification should use retrieval: the mode is off, no profile
+    matches, the section index is missing, or the cache could not be created.
+    """
+    profile = match_context_profile(inspection_type) if CONTEXT_CACHE_ENABLED else None
+    if profile is None:
+        return None
+    corpus_version = load_section_index().get('corpus_version')
+    if not corpus_version:
+        return None
+    parts = CONTEXT_CACHE_PROFILES[profile]['parts']
+    display_name = f"title21-{profile}-{corpus_version}"
+
+    # Listing and creating caches are slow network calls, so they run outside the lock;
+    # threads wanting the same profile meanwhile wait on the first caller's future
+    with _context_caches_lock:
+        cached = _context_caches.get(profile)
+        if cached and cached['display_name'] == display_name and cached['refresh_at'] > datetime.now(timezone.utc):
+            return cached['context'] if cached['context'] else None
+        loading = _context_cache_loads.get(display_name)
+        owner = loading is None
+        if owner:
+            loading = _context_cache_loads[display_name] = Future()
+    if not owner:
+        return loading.result()
+
+    context, refresh_at = prepare_context_cache(profile, display_name, parts)
+    with _context_caches_lock:
+        _context_caches[profile] = {'display_name': display_name, 'context': context, 'refresh_at': refresh_at}
+        _context_cache_loads.pop(display_name, None)
+    loading.set_result(context)
+    return context
+
+def prepare_context_cache(profile, display_name, parts):
+    """Find or create the cached content for a profile; returns (context or None, when to look again)"""
+    now = datetime.now(timezone.utc)
+    margin = timedelta(seconds=CONTEXT_CACHE_REFRESH_MARGIN_SECONDS)
+    # Failures, and caches without a known expiry, are looked up again after this
+    retry_at = now + timedelta(seconds=CONTEXT_CACHE_RETRY_SECONDS)
+    try:
+        # Another instance may already have registered this profile and corpus version
+        existing = next((
+            cache for cache in gemini_2_5_client.caches.list()
+            if cache.display_name == display_name and cache.expire_time and cache.expire_time > now + margin
+        ), None)
+        if existing is None:
+            part_text = build_part_context(parts)
+            if not part_text:
+                logger.warning(f"No indexed sections for parts {parts}; context cache {profile} disabled")
+                raise ValueError("No section text for profile parts")
+            existing = gemini_2_5_client.caches.create(
+                model=GEMINI_2_5_MODEL_NAME,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    system_instruction=f"You are an FDA inspector verifying citations against Title 21 CFR parts {', '.join(parts)}, whose full text follows.",
+                    contents=[types.Content(role="user", parts=[types.Part.from_text(text=part_text)])],
+                    ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s"
+                )
+            )
+            logger.info(f"Created context cache {existing.name} for {profile} ({len(part_text)} characters)")
+        refresh_at = existing.expire_time - margin if existing.expire_time else retry_at
+        return {'name': existing.name, 'profile': profile, 'parts': parts}, refresh_at
+    except Exception as e:
+        logger.error(f"Error preparing context cache for {profile}: {str(e)}")
+        return None, retry_at
+
+# Citation image rendering
+CITATION_IMAGE_MAX_DIMENSION = int(os.environ.get('CITATION_IMAGE_MAX_DIMENSION', '1600'))
+CITATION_IMAGE_QUALITY = int(os.environ.get('CITATION_IMAGE_QUALITY', '85'))
+CITATION_THUMBNAIL_SIZE = int(os.environ.get('CITATION_THUMBNAIL_SIZE', '320'))
+LABEL_FONT_SIZE = 36
+
+# Label font is loaded once per process
+_label_font = None
+
+def get_label_font():
+    global _label_font
+    if _label_font is None:
+        try:
+            # Try system-specific default font paths
+            if os.name == 'nt':  # Windows
+                _label_font = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", LABEL_FONT_SIZE)
+            else:  # Linux/Mac
+                _label_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", LABEL_FONT_SIZE)
+        except OSError:
+            # If all else fails, use default font
+            _label_font = ImageFont.load_default()
+    return _label_font
+
+class InspectionImage:
+    """Job-scoped view of the uploaded image.
+
+    The upload is decoded and downscaled once; each citation is rendered on a
+    copy of that base image instead of re-decoding the full-resolution upload.
+    """
+
+    def __init__(self, image_data, max_dimension=CITATION_IMAGE_MAX_DIMENSION, quality=CITATION_IMAGE_QUALITY):
+        self.quality = quality
+        img = Image.open(io.BytesIO(base64.b64decode(image_data)))
+        # Let the JPEG decoder downscale by a power of two while decoding
+        img.draft('RGB', (max_dimension, max_dimension))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((max_dimension, max_dimension))
+        self.base = img
+        print(f"Prepared citation base image at {img.size[0]}x{img.size[1]}")
+
+    def box_to_pixels(self, box_2d):
+        """Convert a [y1, x1, y2, x2] box normalized to 1000 into ordered, clamped pixels"""
+        width, height = self.base.size
+        y1, x1, y2, x2 = to_pixels(np.array([box_2d], dtype=float), width, height)[0].tolist()
+        return x1, y1, x2, y2
+
+    def encode(self, img):
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='JPEG', quality=self.quality, optimize=True)
+        return img_byte_arr.getvalue()
+
+    def render_citation(self, citation, verified_section):
+        """Return JPEG bytes of the base image annotated with the citation's box and label"""
+        return self.encode(plot_bounding_box(self.base.copy(), self.box_to_pixels(citation['box_2d']), verified_section))
+
+    def crop_thumbnail(self, citation, size=CITATION_THUMBNAIL_SIZE, margin=0.1):
+        """Return JPEG bytes of the citation's region, padded by margin and fit within size"""
+        x1, y1, x2, y2 = self.box_to_pixels(citation['box_2d'])
+        width, height = self.base.size
+        pad_x = int((x2 - x1) * margin)
+        pad_y = int((y2 - y1) * margin)
+        region = self.base.crop((
+            max(0, x1 - pad_x), max(0, y1 - pad_y),
+            min(width, x2 + pad_x), min(height, y2 + pad_y)
+        ))
+        region.thumbnail((size, size))
+        return self.encode(region)
+
+# Citation image storage
+#
+# Rendered images are stored once under the SHA-256 of their bytes, in GCS when
+# CITATION_IMAGE_BUCKET is set and otherwise on local disk, and served by GET /image.
+# Local disk is per instance and, on Cloud Run, memory-backed, so it is capped at
+# CITATION_IMAGE_DISK_MB and only suits a single instance.
+CITATION_IMAGE_BUCKET = os.environ.get('CITATION_IMAGE_BUCKET')
+CITATION_IMAGE_PREFIX = os.environ.get('CITATION_IMAGE_PREFIX', 'citation-images/')
+CITATION_IMAGE_DIR = os.environ.get('CITATION_IMAGE_DIR', '/tmp/citation-images')
+CITATION_IMAGE_DISK_MB = float(os.environ.get('CITATION_IMAGE_DISK_MB', '64'))
+# Public URL of this function, used to build image URLs (defaults to the request's URL root)
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL')
+IMAGE_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+if not CITATION_IMAGE_BUCKET:
+    logger.warning("CITATION_IMAGE_BUCKET is not set; citation images are kept on this instance only "
+                   "and the result cache is disabled")
+
+_storage_client = None
+
+def get_storage_client():
+    """Get or create storage client."""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client()
+    return _storage_client
+
+def put_citation_image(jpeg_bytes):
+    """Store a rendered image under its content hash and return the key"""
+    key = hashlib.sha256(jpeg_bytes).hexdigest()
+    if CITATION_IMAGE_BUCKET:
+        blob = get_storage_client().bucket(CITATION_IMAGE_BUCKET).blob(f"{CITATION_IMAGE_PREFIX}{key}")
+        try:
+            # Content-addressed, so an existing object already has these bytes
+            blob.upload_from_string(jpeg_bytes, content_type='image/jpeg', if_generation_match=0)
+        except PreconditionFailed:
+            pass
+    else:
+        path = os.path.join(CITATION_IMAGE_DIR, f"{key}.jpg")
+        if not os.path.exists(path):
+            os.makedirs(CITATION_IMAGE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(jpeg_bytes)
+            os.replace(tmp_path, path)
+            trim_citation_image_dir()
+    return key
+
+def trim_citation_image_dir():
+    """Remove the oldest local citation images while the directory is over its budget"""
+    entries = []
+    for entry in os.scandir(CITATION_IMAGE_DIR):
+        if entry.name.endswith('.jpg'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CITATION_IMAGE_DISK_MB * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def get_citation_image(key):
+    """Return the stored image bytes for key, or None"""
+    if not IMAGE_KEY_PATTERN.match(key or ''):
+        return None
+    if CITATION_IMAGE_BUCKET:
+        blob = get_storage_client().bucket(CITATION_IMAGE_BUCKET).blob(f"{CITATION_IMAGE_PREFIX}{key}")
+        try:
+            return blob.download_as_bytes()
+        except NotFound:
+            return None
+    path = os.path.join(CITATION_IMAGE_DIR, f"{key}.jpg")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Uploads are kept in CITATION_IMAGE_BUCKET while their job runs, so another
+# instance can resume it, and are deleted when the job finishes. Without a
+# bucket they are not kept, and an interrupted job cannot be resumed.
+UPLOAD_PREFIX = os.environ.get('UPLOAD_PREFIX', 'inspection-uploads/')
+
+def put_upload(image_bytes):
+    """Keep an upload for resuming its job; returns its key, or None without a bucket"""
+    if not CITATION_IMAGE_BUCKET:
+        return None
+    # Keyed per job, so deleting one job's upload never affects another
+    key = uuid.uuid4().hex
+    blob = get_storage_client().bucket(CITATION_IMAGE_BUCKET).blob(f"{UPLOAD_PREFIX}{key}")
+    blob.upload_from_string(image_bytes, content_type='application/octet-stream')
+    return key
+
+def get_upload(key):
+    """Return the kept upload for key, or None"""
+    if not key or not CITATION_IMAGE_BUCKET:
+        return None
+    blob = get_storage_client().bucket(CITATION_IMAGE_BUCKET).blob(f"{UPLOAD_PREFIX}{key}")
+    try:
+        return blob.download_as_bytes()
+    except NotFound:
+        return None
+
+def delete_upload(key):
+    if not key or not CITATION_IMAGE_BUCKET:
+        return
+    try:
+        get_storage_client().bucket(CITATION_IMAGE_BUCKET).blob(f"{UPLOAD_PREFIX}{key}").delete()
+    except NotFound:
+        pass
+    except Exception as e:
+        logger.error(f"Error deleting upload {key}: {str(e)}")
+
+def citation_image_url(base_url, key):
+    return f"{base_url.rstrip('/')}/image?key={key}"
+
+def plot_bounding_box(img, box, verified_section):
+    """Draw a citation box (pixel coordinates) and its section label onto img"""
+    font = get_label_font()
 
     color = 'red'
     outline_thickness = 5
 
-    try:
-        # Try system-specific default font paths
-        if os.name == 'nt':  # Windows
-            font = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", 36)
-        else:  # Linux/Mac
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 36)
-    except OSError:
-        # If all else fails, use default font
-        font = ImageFont.load_default()
-
-    y1, x1, y2, x2 = citation['box_2d']
-    x1 = int(x1 * width / 1000)
-    y1 = int(y1 * height / 1000)
-    x2 = int(x2 * width / 1000)
-    y2 = int(y2 * height / 1000)
-
-    for i in range(outline_thickness):
-        draw.rectangle([x1+i, y1+i, x2-i, y2-i], outline=color)
+    x1, y1, x2, y2 = box
+    draw_boxes(img, np.array([[y1, x1, y2, x2]]), color, outline_thickness)
+    draw = ImageDraw.Draw(img)
 
     # Draw text at top of image, independent of bounding box
     label = f"Section {verified_section}"
@@ -252,14 +1182,78 @@ def plot_bounding_box(img, citation, verified_section, index):
     # Draw text
     draw.text((text_x + 10, text_y + 5), label, fill=color, font=font)
 
-    # Save to memory instead of file
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='JPEG')
-    img_byte_arr.seek(0)
-    
-    return base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+    return img
+
+# Streamed citation parsing
+#
+# Each citation is handed to verification as soon as its JSON object closes in
+# the initial analysis stream, so verification overlaps the rest of generation.
+VERIFICATION_WORKERS = int(os.environ.get('VERIFICATION_WORKERS', '3'))
+# Citations whose reasons overlap this much (Jaccard similarity of their terms)
+# share one verification; citations of the same section need less overlap
+CITATION_GROUP_REASON_SIMILARITY = float(os.environ.get('CITATION_GROUP_REASON_SIMILARITY', '0.8'))
+CITATION_GROUP_SECTION_SIMILARITY = float(os.environ.get('CITATION_GROUP_SECTION_SIMILARITY', '0.3'))
+CITATIONS_ARRAY_PATTERN = re.compile(r'"citations"\s*:\s*\[')
+
+class CitationStreamParser:
+    """Incrementally extracts the objects of the "citations" array from streamed JSON text"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.in_array = False
+        self.array_closed = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
 
-def generate_initial_response(job_id, inspection_type, image_data):
+    def feed(self, text):
+        """Append text and return the citation objects it completed"""
+        self.buffer += text
+        citations = []
+        while not self.array_closed and self.position < len(self.buffer):
+            if not self.in_array:
+                match = CITATIONS_ARRAY_PATTERN.search(self.buffer, self.position)
+                if match is None:
+                    # The key may be split across chunks; rescan its possible start next time
+                    self.position = max(self.position, len(self.buffer) - 32)
+                    break
+                self.in_array = True
+                self.position = match.end()
+                continue
+
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if self.depth == 0 and char == '{':
+                    self.object_start = self.position
+                self.depth += 1
+            elif char in '}]':
+                if self.depth == 0:
+                    self.array_closed = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.object_start is not None:
+                        object_text = self.buffer[self.object_start:self.position + 1]
+                        self.object_start = None
+                        try:
+                            citations.append(json.loads(object_text))
+                        except ValueError as e:
+                            logger.warning(f"Skipping malformed streamed citation: {e}")
+            self.position += 1
+        return citations
+
+def generate_initial_response(job_id, inspection_type, image_data, on_citation=None):
+    """Run the initial analysis, passing each citation to on_citation(index, citation) as it streams in"""
     print(f"Starting generate_initial_response for {inspection_type}")
     add_event_to_job(job_id, "INITIAL_ANALYSIS_START", "Initializing image analysis with AI...")
     
@@ -297,8 +1291,24 @@ def generate_initial_response(job_id, inspection_type, image_data):
     print(f"Sending request to Gemini model with prompt length: {len(text_prompt)}")
     add_event_to_job(job_id, "INITIAL_ANALYSIS_PROCESSING", "AI is processing visual elements and identifying potential violations...")
     
+    citations = []
+    
+    def citation_identified(citation):
+        index = len(citations)
+        citations.append(citation)
+        # The event carries every citation identified so far
+        add_event_to_job(
+            job_id,
+            "INITIAL_CITATIONS_IDENTIFIED", 
+            "Initial potential violations identified.",
+            {"citations": list(citations), "citation_index": index}
+        )
+        if on_citation:
+            on_citation(index, citation)
+    
     # Generate content with streaming
     response_text = ""
+    parser = CitationStreamParser()
     for chunk in gemini_2_5_client.models.generate_content_stream(
         model=GEMINI_2_5_MODEL_NAME,
         contents=contents,
@@ -317,9 +1327,15 @@ If an object is present multiple times, name them according to their unique char
     ):
         if chunk.text:
             response_text += chunk.text
+            for citation in parser.feed(chunk.text):
+                citation_identified(citation)
     
     print(f"Received response from Gemini model with length: {len(response_text)}")
+    if citations:
+        print(f"Streamed {len(citations)} citations")
+        return {"citations": citations}
 
+    # Nothing streamed; parse the whole response as before
     try:
         response_text = response_text.strip()
         start = response_text.find('{')
@@ -329,15 +1345,17 @@ If an object is present multiple times, name them according to their unique char
             parsed_response = json.loads(json_str)
             print(f"Parsed JSON response with {len(parsed_response['citations'])} citations")
             
-            # Add event for initial citations identified
-            add_event_to_job(
-                job_id,
-                "INITIAL_CITATIONS_IDENTIFIED", 
-                "Initial potential violations identified.",
-                {"citations": parsed_response.get('citations', [])}
-            )
+            for citation in parsed_response.get('citations', []):
+                citation_identified(citation)
+            if not citations:
+                add_event_to_job(
+                    job_id,
+                    "INITIAL_CITATIONS_IDENTIFIED", 
+                    "Initial potential violations identified.",
+                    {"citations": []}
+                )
             
-            return parsed_response
+            return {"citations": citations}
         else:
             raise ValueError("No valid JSON object found in the response")
     except Exception as e:
@@ -345,139 +1363,262 @@ If an object is present multiple times, name them according to their unique char
         return {"error": "Failed to parse response"}
 
 def strip_image_from_citations(citations):
-    return [{k: v for k, v in citation.items() if k != 'image'} for citation in citations]
+    return [{k: v for k, v in citation.items() if k not in ('image', 'thumbnail', 'image_key')} for citation in citations]
 
-def verify_and_complete_response(job_id, initial_response, img):
-    citations_count = len(initial_response.get('citations', []))
-    print(f"Starting verify_and_complete_response with {citations_count} citations")
+def find_citation_group(groups, citation):
+    """Return the group whose verification also answers citation, or None.
+
+    Citations share a verification when they cite the same section and
+    paragraph with similar reasons, or have near-identical reasons.
+    """
+    section = normalize_section_reference(citation.get('section'))
+    terms = set(tokenize_terms(citation.get('reason', '')))
+    for group in groups:
+        union = terms | group['terms']
+        similarity = len(terms & group['terms']) / len(union) if union else 1.0
+        if similarity >= CITATION_GROUP_REASON_SIMILARITY:
+            return group
+        if section is not None and section == group['section'] and similarity >= CITATION_GROUP_SECTION_SIMILARITY:
+            return group
+    return None
+
+def verify_citation_section(job_id, index, citation, total_citations, context_cache=None):
+    """Check a citation's section against Title 21 with the model.
+
+    total_citations is None while the initial analysis is still streaming.
+    context_cache is a future for the job's get_context_cache result;
+    citations of parts it covers are verified against it instead of
+    retrieved sections.
+    Returns the verified section, text and reason, or None if verification failed.
+    """
+    print(f"Processing citation {index + 1}")
     
     add_event_to_job(
         job_id,
-        "VERIFICATION_PROCESS_START",
-        "Starting verification and cross-referencing of identified violations with FDA regulations.",
-        {"citation_count": citations_count}
+        "CITATION_VERIFICATION_START",
+        f"Verifying violation {index + 1} of {total_citations}..." if total_citations else f"Verifying violation {index + 1}...",
+        {"citation_index": index, "total_citations": total_citations}
     )
     
-    verified_citations = []
-    total_citations = len(initial_response.get('citations', []))
-    for index, citation in enumerate(initial_response.get('citations', [])):
-        print(f"Processing citation {index + 1}")
-        
-        add_event_to_job(
-            job_id,
-            "CITATION_VERIFICATION_START",
-            f"Verifying violation {index + 1} of {total_citations}...",
-            {"citation_index": index, "total_citations": total_citations}
+    context_cache = context_cache.result() if context_cache is not None else None
+    normalized = normalize_section_reference(citation.get('section'))
+    if context_cache and normalized and normalized[0].split('.')[0] in context_cache['parts']:
+        return verify_citation_with_context_cache(job_id, index, citation, context_cache)
+    
+    add_event_to_job(
+        job_id,
+        "CITATION_CODE_LOOKUP",
+        f"Retrieving relevant FDA regulations for violation {index + 1}...",
+        {"citation_index": index}
+    )
+    
+    # Resolve the cited section directly and only search for alternatives
+    cited_section = lookup_section_text(citation.get('section'))
+    relevant_codes = get_relevant_codes(citation['reason'], DATA_STORE_ID, cited_section)
+    print(f"Retrieved relevant codes with length: {len(relevant_codes)} (cited section resolved: {bool(cited_section)})")
+    
+    print(f"Generating verification prompt for citation {index + 1}")
+    add_event_to_job(
+        job_id,
+        "CITATION_AI_VERIFICATION",
+        f"Cross-referencing violation {index + 1} with AI and FDA data...",
+        {"citation_index": index}
+    )
+    
+    verification_prompt = f"""Given the following citation and other relevant codes retrieved from the FDA Title 21 regulations, 
+    decide which is better and more relevant for the given citation "reason": the original cited section OR another section from the retrieved relevant codes. Use chain of thought. If there is a better section code from the retrieved relevant codes, replace the original cited "section" and "text" fields with the better option from the retrieved relevant codes.
+
+    Original Citation:
+    {json.dumps(citation, indent=2)}
+
+    Relevant Codes:
+    {relevant_codes}
+
+    Provide your response as a JSON object with the following structure:
+    {{
+        "section": "Verified or corrected Title 21 section number",
+        "text": "Verified or corrected text from the cited section",
+        "reason": "Original reason for the citation"
+    }}
+
+    Give the "section" field as a Title 21 section number with any paragraph designations, e.g. 110.80(b)(1)."""
+    print(f"Verification prompt length: {len(verification_prompt)}")
+
+    # Generate verification with streaming
+    response_text = ""
+    for chunk in gemini_2_5_client.models.generate_content_stream(
+        model=GEMINI_2_5_MODEL_NAME,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=verification_prompt)])],
+        config=types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            max_output_tokens=8192,
+            safety_settings=COMMON_SAFETY_SETTINGS,
+            tools=GROUNDING_TOOL,
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=128,
+            )
         )
-        
-        add_event_to_job(
-            job_id,
-            "CITATION_CODE_LOOKUP",
-            f"Retrieving relevant FDA regulations for violation {index + 1}...",
-            {"citation_index": index}
+    ):
+        if chunk.text:
+            response_text += chunk.text
+    
+    print(f"Received verification response for citation {index + 1}")
+    return parse_verification_response(index, response_text)
+
+def verify_citation_with_context_cache(job_id, index, citation, context_cache):
+    """Verify a citation against the full text of its parts held in the model's cached context"""
+    add_event_to_job(
+        job_id,
+        "CITATION_AI_VERIFICATION",
+        f"Cross-referencing violation {index + 1} with AI and FDA data...",
+        {"citation_index": index, "context_cache": context_cache['profile']}
+    )
+    
+    verification_prompt = f"""Using the Title 21 parts provided in your context, decide which section is the best and most relevant for the given citation "reason": the original cited section OR another section from those parts. Use chain of thought. If there is a better section, replace the original cited "section" and "text" fields with it, quoting the text from your context.
+
+    Original Citation:
+    {json.dumps(citation, indent=2)}
+
+    Provide your response as a JSON object with the following structure:
+    {{
+        "section": "Verified or corrected Title 21 section number",
+        "text": "Verified or corrected text from the cited section",
+        "reason": "Original reason for the citation"
+    }}
+
+    Give the "section" field as a Title 21 section number with any paragraph designations, e.g. 110.80(b)(1)."""
+    print(f"Verifying citation {index + 1} against cached context {context_cache['name']}")
+
+    # Cached content carries the system instruction, so no tools or system instruction here
+    response_text = ""
+    for chunk in gemini_2_5_client.models.generate_content_stream(
+        model=GEMINI_2_5_MODEL_NAME,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=verification_prompt)])],
+        config=types.GenerateContentConfig(
+            cached_content=context_cache['name'],
+            temperature=1,
+            top_p=0.95,
+            max_output_tokens=8192,
+            safety_settings=COMMON_SAFETY_SETTINGS,
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=128,
+            )
+        )
+    ):
+        if chunk.text:
+            response_text += chunk.text
+    
+    print(f"Received cached-context verification response for citation {index + 1}")
+    return parse_verification_response(index, response_text)
+
+def parse_verification_response(index, response_text):
+    try:
+        response_text = response_text.strip()
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        if start != -1 and end != -1:
+            json_str = response_text[start:end]
+            logger.info(f"Raw verification JSON string for citation {index + 1}: {json_str}")
+            verification = json.loads(json_str)
+            print(f"Parsed verification response for citation {index + 1}")
+            return verification or None
+        else:
+            logger.error("No valid JSON found in verification response")
+    except Exception as e:
+        logger.error(f"Error processing verification response: {str(e)}")
+    return None
+
+def verify_citation(verification, job_id, index, citation, image_context, image_base_url, own_reason=False):
+    """Apply a section verification to one citation, render its image and publish it.
+
+    own_reason keeps the citation's reason when the verification was done for
+    another citation in its group. Returns the verified citation, or None.
+    """
+    if not verification:
+        return None
+    try:
+        verified_citation = dict(verification)
+        if own_reason:
+            verified_citation['reason'] = citation.get('reason', verified_citation.get('reason'))
+        # Citation URLs are computed locally from the part hierarchy
+        verified_citation['url'] = (
+            build_ecfr_url(verified_citation.get('section'))
+            or build_ecfr_url(citation.get('section'))
+            or ECFR_BASE_URL
         )
+        # Log citation data before plotting bounding box
+        logger.info(f"Data for citation {index + 1} (from initial_response) being used for bounding box: {citation}")
         
-        relevant_codes = get_relevant_codes(citation['reason'], DATA_STORE_ID)
-        print(f"Retrieved relevant codes with length: {len(relevant_codes)}")
+        # Render the box onto the job's decoded base image; events only carry the URLs
+        image_key = put_citation_image(image_context.render_citation(citation, verified_citation['section']))
+        thumbnail_key = put_citation_image(image_context.crop_thumbnail(citation))
+        verified_citation['image'] = citation_image_url(image_base_url, image_key)
+        verified_citation['thumbnail'] = citation_image_url(image_base_url, thumbnail_key)
+        verified_citation['image_key'] = image_key
+        verified_citation['box_2d'] = citation['box_2d']
         
-        print(f"Generating verification prompt for citation {index + 1}")
+        # Add event for processed citation; its checkpoint is committed in the same batch,
+        # so a resumed job never skips a citation whose event was lost
         add_event_to_job(
             job_id,
-            "CITATION_AI_VERIFICATION",
-            f"Cross-referencing violation {index + 1} with AI and FDA data...",
-            {"citation_index": index}
+            "SINGLE_CITATION_PROCESSED",
+            f"Violation {index + 1} processed and image generated.",
+            {
+                "citation_index": index,
+                "processed_citation": verified_citation
+            },
+            job_fields={checkpoint_field('citations', str(index)): verified_citation}
         )
-        
-        verification_prompt = f"""Given the following citation and other relevant codes retrieved from the FDA Title 21 regulations, 
-        decide which is better and more relevant for the given citation "reason": the original cited section OR another section from the retrieved relevant codes. Use chain of thought. If there is a better section code from the retrieved relevant codes, replace the original cited "section" and "text" fields with the better option from the retrieved relevant codes. 
-        Then, generate a valid URL for the (corrected) section.
-
-        Original Citation:
-        {json.dumps(citation, indent=2)}
-
-        Relevant Codes:
-        {relevant_codes}
+    except Exception as e:
+        logger.error(f"Error processing verified citation {index + 1}: {str(e)}")
+        return None
 
-        Provide your response as a JSON object with the following structure:
-        {{
-            "section": "Verified or corrected Title 21 section number",
-            "text": "Verified or corrected text from the cited section",
-            "reason": "Original reason for the citation",
-            "url": "Generated URL of the Title 21 eCFR regulation"
-        }}
+    try:
+        event_writer.flush(job_id)
+    except Exception as e:
+        # Still buffered; the background flush retries it and the citation stands
+        logger.error(f"Error checkpointing citation {index + 1} of job {job_id}: {str(e)}")
+    return verified_citation
 
-        For the 'url' field, generate a valid URL to the specific section of the Title 21 eCFR regulation. 
-        The URL should follow this format: 
-        https://www.ecfr.gov/current/title-21/chapter-[CHAPTER]/subchapter-[SUB CHAPTER]/part-[PART]#p-[PART].[SECTION]
+def chain_future(source, fn, *args, **kwargs):
+    """Return a future for fn(source.result(), *args, **kwargs).
 
-        For example, if citing section 110.80(b)(1), the URL should be:
-        https://www.ecfr.gov/current/title-21/chapter-I/subchapter-B/part-110#p-110.80(b)(1)
+    fn runs in whichever thread completes source, so no worker is held while waiting.
+    """
+    result = Future()
+    def run(done):
+        try:
+            result.set_result(fn(done.result(), *args, **kwargs))
+        except BaseException as e:
+            result.set_exception(e)
+    source.add_done_callback(run)
+    return result
 
-        Note: The '#p-' prefix is required before the section number in the URL.
-        
-        Ensure that the generated URL is correct and points to the specific section cited."""
-        print(f"Verification prompt length: {len(verification_prompt)}")
-
-        # Generate verification with streaming
-        response_text = ""
-        for chunk in gemini_2_5_client.models.generate_content_stream(
-            model=GEMINI_2_5_MODEL_NAME,
-            contents=[types.Content(role="user", parts=[types.Part.from_text(text=verification_prompt)])],
-            config=types.GenerateContentConfig(
-                temperature=1,
-                top_p=0.95,
-                max_output_tokens=8192,
-                safety_settings=COMMON_SAFETY_SETTINGS,
-                tools=GROUNDING_TOOL,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=128,
-                )
-            )
-        ):
-            if chunk.text:
-                response_text += chunk.text
-        
-        print(f"Received verification response for citation {index + 1}")
+def verify_and_complete_response(job_id, initial_response, verifications, checkpoint=None):
+    """Collect verified citations in citation order, then summarize.
 
-        try:
-            response_text = response_text.strip()
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            if start != -1 and end != -1:
-                json_str = response_text[start:end]
-                logger.info(f"Raw verification JSON string for citation {index + 1}: {json_str}")
-                verified_citation = json.loads(json_str)
-                print(f"Parsed verification response for citation {index + 1}")
-                if verified_citation:
-                    # Convert image to PIL Image for bounding box
-                    img_bytes = io.BytesIO(base64.b64decode(img))
-                    pil_img = Image.open(img_bytes)
-                    # Convert to RGB mode if needed
-                    if pil_img.mode in ('RGBA', 'LA', 'P'):
-                        pil_img = pil_img.convert('RGB')
-                    
-                    # Log citation data before plotting bounding box
-                    logger.info(f"Data for citation {index + 1} (from initial_response) being used for bounding box: {citation}")
-                    
-                    # Plot bounding box and get base64 image
-                    image_base64 = plot_bounding_box(pil_img.copy(), citation, verified_citation['section'], index)
-                    verified_citation['image'] = f"data:image/jpeg;base64,{image_base64}"
-                    verified_citations.append(verified_citation)
-                    
-                    # Add event for processed citation
-                    add_event_to_job(
-                        job_id,
-                        "SINGLE_CITATION_PROCESSED",
-                        f"Violation {index + 1} processed and image generated.",
-                        {
-                            "citation_index": index,
-                            "processed_citation": verified_citation
-                        }
-                    )
-            else:
-                logger.error("No valid JSON found in verification response")
-        except Exception as e:
-            logger.error(f"Error processing verification response: {str(e)}")
+    verifications maps each citation index to its future on the job's
+    verification pool, or to the verified citation from a checkpoint.
+    """
+    checkpoint = checkpoint or {}
+    citations_count = len(initial_response.get('citations', []))
+    print(f"Starting verify_and_complete_response with {citations_count} citations")
+    
+    if not checkpoint.get('citations'):
+        add_event_to_job(
+            job_id,
+            "VERIFICATION_PROCESS_START",
+            "Starting verification and cross-referencing of identified violations with FDA regulations.",
+            {"citation_count": citations_count}
+        )
+    
+    verified_citations = []
+    for index in range(citations_count):
+        verification = verifications.get(index)
+        verified_citation = verification.result() if isinstance(verification, Future) else verification
+        if verified_citation:
+            verified_citations.append(verified_citation)
 
     # Generate summary after citations are verified
     if verified_citations:
@@ -486,53 +1627,12 @@ def verify_and_complete_response(job_id, initial_response, img):
         print(citations_json_with_images)
         print(f"Total length of verified_citations JSON (with images): {len(citations_json_with_images)}")
 
-        # Strip images for summary generation
-        citations_without_images = strip_image_from_citations(verified_citations)
-        print("Verified citations content (without images):")
-        citations_json_without_images = json.dumps(citations_without_images, indent=2)
-        print(citations_json_without_images)
-        print(f"Total length of verified_citations JSON (without images): {len(citations_json_without_images)}")
-
-        print("Generating summary")
-        add_event_to_job(
-            job_id,
-            "SUMMARY_GENERATION_START",
-            "All violations processed. Generating final inspection summary..."
-        )
-        
-        summary_prompt = f"""Generate a brief summary of the following FDA citations in 2-3 sentences. Focus on the key issues identified and their potential impact on food safety or compliance.
-
-        Citations:
-        {citations_json_without_images}
-
-        Provide your response as a simple string without any JSON formatting or additional markup."""
-
-        # Generate summary with streaming
-        summary_text = ""
-        for chunk in gemini_2_5_client.models.generate_content_stream(
-            model=GEMINI_2_5_MODEL_NAME,
-            contents=[types.Content(role="user", parts=[types.Part.from_text(text=summary_prompt)])],
-            config=types.GenerateContentConfig(
-                temperature=1,
-                top_p=0.95,
-                max_output_tokens=8192,
-                safety_settings=COMMON_SAFETY_SETTINGS,
-                tools=GROUNDING_TOOL,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=128,
-                )
-            )
-        ):
-            if chunk.text:
-                summary_text += chunk.text
-        print(f"Generated summary with length: {len(summary_text)}")
-        
-        add_event_to_job(
-            job_id,
-            "SUMMARY_GENERATED",
-            "Inspection summary generated.",
-            {"summary": summary_text.strip()}
-        )
+        summary_text = checkpoint.get('summary')
+        if summary_text is None:
+            summary_text = generate_summary(job_id, verified_citations)
+            save_checkpoint(job_id, {checkpoint_field('summary'): summary_text})
+        else:
+            print("Using checkpointed summary")
         
         add_event_to_job(
             job_id,
@@ -542,7 +1642,7 @@ def verify_and_complete_response(job_id, initial_response, img):
         
         final_response = {
             "citations": verified_citations,
-            "summary": summary_text.strip()
+            "summary": summary_text
         }
         
         add_event_to_job(
@@ -556,83 +1656,652 @@ def verify_and_complete_response(job_id, initial_response, img):
     
     return {"citations": verified_citations, "summary": ""}
 
-def process_image_async(job_id, image_data, inspection_type):
-    """Process the image asynchronously and update Firestore"""
+def generate_summary(job_id, verified_citations):
+    # Strip images for summary generation
+    citations_without_images = strip_image_from_citations(verified_citations)
+    print("Verified citations content (without images):")
+    citations_json_without_images = json.dumps(citations_without_images, indent=2)
+    print(citations_json_without_images)
+    print(f"Total length of verified_citations JSON (without images): {len(citations_json_without_images)}")
+
+    print("Generating summary")
+    add_event_to_job(
+        job_id,
+        "SUMMARY_GENERATION_START",
+        "All violations processed. Generating final inspection summary..."
+    )
+    
+    summary_prompt = f"""Generate a brief summary of the following FDA citations in 2-3 sentences. Focus on the key issues identified and their potential impact on food safety or compliance.
+
+    Citations:
+    {citations_json_without_images}
+
+    Provide your response as a simple string without any JSON formatting or additional markup."""
+
+    # Generate summary with streaming
+    summary_text = ""
+    for chunk in gemini_2_5_client.models.generate_content_stream(
+        model=GEMINI_2_5_MODEL_NAME,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=summary_prompt)])],
+        config=types.GenerateContentConfig(
+            temperature=1,
+            top_p=0.95,
+            max_output_tokens=8192,
+            safety_settings=COMMON_SAFETY_SETTINGS,
+            tools=GROUNDING_TOOL,
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=128,
+            )
+        )
+    ):
+        if chunk.text:
+            summary_text += chunk.text
+    print(f"Generated summary with length: {len(summary_text)}")
+    
+    add_event_to_job(
+        job_id,
+        "SUMMARY_GENERATED",
+        "Inspection summary generated.",
+        {"summary": summary_text.strip()}
+    )
+    return summary_text.strip()
+
+def process_image_async(job_id, image_data, inspection_type, image_base_url, checkpoint=None, result_cache=None,
+                        upload_key=None):
+    """Process the image asynchronously and update Firestore.
+
+    checkpoint holds stage outputs saved by an earlier attempt at this job;
+    stages already in it are not recomputed. result_cache is the job's
+    result_cache_descriptor; the finished event sequence is stored under it.
+    upload_key names the kept upload, deleted once the job finishes.
+    """
+    checkpoint = checkpoint or {}
+    verification_pool = ThreadPoolExecutor(max_workers=VERIFICATION_WORKERS, thread_name_prefix='citation-verifier')
     try:
-        # Generate initial response
-        initial_response = generate_initial_response(job_id, inspection_type, image_data)
+        # Decode the upload once for every citation in this job
+        image_context = InspectionImage(image_data)
+        initial_response = checkpoint.get('initial_response')
+        verified_checkpoints = checkpoint.get('citations', {})
+        if initial_response is None and verified_checkpoints:
+            # Citation indexes refer to an initial response that was never saved
+            save_checkpoint(job_id, {checkpoint_field('citations'): firestore.DELETE_FIELD})
+            checkpoint = {key: value for key, value in checkpoint.items() if key != 'citations'}
+            verified_checkpoints = {}
         
-        if 'error' in initial_response:
-            update_job_result(job_id, {"error": initial_response['error']}, status='error')
-            return
+        # Resolved once per job alongside the initial analysis
+        context_cache = verification_pool.submit(get_context_cache, inspection_type)
+        verifications = {}
+        citation_groups = []
+        def queue_verification(index, citation, total_citations=None):
+            # Citations verified before a restart were already streamed to clients
+            if str(index) in verified_checkpoints:
+                print(f"Skipping checkpointed citation {index + 1}")
+                verifications[index] = verified_checkpoints[str(index)]
+                return
+            
+            # Overlapping citations reuse one model verification and keep their own boxes
+            group = find_citation_group(citation_groups, citation)
+            if group is None:
+                group = {
+                    'index': index,
+                    'section': normalize_section_reference(citation.get('section')),
+                    'terms': set(tokenize_terms(citation.get('reason', ''))),
+                    'verification': verification_pool.submit(
+                        verify_citation_section, job_id, index, citation, total_citations, context_cache
+                    )
+                }
+                citation_groups.append(group)
+            else:
+                print(f"Citation {index + 1} shares verification with citation {group['index'] + 1}")
+                add_event_to_job(
+                    job_id,
+                    "CITATION_DEDUPLICATED",
+                    f"Violation {index + 1} overlaps violation {group['index'] + 1} and shares its verification.",
+                    {"citation_index": index, "verified_with": group['index']}
+                )
+            verifications[index] = chain_future(
+                group['verification'], verify_citation, job_id, index, citation, image_context, image_base_url,
+                own_reason=group['index'] != index
+            )
+        
+        # Generate initial response, verifying citations as they stream in
+        if initial_response is None:
+            initial_response = generate_initial_response(job_id, inspection_type, image_data, queue_verification)
+            
+            if 'error' in initial_response:
+                verification_pool.shutdown(cancel_futures=True)
+                update_job_result(job_id, {"error": initial_response['error']}, status='error')
+                return
+            save_checkpoint(job_id, {checkpoint_field('initial_response'): initial_response})
+        else:
+            print(f"Using checkpointed initial response for job {job_id}")
+            citations = initial_response.get('citations', [])
+            for index, citation in enumerate(citations):
+                queue_verification(index, citation, len(citations))
         
         # Verify and complete response
-        verified_response = verify_and_complete_response(job_id, initial_response, image_data)
+        verified_response = verify_and_complete_response(job_id, initial_response, verifications, checkpoint)
         
         # Update job with final result
         update_job_result(job_id, verified_response)
         
+        if result_cache:
+            store_cached_result(job_id, result_cache)
+        
     except Exception as e:
         logger.error(f"Error processing job {job_id}: {str(e)}")
+        # Let running verifications finish so no events follow the terminal status
+        verification_pool.shutdown(cancel_futures=True)
         update_job_result(job_id, {"error": str(e)}, status='error')
+    finally:
+        verification_pool.shutdown(wait=False)
+    # Finished either way, so nothing will resume from the upload
+    delete_upload(upload_key)
 
-def generate_status_stream(job_id):
-    """Generate status stream from Firestore updates"""
-    print(f"generate_status_stream called for job_id: {job_id}")
+def resume_job(job_id):
+    """Continue a job claimed by resume_stale_jobs from its last checkpoint"""
+    job_data = get_job_ref(job_id).get().to_dict() or {}
+    checkpoint = job_data.get('checkpoint') or {}
+    
+    image_bytes = get_upload(job_data.get('upload_key'))
+    if image_bytes is None:
+        logger.error(f"Cannot resume job {job_id}: uploaded image is not available")
+        update_job_result(job_id, {"error": "Uploaded image not available"}, status='error')
+        return
+    
+    add_event_to_job(
+        job_id,
+        "JOB_RESUMED",
+        "Resuming the inspection from its last completed stage.",
+        {
+            "completed_stages": [stage for stage in ('initial_response', 'summary') if stage in checkpoint],
+            "verified_citations": len(checkpoint.get('citations', {}))
+        }
+    )
+    process_image_async(
+        job_id,
+        base64.b64encode(image_bytes).decode('utf-8'),
+        job_data.get('inspection_type', ''),
+        job_data.get('image_base_url') or PUBLIC_BASE_URL or '',
+        checkpoint,
+        job_data.get('result_cache'),
+        job_data.get('upload_key')
+    )
+
+# Inspection result cache
+#
+# Finished inspections are stored as their event sequence, keyed by the
+# uploaded image's SHA-256 plus the inspection type, model and corpus
+# version. A repeat submission gets a new job that replays those events.
+# With RESULT_CACHE_PHASH_MATCHING, near-identical re-encodes of an image are
+# also matched by a 64-bit dHash. That is off by default: a different but
+# similar-looking image would replay another image's citations.
+# Cached events carry /image URLs that outlive any one instance, so caching needs the shared bucket
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true' and bool(CITATION_IMAGE_BUCKET)
+RESULT_CACHE_COLLECTION = 'inspection_results'
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+# In-memory entries are evicted least recently used first beyond this many bytes
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Firestore documents are limited to 1 MiB
+RESULT_CACHE_MAX_ENTRY_BYTES = 900 * 1024
+RESULT_CACHE_PHASH_MATCHING = os.environ.get('RESULT_CACHE_PHASH_MATCHING', 'false').lower() == 'true'
+# Maximum differing dHash bits for two uploads to count as the same image
+RESULT_CACHE_PHASH_DISTANCE = int(os.environ.get('RESULT_CACHE_PHASH_DISTANCE', '4'))
+RESULT_CACHE_REPLAY_INTERVAL_SECONDS = float(os.environ.get('RESULT_CACHE_REPLAY_INTERVAL_SECONDS', '0.05'))
+# Job lifecycle events belong to the original job, not its result
+RESULT_CACHE_SKIPPED_EVENTS = {'ANALYSIS_STARTED', 'JOB_STARTED', 'JOB_RESUMED', 'JOB_INTERRUPTED', 'RESULT_CACHE_HIT'}
+
+def perceptual_hash(image_bytes):
+    """64-bit difference hash (dHash) of an image, as 16 hex digits"""
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft('L', (64, 64))
+    pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def hamming_distance(hex_a, hex_b):
+    return bin(int(hex_a, 16) ^ int(hex_b, 16)).count('1')
+
+def result_cache_descriptor(image_bytes, image_key, inspection_type):
+    """Cache key, variant and perceptual hash for an upload"""
+    variant = hashlib.sha256(json.dumps(
+        [inspection_type, GEMINI_2_5_MODEL_NAME, load_section_index().get('corpus_version')]
+    ).encode('utf-8')).hexdigest()[:16]
+    try:
+        phash = perceptual_hash(image_bytes)
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash: {str(e)}")
+        phash = None
+    return {
+        'key': hashlib.sha256(f"{image_key}:{variant}".encode('utf-8')).hexdigest(),
+        'variant': variant,
+        'phash': phash
+    }
+
+class InspectionResultCache:
+    """Cached inspection event sequences.
+
+    A byte-bounded in-memory LRU sits in front of a Firestore collection whose
+    documents carry expires_at for a Firestore TTL policy; expiry is also
+    checked on read.
+    """
+
+    def __init__(self, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, descriptor):
+        """Return the cached entry for descriptor, or None"""
+        entry = self._get_local(descriptor)
+        if entry is None:
+            entry = self._get_remote(descriptor)
+            if entry is not None:
+                self._put_local(descriptor['key'], entry)
+        return entry
+
+    def put(self, descriptor, events, source_job_id):
+        events_json = json.dumps(events)
+        if len(events_json) > RESULT_CACHE_MAX_ENTRY_BYTES:
+            logger.info(f"Result of job {source_job_id} is too large to cache ({len(events_json)} bytes)")
+            return
+        cached_at = datetime.now(timezone.utc)
+        entry = {
+            'variant': descriptor['variant'],
+            'phash': descriptor['phash'],
+            'events_json': events_json,
+            'source_job_id': source_job_id,
+            'cached_at': cached_at,
+            'expires_at': cached_at + timedelta(seconds=self.ttl_seconds)
+        }
+        db.collection(RESULT_CACHE_COLLECTION).document(descriptor['key']).set(entry)
+        self._put_local(descriptor['key'], entry)
+
+    def _get_local(self, descriptor):
+        with self._lock:
+            key = descriptor['key'] if descriptor['key'] in self._entries else None
+            if key is None and RESULT_CACHE_PHASH_MATCHING and descriptor['phash']:
+                key = next((
+                    candidate_key for candidate_key, candidate in self._entries.items()
+                    if candidate['variant'] == descriptor['variant'] and candidate['phash']
+                    and hamming_distance(candidate['phash'], descriptor['phash']) <= RESULT_CACHE_PHASH_DISTANCE
+                ), None)
+            if key is None:
+                return None
+            entry = self._entries[key]
+            if entry['expires_at'] <= datetime.now(timezone.utc):
+                self._remove_local(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _get_remote(self, descriptor):
+        collection = db.collection(RESULT_CACHE_COLLECTION)
+        snapshot = collection.document(descriptor['key']).get()
+        entry = snapshot.to_dict() if snapshot.exists else None
+        if entry is None and RESULT_CACHE_PHASH_MATCHING and descriptor['phash']:
+            # Re-encodes of the same image usually keep an identical dHash
+            matches = (
+                collection
+                .where(filter=FieldFilter('variant', '==', descriptor['variant']))
+                .where(filter=FieldFilter('phash', '==', descriptor['phash']))
+                .limit(1)
+                .stream()
+            )
+            entry = next((match.to_dict() for match in matches), None)
+        if entry is None or entry['expires_at'] <= datetime.now(timezone.utc):
+            return None
+        return entry
+
+    def _put_local(self, key, entry):
+        with self._lock:
+            self._remove_local(key)
+            self._entries[key] = entry
+            self._bytes += len(entry['events_json'])
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove_local(next(iter(self._entries)))
+
+    def _remove_local(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry['events_json'])
+
+inspection_result_cache = InspectionResultCache(RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_BYTES)
+
+def store_cached_result(job_id, descriptor):
+    """Cache the events of a job that completed with verified citations, for replay"""
+    try:
+        events = event_bus.history(job_id)
+        if events is None:
+            # Resumed jobs are not on the local bus
+            events = [
+                event_doc.to_dict()
+                for event_doc in get_job_ref(job_id).collection(EVENTS_SUBCOLLECTION).order_by('seq').stream()
+            ]
+        recorded = [
+            {'type': event['type'], 'content': event['content'], 'data': event['data']}
+            for event in events
+            if event['type'] not in RESULT_CACHE_SKIPPED_EVENTS
+        ]
+        # A stream without a verified result never completes on replay
+        if not any(event['type'] == 'ANALYSIS_COMPLETE' and (event['data'] or {}).get('citations') for event in recorded):
+            logger.info(f"Not caching job {job_id}: it completed without verified citations")
+            return
+        inspection_result_cache.put(descriptor, recorded, job_id)
+        logger.info(f"Cached {len(recorded)} events of job {job_id}")
+    except Exception as e:
+        logger.error(f"Error caching result of job {job_id}: {str(e)}")
+
+def replay_cached_result(job_id, entry):
+    """Emit a cached inspection's events on a new job"""
+    try:
+        add_event_to_job(
+            job_id,
+            "RESULT_CACHE_HIT",
+            "This image was inspected recently; replaying the saved results.",
+            {"source_job_id": entry['source_job_id'], "cached_at": entry['cached_at'].isoformat()}
+        )
+        final_response = {}
+        for event in json.loads(entry['events_json']):
+            time.sleep(RESULT_CACHE_REPLAY_INTERVAL_SECONDS)
+            add_event_to_job(job_id, event['type'], event['content'], event['data'])
+            if event['type'] == 'ANALYSIS_COMPLETE':
+                final_response = event['data']
+        update_job_result(job_id, final_response)
+    except Exception as e:
+        logger.error(f"Error replaying cached result for job {job_id}: {str(e)}")
+        update_job_result(job_id, {"error": str(e)}, status='error')
+
+# Job execution
+#
+# Inspection jobs run on a fixed pool of worker threads behind a bounded queue.
+# When both are full, new jobs are rejected with 429 and Retry-After.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', '8'))
+JOB_RETRY_AFTER_SECONDS = int(os.environ.get('JOB_RETRY_AFTER_SECONDS', '30'))
+# Cloud Run allows 10 seconds between SIGTERM and SIGKILL
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get('SHUTDOWN_GRACE_SECONDS', '8'))
+# Queued jobs send no events, so the executor renews their leases this often
+QUEUED_LEASE_RENEW_SECONDS = float(os.environ.get('QUEUED_LEASE_RENEW_SECONDS', str(JOB_LEASE_SECONDS / 3)))
+
+class JobQueueFull(Exception):
+    """Raised when the job executor cannot accept more work."""
+
+class JobExecutor:
+    """Bounded worker pool for inspection jobs"""
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._queued_jobs = set()
+        self._active_jobs = set()
+        self._accepting = True
+
+    def has_capacity(self):
+        with self._lock:
+            return self._accepting and not self._queue.full()
+
+    def submit(self, job_id, target, *args):
+        """Queue target(job_id, *args); raises JobQueueFull when saturated"""
+        with self._lock:
+            if not self._accepting:
+                raise JobQueueFull("Instance is shutting down")
+            # Threads are started lazily so none exist before the server forks
+            if not self._threads:
+                threading.Thread(target=self._renew_queued_leases, daemon=True).start()
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            try:
+                self._queue.put_nowait((job_id, target, args, time.time()))
+            except queue.Full:
+                raise JobQueueFull("Job queue is full")
+            self._queued_jobs.add(job_id)
+        logger.info(f"Queued job {job_id} ({self._queue.qsize()} waiting, {len(self._active_jobs)} running)")
+
+    def _run(self):
+        while True:
+            job_id, target, args, enqueued_at = self._queue.get()
+            with self._lock:
+                self._queued_jobs.discard(job_id)
+                self._active_jobs.add(job_id)
+            try:
+                queue_wait_ms = int((time.time() - enqueued_at) * 1000)
+                add_event_to_job(
+                    job_id,
+                    "JOB_STARTED",
+                    "Inspection job started.",
+                    {"queue_wait_ms": queue_wait_ms}
+                )
+                target(job_id, *args)
+            except Exception as e:
+                logger.error(f"Unhandled error in job {job_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._active_jobs.discard(job_id)
+                self._queue.task_done()
+
+    def _renew_queued_leases(self):
+        # A queued job outliving its lease would be resumed elsewhere and then run here too
+        while True:
+            time.sleep(QUEUED_LEASE_RENEW_SECONDS)
+            # Under the lock, so a job that has started (and maybe finished) is never renewed
+            with self._lock:
+                for job_id in self._queued_jobs:
+                    event_writer.update(job_id, {'lease_expires_at': lease_expiry()})
+
+    def shutdown(self, timeout):
+        """Stop accepting jobs and wait up to timeout seconds for queued and running jobs"""
+        with self._lock:
+            self._accepting = False
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if self._queue.unfinished_tasks == 0:
+                    logger.info("Job executor drained")
+                    return
+            time.sleep(0.1)
+
+        # Anything left will be killed with the instance; hand it to another worker
+        with self._lock:
+            unfinished = set(self._active_jobs)
+        while True:
+            try:
+                job_id, _, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._queued_jobs.discard(job_id)
+            unfinished.add(job_id)
+        for job_id in unfinished:
+            logger.warning(f"Job {job_id} did not finish before shutdown; releasing its lease")
+            try:
+                add_event_to_job(job_id, "JOB_INTERRUPTED", "The inspection was interrupted by a server shutdown and will resume shortly.")
+                event_writer.release(job_id)
+                event_writer.flush(job_id)
+            except Exception as e:
+                logger.error(f"Error releasing job {job_id}: {str(e)}")
+
+job_executor = JobExecutor(JOB_WORKERS, JOB_QUEUE_DEPTH)
+
+@firestore.transactional
+def claim_stale_job(transaction, job_ref):
+    """Take over a job whose lease has lapsed; returns False if someone else has it"""
+    snapshot = job_ref.get(transaction=transaction)
+    job_data = snapshot.to_dict() or {}
+    lease_expires_at = job_data.get('lease_expires_at')
+    if job_data.get('status') not in ACTIVE_JOB_STATUSES:
+        return False
+    if lease_expires_at and lease_expires_at > datetime.now(timezone.utc):
+        return False
+    transaction.update(job_ref, {'lease_owner': INSTANCE_ID, 'lease_expires_at': lease_expiry()})
+    return True
+
+def resume_stale_jobs(limit=10):
+    """Claim jobs whose worker stopped renewing its lease and queue them here"""
+    resumed = []
+    stale_jobs = (
+        db.collection(JOBS_COLLECTION)
+        .where(filter=FieldFilter('lease_expires_at', '<', datetime.now(timezone.utc)))
+        .limit(limit)
+        .stream()
+    )
+    for job_doc in stale_jobs:
+        if not job_executor.has_capacity():
+            break
+        if not claim_stale_job(db.transaction(), job_doc.reference):
+            continue
+        try:
+            job_executor.submit(job_doc.id, resume_job)
+        except JobQueueFull:
+            break
+        logger.info(f"Resuming stale job {job_doc.id}")
+        resumed.append(job_doc.id)
+    return resumed
+
+_resume_sweeper_started = False
+_resume_sweeper_lock = threading.Lock()
+
+def ensure_resume_sweeper():
+    """Start the periodic stale-job sweep on first use"""
+    global _resume_sweeper_started
+    with _resume_sweeper_lock:
+        if _resume_sweeper_started:
+            return
+        _resume_sweeper_started = True
+
+    def sweep():
+        while True:
+            try:
+                resume_stale_jobs()
+            except Exception as e:
+                logger.error(f"Error resuming stale jobs: {str(e)}")
+            time.sleep(RESUME_SWEEP_INTERVAL_SECONDS)
+
+    threading.Thread(target=sweep, daemon=True).start()
+
+def handle_sigterm(signum, frame):
+    logger.info("SIGTERM received; draining inspection jobs")
+    job_executor.shutdown(SHUTDOWN_GRACE_SECONDS)
+    event_writer.stop(EVENT_FLUSH_INTERVAL_SECONDS)
+    if callable(_previous_sigterm_handler):
+        _previous_sigterm_handler(signum, frame)
+
+try:
+    # Chain to the web server's own handler so it still shuts down normally
+    _previous_sigterm_handler = signal.signal(signal.SIGTERM, handle_sigterm)
+except ValueError:
+    # Not in the main thread; rely on the server's shutdown behaviour
+    _previous_sigterm_handler = None
+
+def serialize_event(event):
+    """Prepare a stored event for the SSE stream"""
+    event = dict(event)
+    # Convert Firestore timestamp to ISO string if present
+    if 'timestamp' in event:
+        timestamp = event['timestamp']
+        # Handle both DatetimeWithNanoseconds and regular datetime objects
+        if hasattr(timestamp, 'isoformat'):
+            event['timestamp'] = timestamp.isoformat()
+        elif hasattr(timestamp, 'seconds'):
+            # Handle protobuf timestamp format
+            event['timestamp'] = datetime.fromtimestamp(timestamp.seconds).isoformat()
+    return event
+
+def format_sse_event(event):
+    """Format a job event as an SSE message; the id lets clients resume via Last-Event-ID"""
+    return f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+
+def generate_status_stream(job_id, last_event_id=0):
+    """Generate status stream from the local event bus or Firestore snapshot listeners"""
+    print(f"generate_status_stream called for job_id: {job_id} (after event {last_event_id})")
     
     # Get the job document reference
-    job_ref = db.collection('inspection_jobs').document(job_id)
+    job_ref = get_job_ref(job_id)
+    events_ref = job_ref.collection(EVENTS_SUBCOLLECTION)
     
-    # Track which events we've already sent
-    sent_event_count = 0
-    last_status = None
+    # Listener callbacks hand off to the SSE generator through this queue
+    updates = queue.Queue()
     
-    while True:
-        try:
-            # Get the current job document
-            job_doc = job_ref.get()
-            
-            if not job_doc.exists:
-                yield f"data: {json.dumps({'type': 'error', 'content': 'Job not found'})}\n\n"
-                break
-            
-            job_data = job_doc.to_dict()
-            current_status = job_data.get('status')
-            
-            # Send any new events
-            events = job_data.get('events', [])
-            while sent_event_count < len(events):
-                event = events[sent_event_count].copy()  # Make a copy to avoid modifying the original
-                # Convert Firestore timestamp to ISO string if present
-                if 'timestamp' in event:
-                    timestamp = event['timestamp']
-                    # Handle both DatetimeWithNanoseconds and regular datetime objects
-                    if hasattr(timestamp, 'isoformat'):
-                        event['timestamp'] = timestamp.isoformat()
-                    elif hasattr(timestamp, 'seconds'):
-                        # Handle protobuf timestamp format
-                        event['timestamp'] = datetime.fromtimestamp(timestamp.seconds).isoformat()
-                print(f"Streaming event: {event}")
-                yield f"data: {json.dumps(event)}\n\n"
-                sent_event_count += 1
-            
-            # Check if job is completed or errored
-            if current_status in ['completed', 'error']:
-                # Job is done, close the stream
+    # Jobs running on this instance are served from the in-process event bus
+    job_data = event_bus.subscribe(job_id, last_event_id, updates)
+    if job_data is not None:
+        print(f"Streaming job {job_id} from the local event bus")
+        unsubscribe = lambda: event_bus.unsubscribe(job_id, updates)
+    else:
+        job_doc = job_ref.get()
+        if not job_doc.exists:
+            yield f"data: {json.dumps({'type': 'error', 'content': 'Job not found'})}\n\n"
+            return
+        job_data = job_doc.to_dict()
+        
+        # Firestore listener callbacks run on the watch thread
+        def on_events_snapshot(snapshots, changes, read_time):
+            for change in changes:
+                if change.type.name == 'ADDED':
+                    updates.put(('event', change.document.to_dict()))
+        
+        def on_job_snapshot(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                updates.put(('job', snapshot.to_dict() or {}))
+        
+        events_watch = (
+            events_ref
+            .where(filter=FieldFilter('seq', '>', last_event_id))
+            .order_by('seq')
+            .on_snapshot(on_events_snapshot)
+        )
+        job_watch = job_ref.on_snapshot(on_job_snapshot)
+        
+        def unsubscribe():
+            events_watch.unsubscribe()
+            job_watch.unsubscribe()
+    
+    last_sent_seq = last_event_id
+    pending_events = {}
+    heartbeat_interval = HEARTBEAT_MIN_INTERVAL_SECONDS
+    
+    try:
+        while True:
+            # Job is done once it is terminal and every event up to its last one has been sent
+            if job_data.get('status') in ['completed', 'error'] and last_sent_seq >= job_data.get('last_event_seq', 0):
                 break
             
-            last_status = current_status
-            
-            # Send heartbeat
-            yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+            try:
+                kind, payload = updates.get(timeout=heartbeat_interval)
+            except queue.Empty:
+                # Back off heartbeats while the job is idle
+                yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                heartbeat_interval = min(heartbeat_interval * 2, HEARTBEAT_MAX_INTERVAL_SECONDS)
+                continue
             
-            # Wait a bit before checking again
-            time.sleep(0.5)
+            heartbeat_interval = HEARTBEAT_MIN_INTERVAL_SECONDS
+            if kind == 'job':
+                job_data = payload
+                continue
             
-        except Exception as e:
-            logger.error(f"Error in status stream: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-            break
+            # Emit strictly in sequence order
+            pending_events[payload['seq']] = payload
+            while last_sent_seq + 1 in pending_events:
+                event = serialize_event(pending_events.pop(last_sent_seq + 1))
+                print(f"Streaming event {event['seq']}: {event['type']}")
+                yield format_sse_event(event)
+                last_sent_seq = event['seq']
+    
+    except Exception as e:
+        logger.error(f"Error in status stream: {str(e)}")
+        yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+    
+    finally:
+        unsubscribe()
 
 @functions_framework.http
 def process_inspection(request):
@@ -644,7 +2313,8 @@ def process_inspection(request):
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Headers': 'Content-Type, Last-Event-ID, If-None-Match',
+        'Access-Control-Expose-Headers': 'Retry-After, ETag',
         'Access-Control-Max-Age': '3600'
     }
 
@@ -652,6 +2322,13 @@ def process_inspection(request):
         print("Handling OPTIONS request")
         return ('', 204, headers)
 
+    ensure_resume_sweeper()
+
+    # Resume jobs abandoned by other instances (e.g. from Cloud Scheduler)
+    if request.method == 'POST' and request.path.endswith('/resume'):
+        print("Handling POST /resume request")
+        return jsonify({'resumed': resume_stale_jobs()}), 200, headers
+
     # Handle streaming endpoint
     if request.method == 'GET' and request.path.endswith('/stream'):
         print("Handling GET /stream request")
@@ -666,7 +2343,34 @@ def process_inspection(request):
         headers['Connection'] = 'keep-alive'
         headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
         
-        return flask.Response(generate_status_stream(job_id), 200, headers)
+        # EventSource sends Last-Event-ID when it reconnects
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400, headers
+        
+        return flask.Response(generate_status_stream(job_id, last_event_id), 200, headers)
+
+    # Serve stored citation images
+    if request.method == 'GET' and request.path.endswith('/image'):
+        key = request.args.get('key', '')
+        if not IMAGE_KEY_PATTERN.match(key):
+            return jsonify({'error': 'Image not found'}), 404, headers
+        etag = f'"{key}"'
+        cache_headers = {
+            'ETag': etag,
+            # Keys are content hashes, so an image never changes
+            'Cache-Control': 'public, max-age=31536000, immutable'
+        }
+        if etag in request.headers.get('If-None-Match', ''):
+            return ('', 304, {**headers, **cache_headers})
+        
+        image_bytes = get_citation_image(key)
+        if image_bytes is None:
+            return jsonify({'error': 'Image not found'}), 404, headers
+        
+        return flask.Response(image_bytes, 200, {**headers, **cache_headers, 'Content-Type': 'image/jpeg'})
 
     # Handle regular POST request for image analysis
     if request.method == 'POST':
@@ -692,8 +2396,32 @@ def process_inspection(request):
                 print("Missing required fields")
                 return jsonify({'error': 'Missing required fields'}), 400, headers
 
+            image_bytes = base64.b64decode(image_data)
+            image_base_url = PUBLIC_BASE_URL or request.url_root
+
+            # Repeat submissions replay a cached result unless the client asks for a fresh run
+            result_cache = None
+            cached_result = None
+            if RESULT_CACHE_ENABLED:
+                result_cache = result_cache_descriptor(image_bytes, hashlib.sha256(image_bytes).hexdigest(), inspection_type)
+                if not request_json.get('bypass_cache'):
+                    try:
+                        cached_result = inspection_result_cache.get(result_cache)
+                    except Exception as e:
+                        logger.error(f"Error reading result cache: {str(e)}")
+                print(f"Result cache {'hit' if cached_result else 'miss'}")
+
+            # Reject up front rather than creating a job that cannot run
+            if not job_executor.has_capacity():
+                print("Job executor saturated")
+                headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+                return jsonify({'error': 'Too many inspections in progress. Please retry shortly.'}), 429, headers
+
+            # Keep the upload so another instance can resume the job; replays never need it
+            upload_key = put_upload(image_bytes) if cached_result is None else None
+
             # Create a new job
-            job_id = create_job(inspection_type)
+            job_id = create_job(inspection_type, upload_key, image_base_url, result_cache)
             print(f"Created job with ID: {job_id}")
             
             # Add initial event
@@ -703,16 +2431,28 @@ def process_inspection(request):
                 "Image inspection process initiated.",
                 {"inspection_type": inspection_type}
             )
+            # The job document and its first event are committed in one batch
+            try:
+                commit_new_job(job_id)
+            except Exception:
+                delete_upload(upload_key)
+                raise
             
-            # Start async processing in a background thread
-            thread = threading.Thread(
-                target=process_image_async,
-                args=(job_id, image_data, inspection_type)
-            )
-            thread.daemon = True
-            thread.start()
+            # Queue async processing, or a cached replay, on the bounded worker pool
+            try:
+                if cached_result is not None:
+                    job_executor.submit(job_id, replay_cached_result, cached_result)
+                else:
+                    job_executor.submit(job_id, process_image_async, image_data, inspection_type, image_base_url, None, result_cache, upload_key)
+            except JobQueueFull as e:
+                update_job_result(job_id, {"error": str(e)}, status='error')
+                delete_upload(upload_key)
+                headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+                return jsonify({'error': 'Too many inspections in progress. Please retry shortly.'}), 429, headers
             
             # Return job_id immediately
+            if cached_result is not None:
+                return jsonify({'job_id': job_id, 'cached': True}), 200, headers
             return jsonify({'job_id': job_id}), 200, headers
 
         except Exception as e:
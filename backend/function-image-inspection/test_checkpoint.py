@@ -0,0 +1,80 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checkpoint writes against the real Firestore client library.
+
+The field paths and WriteBatch writes are built by google-cloud-firestore itself.
+"""
+
+import itertools
+from types import SimpleNamespace
+from unittest import mock
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+import main
+
+def test_checkpoint_field_round_trips():
+    assert main.checkpoint_field('summary') == 'checkpoint.summary'
+    assert main.checkpoint_field('citations', '3') == 'checkpoint.citations.`3`'
+    assert FieldPath.from_string(main.checkpoint_field('citations', '3')).parts == ('checkpoint', 'citations', '3')
+
+def test_save_checkpoint_commits_field_paths(committed):
+    main.save_checkpoint('job-1', {
+        main.checkpoint_field('citations', '3'): {'section_id': '117.3'},
+        main.checkpoint_field('summary'): 'summary text',
+    })
+
+    assert len(committed) == 1
+    write = committed[0]
+    assert write.update.name.endswith(f'/{main.JOBS_COLLECTION}/job-1')
+    assert set(write.update_mask.field_paths) == {
+        'checkpoint.citations.`3`', 'checkpoint.summary', 'lease_expires_at'}
+    checkpoint = write.update.fields['checkpoint'].map_value.fields
+    assert checkpoint['citations'].map_value.fields['3'].map_value.fields['section_id'].string_value == '117.3'
+    assert checkpoint['summary'].string_value == 'summary text'
+
+def test_save_checkpoint_deletes_field(committed):
+    main.save_checkpoint('job-2', {main.checkpoint_field('citations'): firestore.DELETE_FIELD})
+
+    assert 'checkpoint.citations' in committed[0].update_mask.field_paths
+
+def verify_one_citation(monkeypatch, job_id):
+    monkeypatch.setitem(main._event_sequences, job_id, itertools.count(1))
+    monkeypatch.setattr(main, 'put_citation_image', lambda jpeg_bytes: 'a' * 64)
+    monkeypatch.setattr(main, 'build_ecfr_url', lambda section: f'https://www.ecfr.gov/{section}')
+    image_context = SimpleNamespace(render_citation=lambda *args: b'image', crop_thumbnail=lambda *args: b'thumbnail')
+    citation = {'section': '117.35', 'reason': 'Debris on the floor', 'box_2d': [100, 100, 200, 200]}
+    return main.verify_citation({'section': '117.35', 'text': 'Sanitary operations'}, job_id, 3, citation,
+                                image_context, 'https://example.test/')
+
+def test_citation_event_and_checkpoint_share_a_batch(batches, monkeypatch):
+    verified = verify_one_citation(monkeypatch, 'job-3')
+
+    assert verified['section'] == '117.35'
+    assert len(batches) == 1
+    event_write, job_write = batches[0]
+    assert event_write.update.fields['type'].string_value == 'SINGLE_CITATION_PROCESSED'
+    assert 'checkpoint.citations.`3`' in job_write.update_mask.field_paths
+
+def test_checkpoint_failure_keeps_verified_citation(monkeypatch):
+    monkeypatch.setattr(main.event_writer, '_commit', mock.Mock(side_effect=RuntimeError('unavailable')))
+
+    verified = verify_one_citation(monkeypatch, 'job-4')
+
+    assert verified is not None and verified['box_2d'] == [100, 100, 200, 200]
+    # Left buffered for the background flush to retry
+    pending = main.event_writer._pending.pop('job-4')
+    assert main.checkpoint_field('citations', '3') in pending['fields']
@@ -0,0 +1,57 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental extraction of citations from streamed analysis text."""
+
+import json
+
+import main
+
+RESPONSE = json.dumps({
+    "summary": "Kitchen {overview}",
+    "citations": [
+        {"section": "117.35", "reason": "Debris \"near\" the drain}", "box_2d": [1, 2, 3, 4]},
+        {"section": "110.20", "reason": "Peeling paint [ceiling]", "box_2d": [5, 6, 7, 8]},
+    ],
+    "trailing": {"section": "ignored"},
+})
+
+def feed_in_chunks(text, size):
+    parser = main.CitationStreamParser()
+    citations = []
+    for start in range(0, len(text), size):
+        citations.extend(parser.feed(text[start:start + size]))
+    return parser, citations
+
+def test_extracts_citations_whole():
+    parser, citations = feed_in_chunks(RESPONSE, len(RESPONSE))
+
+    assert citations == json.loads(RESPONSE)['citations']
+    assert parser.array_closed
+
+def test_extracts_citations_from_any_chunking():
+    expected = json.loads(RESPONSE)['citations']
+    for size in (1, 2, 3, 7, 16):
+        assert feed_in_chunks(RESPONSE, size)[1] == expected
+
+def test_emits_each_citation_when_its_object_closes():
+    parser = main.CitationStreamParser()
+    assert parser.feed('```json\n{"citations": [{"section": "117.35"}, {"sect') == [{"section": "117.35"}]
+    assert parser.feed('ion": "110.20"}') == [{"section": "110.20"}]
+    assert parser.feed(']}\n```') == []
+
+def test_skips_malformed_citation():
+    parser = main.CitationStreamParser()
+
+    assert parser.feed('{"citations": [{"section": 117.35.1}, {"section": "117.80"}]}') == [{"section": "117.80"}]
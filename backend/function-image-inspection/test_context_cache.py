@@ -0,0 +1,83 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Context cache preparation"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import main
+
+SECTION_INDEX = {
+    'corpus_version': 'v1',
+    'sections': {
+        '117.35': {'section_name': 'Sanitary operations.', 'content': 'Plants shall be kept clean.'},
+        '211.42': {'section_name': 'Design and construction features.', 'content': 'Buildings shall be suitable.'},
+    }
+}
+
+@pytest.fixture
+def gemini(monkeypatch):
+    client = mock.Mock()
+    client.caches.list.return_value = []
+    monkeypatch.setattr(main, 'gemini_2_5_client', client)
+    monkeypatch.setattr(main, 'CONTEXT_CACHE_ENABLED', True)
+    monkeypatch.setattr(main, 'load_section_index', lambda: SECTION_INDEX)
+    monkeypatch.setattr(main, '_context_caches', {})
+    monkeypatch.setattr(main, '_context_cache_loads', {})
+    return client
+
+def test_match_context_profile():
+    assert main.match_context_profile('Commercial Bakery') == 'food'
+    assert main.match_context_profile('sterile compounding pharmacy') == 'pharmaceutical'
+    assert main.match_context_profile('machine shop') is None
+
+def test_concurrent_callers_share_one_creation(gemini):
+    release = threading.Event()
+    def create(**kwargs):
+        release.wait(5)
+        return SimpleNamespace(name='cachedContents/food', expire_time=None)
+    gemini.caches.create.side_effect = create
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        food = [pool.submit(main.get_context_cache, 'bakery') for _ in range(3)]
+        # A different profile is not held up by the food cache's network calls
+        other = pool.submit(main.get_context_cache, 'machine shop')
+        assert other.result(timeout=2) is None
+        release.set()
+        contexts = [future.result(timeout=5) for future in food]
+
+    assert gemini.caches.create.call_count == 1
+    assert all(context['name'] == 'cachedContents/food' for context in contexts)
+
+def test_missing_expire_time_uses_retry_expiry(gemini):
+    gemini.caches.create.return_value = SimpleNamespace(name='cachedContents/food', expire_time=None)
+
+    assert main.get_context_cache('bakery')['parts'] == ['110', '117']
+    assert main._context_caches['food']['refresh_at'] > datetime.now(timezone.utc)
+    # The cached entry is reused without comparing against None
+    assert main.get_context_cache('bakery')['name'] == 'cachedContents/food'
+    assert gemini.caches.create.call_count == 1
+
+def test_failed_creation_falls_back_to_retrieval(gemini):
+    gemini.caches.create.side_effect = RuntimeError('quota')
+
+    assert main.get_context_cache('bakery') is None
+    assert main.get_context_cache('bakery') is None
+    assert gemini.caches.create.call_count == 1
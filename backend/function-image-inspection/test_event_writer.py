@@ -0,0 +1,83 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JobEventWriter batching against the real Firestore client library"""
+
+import pytest
+from google.cloud.firestore_v1.batch import WriteBatch
+
+import main
+
+@pytest.fixture
+def writer():
+    writer = main.JobEventWriter(flush_interval=60)
+    yield writer
+    writer.stop(timeout=0)
+
+def buffer_job(writer, job_id, event_count):
+    writer.create(job_id, {'job_id': job_id, 'status': 'created'})
+    for seq in range(1, event_count + 1):
+        writer.append(job_id, {'seq': seq, 'type': 'STATUS', 'content': '', 'data': {}})
+
+def event_seqs(writes):
+    return [int(write.update.name.rsplit('/', 1)[1]) for write in writes if '/events/' in write.update.name]
+
+def test_full_chunk_stays_within_batch_limit(writer, batches):
+    buffer_job(writer, 'job-1', main.MAX_EVENTS_PER_BATCH)
+    writer.flush('job-1')
+
+    assert [len(batch) for batch in batches] == [main.MAX_EVENTS_PER_BATCH + 2]
+    assert len(batches[0]) <= 500
+
+def test_large_flush_commits_every_event_once_in_order(writer, batches):
+    buffer_job(writer, 'job-2', 1200)
+    writer.flush('job-2')
+
+    assert all(len(batch) <= 500 for batch in batches)
+    assert event_seqs(write for batch in batches for write in batch) == list(range(1, 1201))
+    # The job is created in the first batch and updated in the last
+    assert batches[0][0].update.name.endswith('/job-2') and not batches[0][0].update_mask.field_paths
+    assert 'last_event_seq' in batches[-1][-1].update_mask.field_paths
+
+def test_failed_chunk_is_retried_without_dropping_or_resending(writer, batches, monkeypatch):
+    buffer_job(writer, 'job-3', 1200)
+    commits = []
+    def commit_failing_second(batch, *args, **kwargs):
+        commits.append(None)
+        if len(commits) == 2:
+            raise RuntimeError('unavailable')
+        batches.append(list(batch._write_pbs))
+    monkeypatch.setattr(WriteBatch, 'commit', commit_failing_second)
+
+    with pytest.raises(RuntimeError):
+        writer.flush('job-3')
+    assert event_seqs(batches[0]) == list(range(1, main.MAX_EVENTS_PER_BATCH + 1))
+
+    writer.append('job-3', {'seq': 1201, 'type': 'STATUS', 'content': '', 'data': {}})
+    writer.flush('job-3')
+
+    writes = [write for batch in batches for write in batch]
+    assert event_seqs(writes) == list(range(1, 1202))
+    # The create is not repeated once committed
+    assert sum(1 for write in writes if write.update.name.endswith('/job-3') and not write.update_mask.field_paths) == 1
+
+def test_stop_ends_flusher_and_commits_buffered_writes(batches):
+    writer = main.JobEventWriter(flush_interval=60)
+    buffer_job(writer, 'job-4', 3)
+    writer.stop(timeout=1)
+
+    assert not writer._thread.is_alive()
+    assert event_seqs(batches[0]) == [1, 2, 3]
+    writer.append('job-4', {'seq': 4, 'type': 'STATUS', 'content': '', 'data': {}})
+    assert writer._thread is not None and not writer._thread.is_alive()
@@ -0,0 +1,54 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Job executor leases"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import main
+
+def committed_leases(writes, job_id):
+    return [
+        write.update.fields['lease_expires_at'].timestamp_value
+        for write in writes
+        if write.update.name.endswith(f'/{job_id}') and 'lease_expires_at' in write.update.fields
+    ]
+
+def test_queued_job_lease_outlives_queue_wait(committed, monkeypatch):
+    monkeypatch.setattr(main, 'JOB_LEASE_SECONDS', 1)
+    monkeypatch.setattr(main, 'QUEUED_LEASE_RENEW_SECONDS', 0.2)
+    monkeypatch.setattr(main, 'add_event_to_job', lambda *args, **kwargs: None)
+    executor = main.JobExecutor(workers=1, max_queue=2)
+    unblock = threading.Event()
+    started = threading.Event()
+
+    executor.submit('running-job', lambda job_id: unblock.wait(5))
+    executor.submit('queued-job', lambda job_id: started.set())
+    # Wait in the queue for more than twice the lease
+    time.sleep(2.5)
+    main.event_writer.flush('queued-job')
+
+    leases = committed_leases(committed, 'queued-job')
+    assert leases and leases[-1] > datetime.now(timezone.utc)
+    assert not started.is_set()
+
+    unblock.set()
+    assert started.wait(5)
+    # A started job renews its own lease with its events
+    renewals = len(committed_leases(committed, 'queued-job'))
+    time.sleep(0.5)
+    main.event_writer.flush('queued-job')
+    assert len(committed_leases(committed, 'queued-job')) == renewals
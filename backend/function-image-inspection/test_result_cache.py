@@ -0,0 +1,74 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inspection result cache matching"""
+
+import io
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from PIL import Image
+
+import main
+
+def jpeg(img, quality):
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='JPEG', quality=quality)
+    return img_bytes.getvalue()
+
+def gradient(width=320, height=240):
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 255, height)[:, None]
+    return Image.fromarray(np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1).astype('uint8'))
+
+def entry(phash, variant='v1', ttl=timedelta(hours=1)):
+    now = datetime.now(timezone.utc)
+    return {'variant': variant, 'phash': phash, 'events_json': '[]', 'source_job_id': 'job',
+            'cached_at': now, 'expires_at': now + ttl}
+
+def test_perceptual_hash_survives_reencoding():
+    img = gradient()
+    assert main.hamming_distance(main.perceptual_hash(jpeg(img, 90)), main.perceptual_hash(jpeg(img, 40))) <= 4
+    flipped = img.transpose(Image.FLIP_LEFT_RIGHT)
+    assert main.hamming_distance(main.perceptual_hash(jpeg(img, 90)), main.perceptual_hash(jpeg(flipped, 90))) > 4
+
+def test_hamming_distance():
+    assert main.hamming_distance('0000000000000000', 'ffffffffffffffff') == 64
+    assert main.hamming_distance('00000000000000f0', '0000000000000010') == 3
+
+def test_exact_key_hits_and_expires():
+    cache = main.InspectionResultCache(3600, 1024)
+    cache._put_local('key', entry('0' * 16))
+    assert cache._get_local({'key': 'key', 'variant': 'v1', 'phash': None}) is not None
+
+    cache._put_local('stale', entry('0' * 16, ttl=timedelta(seconds=-1)))
+    assert cache._get_local({'key': 'stale', 'variant': 'v1', 'phash': None}) is None
+
+def test_similar_image_only_matches_when_opted_in(monkeypatch):
+    cache = main.InspectionResultCache(3600, 1024)
+    cache._put_local('other-image', entry('00000000000000f0'))
+    similar = {'key': 'new-image', 'variant': 'v1', 'phash': '0000000000000010'}
+
+    monkeypatch.setattr(main, 'RESULT_CACHE_PHASH_MATCHING', False)
+    assert cache._get_local(similar) is None
+
+    monkeypatch.setattr(main, 'RESULT_CACHE_PHASH_MATCHING', True)
+    assert cache._get_local(similar) is not None
+    assert cache._get_local({**similar, 'variant': 'v2'}) is None
+
+def test_local_entries_are_byte_bounded():
+    cache = main.InspectionResultCache(3600, 5)
+    for key in ('a', 'b', 'c'):
+        cache._put_local(key, {**entry(None), 'events_json': '[1,2]'})
+    assert list(cache._entries) == ['c']
@@ -0,0 +1,57 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""BM25 ranking and token-budgeted span selection for verification prompts."""
+
+import main
+
+def test_tokenize_terms_drops_stopwords_and_single_characters():
+    assert main.tokenize_terms("The floor of a Kitchen, 3 mops") == ['floor', 'kitchen', 'mops']
+
+def test_bm25_scores_rank_matching_documents_first():
+    documents = [['floor', 'drain', 'debris'], ['pest', 'control'], ['floor', 'floor', 'clean']]
+
+    scores = main.bm25_scores(['floor', 'debris'], documents)
+
+    assert scores[1] == 0
+    assert scores[0] > scores[2] > 0
+    assert main.bm25_scores(['floor'], []) == []
+
+def test_cited_spans_fill_half_the_budget_first():
+    cited = [('117.35(a)', 'floors kept clean'), ('117.35(b)', 'unrelated equipment storage')]
+    retrieved = [('117.80(a)', 'floors drains debris cleaning floors')]
+    # The retrieved span scores highest and alone would fill the 10 token
+    # budget, but the first half is reserved for the best cited span
+    selected = main.select_relevant_spans('debris on floors', cited, retrieved, 10)
+
+    assert selected == [0]
+
+def test_retrieved_spans_compete_for_the_remaining_budget():
+    cited = [('117.35(a)', 'floors kept clean'), ('117.35(b)', 'unrelated equipment storage')]
+    retrieved = [('117.80(a)', 'floors drains debris cleaning floors'), ('117.80(b)', 'pest exclusion')]
+
+    selected = main.select_relevant_spans('debris on floors', cited, retrieved, 18)
+
+    # The matching retrieved span outranks the remaining cited span; the
+    # retrieved span with no query terms is never selected
+    assert selected == [0, 2]
+
+def test_selection_returns_source_order_within_budget():
+    cited = [(f'117.{index}', f'floor drain debris note {index}') for index in range(6)]
+
+    selected = main.select_relevant_spans('floor debris', cited, [], 40)
+
+    assert selected == sorted(selected)
+    assert sum(main.estimate_tokens(cited[index][1]) for index in selected) <= 40
+    assert main.select_relevant_spans('floor debris', cited, [], 1000) == list(range(6))
@@ -0,0 +1,104 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of boxes.py against the per-box loops it replaced.
+
+Run from this directory:
+    python benchmark_boxes.py [--sizes 10 100 1000] [--repeat 20]
+"""
+
+import argparse
+import random
+import timeit
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from boxes import draw_boxes, prepare_boxes
+
+IMAGE_SIZE = (3072, 2048)
+
+def random_clusters(count, seed=0):
+    """Mostly valid box_2d values, with some out of range or degenerate"""
+    rng = random.Random(seed)
+    clusters = []
+    for _ in range(count):
+        y1, x1 = rng.uniform(0, 950), rng.uniform(0, 950)
+        box = [y1, x1, y1 + rng.uniform(0, 50), x1 + rng.uniform(0, 50)]
+        if rng.random() < 0.1:
+            box[rng.randrange(4)] = rng.choice([-5, 1005])
+        if rng.random() < 0.5:
+            box = [box[2], box[3], box[0], box[1]]
+        clusters.append({'box_2d': box})
+    return clusters
+
+def legacy_geometry(clusters, width, height):
+    """The validate/order/scale/clamp loop from analyze_image_stream"""
+    pixels = []
+    for cluster in clusters:
+        coords = cluster['box_2d']
+        if not all(0 <= c <= 1000 for c in coords):
+            continue
+        x1, x2 = min(coords[1], coords[3]), max(coords[1], coords[3])
+        y1, y2 = min(coords[0], coords[2]), max(coords[0], coords[2])
+        if x1 >= x2 or y1 >= y2:
+            continue
+        x1 = max(0, min(width, int(x1 * width / 1000)))
+        y1 = max(0, min(height, int(y1 * height / 1000)))
+        x2 = max(0, min(width, int(x2 * width / 1000)))
+        y2 = max(0, min(height, int(y2 * height / 1000)))
+        pixels.append([x1, y1, x2, y2])
+    return pixels
+
+def legacy_draw(img, clusters):
+    draw = ImageDraw.Draw(img)
+    for x1, y1, x2, y2 in legacy_geometry(clusters, *img.size):
+        draw.rectangle([x1, y1, x2, y2], outline='lime', width=4)
+
+def vectorized_geometry(clusters, width, height):
+    return prepare_boxes([cluster['box_2d'] for cluster in clusters], width, height)[1]
+
+def vectorized_draw(img, clusters):
+    draw_boxes(img, vectorized_geometry(clusters, *img.size), 'lime', 4)
+
+def best_ms(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    width, height = IMAGE_SIZE
+    base = Image.new('RGB', IMAGE_SIZE)
+    print(f"{'boxes':>7} {'loop geom ms':>13} {'numpy geom ms':>14} {'loop draw ms':>13} {'numpy draw ms':>14}")
+    for size in args.sizes:
+        clusters = random_clusters(size)
+
+        # Both paths must agree before their timings mean anything
+        legacy = np.array(legacy_geometry(clusters, width, height)).reshape(-1, 4)
+        vectorized = vectorized_geometry(clusters, width, height)[:, [1, 0, 3, 2]]
+        assert np.array_equal(legacy, vectorized), "geometry differs from the legacy loop"
+
+        timings = [
+            best_ms(lambda: legacy_geometry(clusters, width, height), args.repeat),
+            best_ms(lambda: vectorized_geometry(clusters, width, height), args.repeat),
+            best_ms(lambda: legacy_draw(base.copy(), clusters), args.repeat),
+            best_ms(lambda: vectorized_draw(base.copy(), clusters), args.repeat),
+        ]
+        print(f"{size:>7} {timings[0]:>13.3f} {timings[1]:>14.3f} {timings[2]:>13.3f} {timings[3]:>14.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Vectorized bounding box operations.
+
+Boxes are float arrays of shape (N, 4) in [y1, x1, y2, x2] order, matching
+Gemini's box_2d convention, either normalized to 0-1000 or in image pixels.
+This module is shared by function-site-check and function-image-inspection;
+keep the two copies identical.
+"""
+
+import numpy as np
+from PIL import ImageDraw
+
+# Gemini normalizes box_2d coordinates to this range
+NORMALIZED_SCALE = 1000
+
+
+def as_boxes(coords: list) -> np.ndarray:
+    """(N, 4) float array of box_2d values; malformed entries become NaN rows"""
+    boxes = np.full((len(coords), 4), np.nan)
+    for index, box in enumerate(coords):
+        try:
+            boxes[index] = box
+        except (TypeError, ValueError):
+            pass
+    return boxes
+
+
+def order_boxes(boxes: np.ndarray) -> np.ndarray:
+    """Swap corners where needed so y1 <= y2 and x1 <= x2"""
+    return np.concatenate([np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])], axis=1)
+
+
+def valid_mask(boxes: np.ndarray, scale: float = NORMALIZED_SCALE) -> np.ndarray:
+    """Boxes with finite coordinates within [0, scale] and a non-empty ordered extent"""
+    with np.errstate(invalid='ignore'):
+        in_range = np.all(np.isfinite(boxes) & (boxes >= 0) & (boxes <= scale), axis=1)
+        ordered = order_boxes(boxes)
+        return in_range & (ordered[:, 0] < ordered[:, 2]) & (ordered[:, 1] < ordered[:, 3])
+
+
+def scale_boxes(boxes: np.ndarray, width: float, height: float, scale: float = NORMALIZED_SCALE) -> np.ndarray:
+    """Convert normalized boxes to a width x height pixel space"""
+    return boxes * (np.array([height, width, height, width], dtype=float) / scale)
+
+
+def normalize_boxes(boxes: np.ndarray, width: float, height: float, scale: float = NORMALIZED_SCALE) -> np.ndarray:
+    """Convert pixel boxes to rounded integers normalized to scale"""
+    normalized = boxes / (np.array([height, width, height, width], dtype=float) / scale)
+    return np.clip(np.round(normalized), 0, scale).astype(int)
+
+
+def clamp_boxes(boxes: np.ndarray, width: float, height: float) -> np.ndarray:
+    """Clip pixel boxes to the image"""
+    return np.clip(boxes, 0, np.array([height, width, height, width]))
+
+
+def to_pixels(boxes: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Order, scale, truncate and clamp normalized boxes to integer pixels"""
+    return clamp_boxes(np.trunc(scale_boxes(order_boxes(boxes), width, height)), width, height).astype(int)
+
+
+def prepare_boxes(coords: list, width: int, height: int, iou_threshold: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Validate, de-duplicate and convert box_2d values to pixels in one pass.
+
+    Returns the indexes of the boxes kept, in input order, and their integer
+    pixel boxes. Invalid boxes are dropped; with iou_threshold, so are boxes
+    overlapping an earlier kept box at least that much.
+    """
+    boxes = as_boxes(coords)
+    kept = np.flatnonzero(valid_mask(boxes))
+    ordered = order_boxes(boxes[kept])
+    if iou_threshold is not None and len(kept):
+        # Equal scores keep the earlier box, so the model's order decides
+        kept = kept[np.sort(nms(ordered, np.zeros(len(kept)), iou_threshold))]
+        ordered = order_boxes(boxes[kept])
+    return kept, to_pixels(ordered, width, height)
+
+
+def draw_boxes(img, pixel_boxes: np.ndarray, color: str, width: int):
+    """Draw integer pixel boxes on img, each outline width pixels inside its box"""
+    draw = ImageDraw.Draw(img)
+    # PIL takes [x1, y1, x2, y2]
+    for x1, y1, x2, y2 in pixel_boxes[:, [1, 0, 3, 2]].tolist():
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=width)
+    return img
+
+
+def box_areas(boxes: np.ndarray) -> np.ndarray:
+    """Area of each box; inverted boxes have zero area"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def pairwise_intersections(boxes: np.ndarray, others: np.ndarray | None = None) -> np.ndarray:
+    """(N, M) matrix of intersection areas with others, or (N, N) among boxes"""
+    if others is None:
+        others = boxes
+    top = np.maximum(boxes[:, None, 0], others[None, :, 0])
+    left = np.maximum(boxes[:, None, 1], others[None, :, 1])
+    bottom = np.minimum(boxes[:, None, 2], others[None, :, 2])
+    right = np.minimum(boxes[:, None, 3], others[None, :, 3])
+    return np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+
+
+def iou_matrix(boxes: np.ndarray) -> np.ndarray:
+    """(N, N) matrix of intersection over union"""
+    areas = box_areas(boxes)
+    intersections = pairwise_intersections(boxes)
+    unions = areas[:, None] + areas[None, :] - intersections
+    return np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indexes of the boxes kept by non-maximum suppression, highest score first"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    order = np.argsort(-scores, kind='stable')
+    ious = iou_matrix(boxes)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed |= ious[index] >= iou_threshold
+    return np.array(keep, dtype=int)
+
+
+def union_overlapping(boxes: np.ndarray, overlap_threshold: float) -> np.ndarray:
+    """Replace each group of overlapping boxes with their bounding union.
+
+    Two boxes overlap when their intersection covers at least
+    overlap_threshold of the smaller one; groups are the connected
+    components of that relation.
+    """
+    if len(boxes) == 0:
+        return boxes.reshape(0, 4)
+    areas = box_areas(boxes)
+    smaller = np.minimum(areas[:, None], areas[None, :])
+    intersections = pairwise_intersections(boxes)
+    overlap = np.divide(intersections, smaller, out=np.zeros_like(intersections), where=smaller > 0)
+    adjacent = (overlap >= overlap_threshold) | np.eye(len(boxes), dtype=bool)
+
+    # Propagate the smallest index through each component until labels settle
+    labels = np.arange(len(boxes))
+    while True:
+        propagated = np.where(adjacent, labels[None, :], len(boxes)).min(axis=1)
+        if np.array_equal(propagated, labels):
+            break
+        labels = propagated
+
+    groups, group_index = np.unique(labels, return_inverse=True)
+    merged = np.empty((len(groups), 4), dtype=float)
+    merged[:, :2] = np.inf
+    merged[:, 2:] = -np.inf
+    np.minimum.at(merged[:, 0], group_index, boxes[:, 0])
+    np.minimum.at(merged[:, 1], group_index, boxes[:, 1])
+    np.maximum.at(merged[:, 2], group_index, boxes[:, 2])
+    np.maximum.at(merged[:, 3], group_index, boxes[:, 3])
+    return merged
@@ -13,16 +13,27 @@
 # limitations under the License.
 
 import base64
+import hashlib
 import io
 import os
 import json
+import threading
 import time
 import logging
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import flask
 import functions_framework
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from google import genai
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 from google.genai import types
 from flask import jsonify, request
+from boxes import (NORMALIZED_SCALE, as_boxes, box_areas, draw_boxes, nms, normalize_boxes, order_boxes,
+                   pairwise_intersections, prepare_boxes, scale_boxes, to_pixels, union_overlapping, valid_mask)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,43 +46,194 @@ genai_client = genai.Client(
     location="global"
 )
 
-def compress_image(img: Image.Image, max_size_kb: int = 800) -> Image.Image:
-    """Compress image to target size while maintaining quality"""
-    quality = 95
+# Initialize Firestore client
+db = firestore.Client()
+
+# Site check jobs
+#
+# Layout:
+#   site_check_jobs/{job_id}                     status and last_event_seq
+#   site_check_jobs/{job_id}/events/{seq}        stage events, in order
+#   site_check_jobs/{job_id}/results/annotated   annotated JPEG bytes
+JOBS_COLLECTION = 'site_check_jobs'
+EVENTS_SUBCOLLECTION = 'events'
+RESULTS_SUBCOLLECTION = 'results'
+STREAM_POLL_INTERVAL_SECONDS = float(os.environ.get('STREAM_POLL_INTERVAL_SECONDS', '0.5'))
+STREAM_TIMEOUT_SECONDS = int(os.environ.get('STREAM_TIMEOUT_SECONDS', '600'))
+HEARTBEAT_INTERVAL_SECONDS = 15
+# Running jobs record heartbeat_at this often; an unfinished job silent for JOB_STALE_SECONDS has stopped
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '30'))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', '180'))
+# How long EventSource waits before reconnecting after a stream window ends
+STREAM_RETRY_MS = 1000
+# Model chunk progress is reported at most this often
+MODEL_PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Per-job event sequence counters; each job emits from a single thread
+_event_sequences = {}
+
+def get_job_ref(job_id):
+    return db.collection(JOBS_COLLECTION).document(job_id)
+
+def create_job():
+    """Create a new site check job document in Firestore"""
+    job_id = str(uuid.uuid4())
+    get_job_ref(job_id).set({
+        'job_id': job_id,
+        'status': 'created',
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'heartbeat_at': firestore.SERVER_TIMESTAMP,
+        'last_event_seq': 0
+    })
+    _event_sequences[job_id] = 0
+    return job_id
+
+def start_job(job_id, target, *args):
+    """Run target(job_id, *args) in the background, recording a heartbeat on the job while it runs"""
+    def run():
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    get_job_ref(job_id).update({'heartbeat_at': firestore.SERVER_TIMESTAMP})
+                except Exception as e:
+                    logger.error(f"Error recording heartbeat for job {job_id}: {str(e)}")
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            target(job_id, *args)
+        finally:
+            stopped.set()
+
+    threading.Thread(target=run, daemon=True).start()
+
+def job_stopped(job):
+    """True if an unfinished job's worker has stopped recording heartbeats"""
+    heartbeat_at = job.get('heartbeat_at')
+    return (job.get('status') in ('created', 'processing') and heartbeat_at is not None
+            and time.time() - heartbeat_at.timestamp() > JOB_STALE_SECONDS)
+
+def add_event_to_job(job_id, event_type, content='', data=None, stage=None, status='processing'):
+    """Append an event to the job's events subcollection"""
+    seq = _event_sequences.get(job_id, 0) + 1
+    _event_sequences[job_id] = seq
+    job_ref = get_job_ref(job_id)
+    batch = db.batch()
+    batch.set(job_ref.collection(EVENTS_SUBCOLLECTION).document(f"{seq:08d}"), {
+        'seq': seq,
+        'type': event_type,
+        'stage': stage,
+        'content': content,
+        'data': data or {}
+    })
+    batch.update(job_ref, {'status': status, 'last_event_seq': seq})
+    batch.commit()
+    if status != 'processing':
+        _event_sequences.pop(job_id, None)
+
+# Image compression
+# The same compressed JPEG is sent to the model and annotated, so boxes line up with what it saw
+MAX_IMAGE_KB = int(os.environ.get('MAX_IMAGE_KB', '800'))
+MAX_IMAGE_DIMENSION = int(os.environ.get('MAX_IMAGE_DIMENSION', '3072'))
+# Candidate JPEG qualities, binary searched for the highest that fits the byte budget
+JPEG_QUALITIES = list(range(20, 96, 5))
+# Quality for an upload whose JPEG quality cannot be estimated
+DEFAULT_JPEG_QUALITY = 90
+# Sum of the IJG standard luminance quantization table, which libjpeg scales by quality
+STANDARD_LUMINANCE_TABLE_SUM = 3710
+# If even the lowest quality is too large, the image is shrunk by this factor and searched again
+DOWNSCALE_FACTOR = 0.75
+
+def encode_jpeg(img: Image.Image, quality: int) -> bytes:
     img_bytes = io.BytesIO()
-    
-    while quality > 5:  # Don't go below quality=5
-        img_bytes.seek(0)
-        img_bytes.truncate()
-        img.save(img_bytes, format='JPEG', quality=quality)
-        if len(img_bytes.getvalue()) <= max_size_kb * 1024:
-            break
-        quality -= 5
-    
-    img_bytes.seek(0)
-    return Image.open(img_bytes)
+    img.save(img_bytes, format='JPEG', quality=quality)
+    return img_bytes.getvalue()
+
+def estimate_jpeg_quality(image_bytes: bytes) -> int:
+    """Estimate the quality a JPEG was saved at from its luminance quantization table"""
+    try:
+        table = Image.open(io.BytesIO(image_bytes)).quantization[0]
+    except (AttributeError, KeyError, OSError):
+        return DEFAULT_JPEG_QUALITY
+    # Invert libjpeg's scaling: 5000 / quality below 50, 200 - 2 * quality above
+    scale = sum(table) * 100 / STANDARD_LUMINANCE_TABLE_SUM
+    quality = 5000 / scale if scale > 100 else (200 - scale) / 2
+    return max(JPEG_QUALITIES[0], min(JPEG_QUALITIES[-1], round(quality)))
 
-def analyze_image_stream(img_base64: str) -> tuple[dict, str]:
+def load_image(image_bytes: bytes, max_dimension: int) -> tuple[Image.Image, str, tuple[int, int]]:
+    """Decode an image as RGB, no larger than max_dimension pixels on a side.
+
+    Returns the image with the source format and size.
     """
-    Analyze image with Gemini 2.5 to detect vehicles and draw bounding boxes.
-    Returns the analysis results and a new base64 image with boxes drawn.
+    img = Image.open(io.BytesIO(image_bytes))
+    source_format = img.format
+    source_size = img.size
+
+    # JPEGs can be scaled down by a power of two while decoding, far cheaper than a full decode
+    img.draft('RGB', (max_dimension, max_dimension))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+    # Decode now so tiles can be cropped from several threads
+    img.load()
+    return img, source_format, source_size
+
+def encode_within_budget(img: Image.Image, max_bytes: int) -> tuple[bytes, Image.Image, int]:
+    """Encode the highest quality JPEG of img within max_bytes, shrinking it if needed.
+
+    Returns the JPEG bytes, the image they encode and the JPEG quality used.
     """
-    try:
-        # Convert base64 to PIL Image
-        img_bytes = io.BytesIO(base64.b64decode(img_base64))
-        img = Image.open(img_bytes)
-        # Convert to RGB mode if needed
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-            
-        # Compress image if needed
-        img = compress_image(img)
-        
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
+    encodes = 0
+    while True:
+        best = None
+        low, high = 0, len(JPEG_QUALITIES) - 1
+        while low <= high:
+            middle = (low + high) // 2
+            jpeg_bytes = encode_jpeg(img, JPEG_QUALITIES[middle])
+            encodes += 1
+            if len(jpeg_bytes) <= max_bytes:
+                best = (jpeg_bytes, JPEG_QUALITIES[middle])
+                low = middle + 1
+            else:
+                high = middle - 1
+        if best is not None or min(img.size) <= 1:
+            break
+        img = img.resize((max(1, int(img.width * DOWNSCALE_FACTOR)), max(1, int(img.height * DOWNSCALE_FACTOR))), Image.LANCZOS)
 
-        # Prepare prompt for Gemini
-        text_prompt = types.Part.from_text(text="""
+    if best is None:
+        best = (jpeg_bytes, JPEG_QUALITIES[0])
+    jpeg_bytes, quality = best
+    logger.info(f"Encoded {img.size[0]}x{img.size[1]} at quality {quality} ({len(jpeg_bytes)} bytes) with {encodes} encodes")
+    return jpeg_bytes, img, quality
+
+def compress_image(image_bytes: bytes, max_size_kb: int = MAX_IMAGE_KB,
+                   max_dimension: int = MAX_IMAGE_DIMENSION) -> tuple[bytes, Image.Image, int]:
+    """Fit an image within max_dimension pixels and max_size_kb.
+
+    Returns the JPEG bytes, the RGB image they encode and the JPEG quality used.
+    """
+    start_time = time.time()
+    max_bytes = max_size_kb * 1024
+    img, source_format, source_size = load_image(image_bytes, max_dimension)
+
+    # A small enough JPEG is sent as uploaded
+    if source_format == 'JPEG' and img.size == source_size and len(image_bytes) <= max_bytes:
+        quality = estimate_jpeg_quality(image_bytes)
+        logger.info(f"Image {img.size[0]}x{img.size[1]} already within budget ({len(image_bytes)} bytes, quality ~{quality})")
+        return image_bytes, img, quality
+
+    jpeg_bytes, img, quality = encode_within_budget(img, max_bytes)
+    logger.info(f"Compressed {source_size[0]}x{source_size[1]} {source_format} ({len(image_bytes)} bytes) to "
+                f"{img.size[0]}x{img.size[1]} in {time.time() - start_time:.2f}s")
+    return jpeg_bytes, img, quality
+
+# Vehicle analysis
+ANALYSIS_MODEL = "gemini-2.5-pro"
+ACTIVITY_LEVELS = ['low', 'high', 'moderate']
+
+ANALYSIS_PROMPT = """
     Analyze this satellite image and identify areas with vehicle activity, focusing on groups/clusters of vehicles.
 
     Vehicle Activity Assessment:
@@ -109,146 +271,730 @@ def analyze_image_stream(img_base64: str) -> tuple[dict, str]:
             "Summarize the key characteristics of the site's vehicle presence and activity level."
         ]
     }
-    """)
-
-        # Get analysis from Gemini with streaming
-        contents = [
-            types.Content(
-                role="user",
-                parts=[text_prompt, types.Part.from_bytes(data=base64.b64decode(img_base64), mime_type="image/jpeg")]
-            )
-        ]
+    """
 
-        response_schema = {
-            "type": "OBJECT",
-            "properties": {
-                "clusters": {
-                    "type": "ARRAY",
-                    "items": {
-                        "type": "OBJECT",
-                        "properties": {
-                            "box_2d": {
-                                "type": "ARRAY",
-                                "items": {"type": "NUMBER"}
-                            }
-                        },
-                        "required": ["box_2d"]
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "clusters": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "box_2d": {
+                        "type": "ARRAY",
+                        "items": {"type": "NUMBER"}
                     }
                 },
-                "total_clusters": {"type": "NUMBER"},
-                "activity_level": {"type": "STRING", "enum": ["low", "high", "moderate"]},
-                "observations": {
-                    "type": "ARRAY",
-                    "items": {"type": "STRING"}
-                }
-            },
-            "required": ["clusters", "total_clusters", "activity_level", "observations"]
+                "required": ["box_2d"]
+            }
+        },
+        "total_clusters": {"type": "NUMBER"},
+        "activity_level": {"type": "STRING", "enum": ACTIVITY_LEVELS},
+        "observations": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
         }
+    },
+    "required": ["clusters", "total_clusters", "activity_level", "observations"]
+}
+
+ANALYSIS_CONFIG = types.GenerateContentConfig(
+    temperature=0.5,
+    top_p=1,
+    seed=0,
+    max_output_tokens=65535,
+    safety_settings=[
+        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
+        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
+        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
+        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
+    ],
+    response_mime_type="application/json",
+    response_schema=RESPONSE_SCHEMA
+)
 
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.5,
-            top_p=1,
-            seed=0,
-            max_output_tokens=65535,
-            safety_settings=[
-                types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
-                types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
-                types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
-                types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
-            ],
-            response_mime_type="application/json",
-            response_schema=response_schema
+def request_analysis(jpeg_bytes: bytes, progress=None) -> dict:
+    """Stream Gemini's analysis of a JPEG and validate it.
+
+    progress(stage, content, data) is called as chunks arrive, if given.
+    """
+    contents = [
+        types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=ANALYSIS_PROMPT), types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg")]
         )
+    ]
 
-        response_text = ""
-        for chunk in genai_client.models.generate_content_stream(
-            model="gemini-2.5-pro",
-            contents=contents,
-            config=generate_content_config
-        ):
-            if not chunk.candidates or not chunk.candidates[0].content.parts:
-                continue
-            response_text += chunk.text
+    request_time = time.time()
+    last_progress_time = request_time
+    chunk_count = 0
+    response_text = ""
+    for chunk in genai_client.models.generate_content_stream(
+        model=ANALYSIS_MODEL,
+        contents=contents,
+        config=ANALYSIS_CONFIG
+    ):
+        if not chunk.candidates or not chunk.candidates[0].content.parts:
+            continue
+        response_text += chunk.text
+        chunk_count += 1
+        if not progress:
+            continue
+        now = time.time()
+        if chunk_count == 1:
+            progress('model_first_token', "Analyzing site activity patterns...", {'ttft_ms': int((now - request_time) * 1000)})
+            last_progress_time = now
+        elif now - last_progress_time >= MODEL_PROGRESS_INTERVAL_SECONDS:
+            progress('model_chunks', "Receiving analysis...", {'chunks': chunk_count, 'characters': len(response_text)})
+            last_progress_time = now
+    if progress:
+        progress('model_complete', "Validating detection results...", {
+            'chunks': chunk_count,
+            'characters': len(response_text),
+            'elapsed_ms': int((time.time() - request_time) * 1000)
+        })
 
-        # Parse JSON response
-        analysis = json.loads(response_text.strip())
-        
-        # Validate expected structure
-        if not isinstance(analysis, dict):
-            raise ValueError("Response is not a JSON object")
-        if 'clusters' not in analysis:
-            raise ValueError("Response missing 'clusters' array")
-        if not isinstance(analysis['clusters'], list):
-            raise ValueError("'clusters' is not an array")
-        if 'activity_level' not in analysis:
-            raise ValueError("Response missing 'activity_level'")
-        if analysis['activity_level'] not in ['low', 'high', 'moderate']:
-            raise ValueError("Invalid activity_level value")
-
-        # Draw boxes for all clusters returned by Gemini
-        for cluster in analysis.get('clusters', []):
-            coords = cluster['box_2d']
-            # Validate coordinate ranges
-            if not all(0 <= c <= 1000 for c in coords):
-                logger.warning(f"Invalid coordinate range: {coords}")
-                continue
-                
-            # First order the normalized coordinates
-            x1, x2 = min(coords[1], coords[3]), max(coords[1], coords[3])
-            y1, y2 = min(coords[0], coords[2]), max(coords[0], coords[2])
-            
-            # Validate coordinate ordering
-            if x1 >= x2 or y1 >= y2:
-                logger.warning(f"Invalid coordinate ordering: {[y1, x1, y2, x2]}")
-                continue
-            
-            # Convert to image coordinates and round to integers
-            x1 = max(0, min(width, int(x1 * width / 1000)))
-            y1 = max(0, min(height, int(y1 * height / 1000)))
-            x2 = max(0, min(width, int(x2 * width / 1000)))
-            y2 = max(0, min(height, int(y2 * height / 1000)))
-            
-            # Draw cluster bounding box
-            outline_thickness = 4  # Align with notebook's width
-            draw.rectangle(
-                [x1, y1, x2, y2],
-                outline='lime',
-                width=outline_thickness
-            )
-
-        # Convert back to base64
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr.seek(0)
-        new_base64 = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-
-        return analysis, f"data:image/jpeg;base64,{new_base64}"
+    # Parse JSON response
+    analysis = json.loads(response_text.strip())
+
+    # Validate expected structure
+    if not isinstance(analysis, dict):
+        raise ValueError("Response is not a JSON object")
+    if 'clusters' not in analysis:
+        raise ValueError("Response missing 'clusters' array")
+    if not isinstance(analysis['clusters'], list):
+        raise ValueError("'clusters' is not an array")
+    if 'activity_level' not in analysis:
+        raise ValueError("Response missing 'activity_level'")
+    if analysis['activity_level'] not in ACTIVITY_LEVELS:
+        raise ValueError("Invalid activity_level value")
+    return analysis
+
+# Cluster outline width on the annotated image, matching the notebook
+CLUSTER_OUTLINE_WIDTH = 4
+# Clusters overlapping an earlier one this much are repeats and drawn once
+DUPLICATE_CLUSTER_IOU = 0.9
+
+def cluster_boxes(clusters: list) -> np.ndarray:
+    """Valid cluster boxes as an (N, 4) array of ordered [y1, x1, y2, x2] in the 0-1000 range"""
+    boxes = as_boxes([cluster.get('box_2d') for cluster in clusters])
+    valid = valid_mask(boxes)
+    if not valid.all():
+        logger.warning(f"Invalid cluster boxes: {boxes[~valid].tolist()}")
+    return order_boxes(boxes[valid])
+
+def draw_clusters(img: Image.Image, clusters: list) -> int:
+    """Draw each valid, distinct cluster's box_2d on img; returns the number drawn"""
+    kept, pixel_boxes = prepare_boxes([cluster.get('box_2d') for cluster in clusters],
+                                      img.width, img.height, DUPLICATE_CLUSTER_IOU)
+    if len(kept) < len(clusters):
+        logger.warning(f"Skipped {len(clusters) - len(kept)} invalid or duplicate cluster boxes")
+    draw_boxes(img, pixel_boxes, 'lime', CLUSTER_OUTLINE_WIDTH)
+    return len(kept)
+
+# Tiled analysis
+# Large images are split into overlapping tiles analyzed concurrently, so small clusters keep
+# their detail and each model call sees a bounded image
+TILED_ANALYSIS = os.environ.get('TILED_ANALYSIS', 'false').lower() == 'true'
+# Uploads are decoded up to this size before tiling, rather than MAX_IMAGE_DIMENSION
+TILED_MAX_DIMENSION = int(os.environ.get('TILED_MAX_DIMENSION', '6144'))
+TILE_SIZE = int(os.environ.get('TILE_SIZE', '1024'))
+# Fraction of each tile shared with its neighbours, so clusters on a seam appear whole in one tile
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', '0.2'))
+TILE_WORKERS = int(os.environ.get('TILE_WORKERS', '4'))
+# Detections of the same cluster from neighbouring tiles are suppressed above this IoU
+TILE_NMS_IOU = 0.5
+# Remaining boxes covering this much of the smaller one are parts of one cluster and are joined
+TILE_UNION_OVERLAP = 0.3
+# (cluster count, fraction of the image covered) at which merged activity is high or moderate
+HIGH_ACTIVITY_THRESHOLDS = (6, 0.15)
+MODERATE_ACTIVITY_THRESHOLDS = (2, 0.05)
+# Tile observations carried into the merged analysis
+MAX_TILE_OBSERVATIONS = 4
+
+def tile_starts(length: int) -> list[int]:
+    """Offsets of tiles covering [0, length), the last flush against the far edge"""
+    if length <= TILE_SIZE:
+        return [0]
+    stride = max(1, int(TILE_SIZE * (1 - TILE_OVERLAP)))
+    starts = list(range(0, length - TILE_SIZE, stride))
+    starts.append(length - TILE_SIZE)
+    return starts
+
+def tile_regions(width: int, height: int) -> list[tuple[int, int, int, int]]:
+    """(left, top, right, bottom) crop boxes of the tiles covering an image"""
+    return [(left, top, min(width, left + TILE_SIZE), min(height, top + TILE_SIZE))
+            for top in tile_starts(height)
+            for left in tile_starts(width)]
+
+def analyze_tile(img: Image.Image, region: tuple[int, int, int, int]) -> tuple[np.ndarray, dict]:
+    """Analyze one tile; returns its cluster boxes in image pixels and the tile's analysis"""
+    left, top, right, bottom = region
+    jpeg_bytes, _, _ = encode_within_budget(img.crop(region), MAX_IMAGE_KB * 1024)
+    analysis = request_analysis(jpeg_bytes)
+    offset = np.array([top, left, top, left])
+    return scale_boxes(cluster_boxes(analysis['clusters']), right - left, bottom - top) + offset, analysis
+
+def analyze_regions(img: Image.Image, regions: list, progress, stage: str, noun: str) -> list:
+    """Analyze image regions concurrently; returns analyze_tile's result for each, in order"""
+    # Regions finish in any order; progress is only reported from this thread
+    request_time = time.time()
+    results = [None] * len(regions)
+    pool = ThreadPoolExecutor(max_workers=min(TILE_WORKERS, len(regions)), thread_name_prefix='tile')
+    try:
+        futures = {pool.submit(analyze_tile, img, region): index for index, region in enumerate(regions)}
+        for completed, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            results[index] = future.result()
+            progress(stage, f"Analyzed {noun} {completed} of {len(regions)}.", {
+                'index': index,
+                'completed': completed,
+                'total': len(regions),
+                'clusters': len(results[index][0]),
+                'elapsed_ms': int((time.time() - request_time) * 1000)
+            })
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def merge_tile_boxes(boxes: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Merge tile detections in image pixels into clusters normalized to 0-1000"""
+    # Larger boxes are preferred; a tile that saw the whole cluster draws the widest box
+    keep = nms(boxes, box_areas(boxes), TILE_NMS_IOU)
+    return normalize_boxes(union_overlapping(boxes[keep], TILE_UNION_OVERLAP), width, height)
+
+def derive_activity_level(clusters: np.ndarray) -> str:
+    """Activity level of merged, normalized clusters from their count and coverage"""
+    coverage = min(1.0, box_areas(clusters.astype(float)).sum() / 1000 ** 2)
+    count = len(clusters)
+    if count >= HIGH_ACTIVITY_THRESHOLDS[0] or coverage >= HIGH_ACTIVITY_THRESHOLDS[1]:
+        return 'high'
+    if count >= MODERATE_ACTIVITY_THRESHOLDS[0] or coverage >= MODERATE_ACTIVITY_THRESHOLDS[1]:
+        return 'moderate'
+    return 'low'
+
+def render_annotated(img: Image.Image, analysis: dict, progress) -> str:
+    """Annotate a display-sized copy of img, fit to the byte budget, as a data URL"""
+    display = img.copy()
+    display.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+    drawn = draw_clusters(display, analysis['clusters'])
+    progress('boxes_drawn', f"Marked {drawn} vehicle clusters.", {'clusters': len(analysis['clusters']), 'drawn': drawn})
+    jpeg_bytes, _, _ = encode_within_budget(display, MAX_IMAGE_KB * 1024)
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode('utf-8')}"
+
+def analyze_tiled(image_bytes: bytes, progress) -> tuple[dict, str]:
+    """Analyze overlapping tiles concurrently and merge their clusters.
+
+    Returns the merged analysis and the annotated image as a data URL.
+    """
+    start_time = time.time()
+    img, _, _ = load_image(image_bytes, TILED_MAX_DIMENSION)
+    width, height = img.size
+    regions = tile_regions(width, height)
+    progress('tiles', f"Split imagery into {len(regions)} tiles.", {
+        'width': width,
+        'height': height,
+        'tiles': len(regions),
+        'tile_size': TILE_SIZE,
+        'elapsed_ms': int((time.time() - start_time) * 1000)
+    })
+
+    progress('model_request', "Scanning tiles for vehicle signatures...", {'tiles': len(regions)})
+    results = analyze_regions(img, regions, progress, 'tile_complete', 'tile')
+
+    detections = np.concatenate([boxes for boxes, _ in results])
+    clusters = merge_tile_boxes(detections, width, height)
+    activity_level = derive_activity_level(clusters)
+    progress('tiles_merged', f"Merged {len(detections)} detections into {len(clusters)} vehicle clusters.", {
+        'detections': len(detections),
+        'clusters': len(clusters),
+        'activity_level': activity_level
+    })
+
+    observations = [f"Merged {len(detections)} detections from {len(regions)} overlapping tiles "
+                    f"into {len(clusters)} vehicle clusters."]
+    for _, tile_analysis in results:
+        for observation in tile_analysis.get('observations', [])[:1]:
+            if observation not in observations and len(observations) <= MAX_TILE_OBSERVATIONS:
+                observations.append(observation)
+    analysis = {
+        'clusters': [{'box_2d': box} for box in clusters.tolist()],
+        'total_clusters': len(clusters),
+        'activity_level': activity_level,
+        'observations': observations,
+        'tiles': len(regions)
+    }
+
+    return analysis, render_annotated(img, analysis, progress)
+
+def analyze_single(image_bytes: bytes, progress) -> tuple[dict, str]:
+    """Analyze the whole image in one model call.
+
+    Returns the analysis and the annotated image as a data URL.
+    """
+    start_time = time.time()
+    # Resize and compress once; the model gets exactly the image that is annotated
+    jpeg_bytes, img, jpeg_quality = compress_image(image_bytes)
+    progress('compress', "Prepared high-resolution imagery for analysis.", {
+        'width': img.size[0],
+        'height': img.size[1],
+        'bytes': len(jpeg_bytes),
+        'quality': jpeg_quality,
+        'elapsed_ms': int((time.time() - start_time) * 1000)
+    })
+
+    progress('model_request', "Scanning for vehicle signatures...")
+    analysis = request_analysis(jpeg_bytes, progress)
+
+    # Draw boxes for all clusters returned by Gemini
+    drawn = draw_clusters(img, analysis['clusters'])
+    progress('boxes_drawn', f"Marked {drawn} vehicle clusters.", {'clusters': len(analysis['clusters']), 'drawn': drawn})
+
+    # Re-encode at the model image's quality; the boxes can still push it over budget
+    annotated_bytes = encode_jpeg(img, jpeg_quality)
+    if len(annotated_bytes) > MAX_IMAGE_KB * 1024:
+        annotated_bytes, _, _ = encode_within_budget(img, MAX_IMAGE_KB * 1024)
+    new_base64 = base64.b64encode(annotated_bytes).decode('utf-8')
+
+    return analysis, f"data:image/jpeg;base64,{new_base64}"
+
+def analyze_full(image_bytes: bytes, progress, tiled: bool) -> tuple[dict, str]:
+    if tiled:
+        return analyze_tiled(image_bytes, progress)
+    return analyze_single(image_bytes, progress)
+
+# Stored annotated images are kept under Firestore's 1 MiB document limit
+ANNOTATED_MAX_BYTES = int(os.environ.get('ANNOTATED_MAX_KB', '960')) * 1024
+
+def annotated_document(annotated_image: str) -> dict:
+    """Firestore fields for an annotated image data URL, re-encoded if it would not fit a document"""
+    jpeg_bytes = base64.b64decode(annotated_image.split(',')[1])
+    if len(jpeg_bytes) > ANNOTATED_MAX_BYTES:
+        source_bytes = len(jpeg_bytes)
+        jpeg_bytes, _, _ = encode_within_budget(Image.open(io.BytesIO(jpeg_bytes)).convert('RGB'), ANNOTATED_MAX_BYTES)
+        logger.info(f"Re-encoded annotated image from {source_bytes} to {len(jpeg_bytes)} bytes to fit a document")
+    return {'image': jpeg_bytes}
+
+# Site history
+#
+# Layout:
+#   site_history/{sha256(site_id)}                     last analysis and its image signature
+#   site_history/{sha256(site_id)}/results/annotated   annotated JPEG bytes
+#
+# A recheck is registered to the site's last analyzed image and compared block by
+# block on small grayscale signatures. An unchanged site gets its last result back;
+# one with a few changed areas has only those areas re-analyzed.
+SITE_HISTORY_COLLECTION = 'site_history'
+# Signatures are SIGNATURE_SIZE pixels square, compared in a SIGNATURE_BLOCKS x SIGNATURE_BLOCKS grid
+SIGNATURE_SIZE = 128
+SIGNATURE_BLOCKS = 8
+# A block whose SSIM with the last image is below this has changed
+BLOCK_CHANGE_SSIM = float(os.environ.get('BLOCK_CHANGE_SSIM', '0.8'))
+# Up to this fraction of changed blocks, the last analysis is returned as is
+SITE_CHANGE_THRESHOLD = float(os.environ.get('SITE_CHANGE_THRESHOLD', '0'))
+# Above this fraction of changed blocks, the whole image is analyzed again
+PARTIAL_ANALYSIS_MAX_FRACTION = float(os.environ.get('PARTIAL_ANALYSIS_MAX_FRACTION', '0.4'))
+# Larger shifts (in signature pixels) or aspect ratio changes mean different framing, not change
+MAX_REGISTRATION_SHIFT = 8
+MAX_ASPECT_DIFFERENCE = 0.02
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def get_site_ref(site_id):
+    # Site IDs are free text such as addresses, which may contain '/'
+    return db.collection(SITE_HISTORY_COLLECTION).document(hashlib.sha256(site_id.encode('utf-8')).hexdigest())
+
+def image_signature(image_bytes: bytes) -> tuple[np.ndarray, float]:
+    """Small grayscale copy of an image for comparison, and the image's aspect ratio"""
+    img, _, source_size = load_image(image_bytes, SIGNATURE_SIZE * 4)
+    signature = img.convert('L').resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR)
+    return np.asarray(signature, dtype=float), source_size[0] / source_size[1]
+
+def estimate_shift(reference: np.ndarray, current: np.ndarray) -> tuple[int, int]:
+    """Translation (dy, dx) of current relative to reference, by phase correlation"""
+    cross = np.fft.fft2(current - current.mean()) * np.conj(np.fft.fft2(reference - reference.mean()))
+    correlation = np.fft.ifft2(cross / np.maximum(np.abs(cross), 1e-9)).real
+    dy, dx = np.unravel_index(np.argmax(correlation), correlation.shape)
+    size = reference.shape[0]
+    return (int(dy) - size if dy > size // 2 else int(dy)), (int(dx) - size if dx > size // 2 else int(dx))
+
+def align_signature(reference: np.ndarray, current: np.ndarray, shift: tuple[int, int]) -> np.ndarray:
+    """Reference moved by shift onto current; edge strips it does not cover are taken from current"""
+    dy, dx = shift
+    aligned = np.roll(reference, shift, axis=(0, 1))
+    if dy > 0:
+        aligned[:dy] = current[:dy]
+    elif dy < 0:
+        aligned[dy:] = current[dy:]
+    if dx > 0:
+        aligned[:, :dx] = current[:, :dx]
+    elif dx < 0:
+        aligned[:, dx:] = current[:, dx:]
+    return aligned
+
+def block_ssim(reference: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """SSIM of each block of two signatures, as a SIGNATURE_BLOCKS square grid"""
+    block = SIGNATURE_SIZE // SIGNATURE_BLOCKS
+    shape = (SIGNATURE_BLOCKS, block, SIGNATURE_BLOCKS, block)
+    a, b = reference.reshape(shape), current.reshape(shape)
+    mean_a, mean_b = a.mean(axis=(1, 3)), b.mean(axis=(1, 3))
+    var_a, var_b = a.var(axis=(1, 3)), b.var(axis=(1, 3))
+    covariance = (a * b).mean(axis=(1, 3)) - mean_a * mean_b
+    return (((2 * mean_a * mean_b + SSIM_C1) * (2 * covariance + SSIM_C2)) /
+            ((mean_a ** 2 + mean_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2)))
+
+def compare_to_history(history: dict, signature: np.ndarray, aspect: float) -> dict | None:
+    """Register a signature to the site's last one and find the changed blocks.
+
+    Returns None when the two images are not comparable.
+    """
+    if history.get('signature_size') != SIGNATURE_SIZE or abs(history['aspect'] - aspect) > MAX_ASPECT_DIFFERENCE * aspect:
+        return None
+    reference = np.frombuffer(history['signature'], dtype=np.uint8).reshape(SIGNATURE_SIZE, SIGNATURE_SIZE).astype(float)
+    shift = estimate_shift(reference, signature)
+    if max(abs(offset) for offset in shift) > MAX_REGISTRATION_SHIFT:
+        return None
+    ssim = block_ssim(align_signature(reference, signature, shift), signature)
+    changed = ssim < BLOCK_CHANGE_SSIM
+    return {
+        'shift': shift,
+        'ssim': float(ssim.mean()),
+        'changed': changed,
+        'changed_fraction': float(changed.mean())
+    }
+
+def changed_regions(changed: np.ndarray) -> np.ndarray:
+    """Normalized boxes around groups of changed blocks, padded by half a block"""
+    rows, cols = np.nonzero(changed)
+    step = NORMALIZED_SCALE / SIGNATURE_BLOCKS
+    padded = (np.stack([rows, cols, rows + 1, cols + 1], axis=1) + np.array([-0.5, -0.5, 0.5, 0.5])) * step
+    # Padded neighbours overlap, so each connected group of blocks becomes one region
+    return np.clip(union_overlapping(padded, 0.01), 0, NORMALIZED_SCALE)
+
+def analyze_changed_regions(image_bytes: bytes, history: dict, comparison: dict, progress) -> tuple[dict, str]:
+    """Re-analyze the changed areas of a site and carry over its other clusters.
+
+    Returns the combined analysis and the annotated image as a data URL.
+    """
+    img, _, _ = load_image(image_bytes, MAX_IMAGE_DIMENSION)
+    width, height = img.size
+    regions = changed_regions(comparison['changed'])
+
+    # Earlier clusters move with the registration shift; those touching a changed area are replaced
+    dy, dx = comparison['shift']
+    previous = cluster_boxes(history['analysis']['clusters'])
+    previous = np.clip(previous + np.array([dy, dx, dy, dx]) * NORMALIZED_SCALE / SIGNATURE_SIZE, 0, NORMALIZED_SCALE)
+    carried = previous[~(pairwise_intersections(previous, regions) > 0).any(axis=1)]
+
+    crops = [(x1, y1, x2, y2) for y1, x1, y2, x2 in to_pixels(regions, width, height).tolist()]
+    progress('model_request', f"Re-analyzing {len(crops)} changed areas...", {'regions': len(crops)})
+    results = analyze_regions(img, crops, progress, 'region_complete', 'changed area')
+
+    fresh = merge_tile_boxes(np.concatenate([boxes for boxes, _ in results]), width, height)
+    clusters = np.concatenate([np.round(carried).astype(int), fresh])
+    observations = [f"{comparison['changed_fraction']:.0%} of the site changed since the last check; "
+                    f"re-analyzed {len(crops)} changed areas and kept {len(carried)} unchanged clusters."]
+    for _, region_analysis in results:
+        for observation in region_analysis.get('observations', [])[:1]:
+            if observation not in observations and len(observations) <= MAX_TILE_OBSERVATIONS:
+                observations.append(observation)
+    analysis = {
+        'clusters': [{'box_2d': box} for box in clusters.tolist()],
+        'total_clusters': len(clusters),
+        'activity_level': derive_activity_level(clusters),
+        'observations': observations
+    }
+    return analysis, render_annotated(img, analysis, progress)
+
+def analyze_site(image_bytes: bytes, site_id: str, progress, tiled: bool, refresh: bool = False) -> tuple[dict, str]:
+    """Analyze a site's image, reusing its last analysis where the imagery has not changed"""
+    start_time = time.time()
+    site_ref = get_site_ref(site_id)
+    signature, aspect = image_signature(image_bytes)
+    history = None if refresh else site_ref.get().to_dict()
+    comparison = compare_to_history(history, signature, aspect) if history else None
+    elapsed_ms = int((time.time() - start_time) * 1000)
+
+    mode = 'full'
+    if comparison is None:
+        content = "Refresh requested; analyzing the full image." if refresh else "No comparable earlier imagery for this site."
+        progress('change_detection', content, {'mode': mode, 'elapsed_ms': elapsed_ms})
+    else:
+        if comparison['changed_fraction'] <= SITE_CHANGE_THRESHOLD:
+            mode = 'unchanged'
+        elif comparison['changed_fraction'] <= PARTIAL_ANALYSIS_MAX_FRACTION:
+            mode = 'partial'
+        progress('change_detection', f"{comparison['changed_fraction']:.0%} of the site changed since the last check.", {
+            'mode': mode,
+            'ssim': round(comparison['ssim'], 4),
+            'changed_fraction': comparison['changed_fraction'],
+            'shift': list(comparison['shift']),
+            'elapsed_ms': elapsed_ms
+        })
+
+    if mode == 'unchanged':
+        annotated = site_ref.collection(RESULTS_SUBCOLLECTION).document('annotated').get()
+        if annotated.exists:
+            analysis = dict(history['analysis'])
+            analyzed_at = history.get('analyzed_at')
+            analysis['observations'] = [
+                f"Imagery is unchanged since the check on {analyzed_at:%Y-%m-%d}; its results are reused."
+                if analyzed_at else "Imagery is unchanged since the last check; its results are reused."
+            ] + list(analysis.get('observations', []))
+            return analysis, f"data:image/jpeg;base64,{base64.b64encode(annotated.get('image')).decode('utf-8')}"
+        mode = 'full'
+
+    if mode == 'partial':
+        analysis, annotated_image = analyze_changed_regions(image_bytes, history, comparison, progress)
+    else:
+        analysis, annotated_image = analyze_full(image_bytes, progress, tiled)
+
+    # History only speeds up the next check, so failing to record it keeps this result
+    try:
+        batch = db.batch()
+        batch.set(site_ref, {
+            'site_id': site_id,
+            'signature': signature.astype(np.uint8).tobytes(),
+            'signature_size': SIGNATURE_SIZE,
+            'aspect': aspect,
+            'analysis': analysis,
+            'analyzed_at': firestore.SERVER_TIMESTAMP
+        })
+        batch.set(site_ref.collection(RESULTS_SUBCOLLECTION).document('annotated'), annotated_document(annotated_image))
+        batch.commit()
+    except Exception as e:
+        logger.error(f"Error recording history for site {site_id}: {str(e)}")
+    return analysis, annotated_image
+
+def analyze_image_stream(img_base64: str, on_progress=None, tiled: bool = TILED_ANALYSIS,
+                         site_id: str | None = None, refresh: bool = False) -> tuple[dict, str]:
+    """
+    Analyze image with Gemini 2.5 to detect vehicles and draw bounding boxes.
+    Returns the analysis results and a new base64 image with boxes drawn.
+    on_progress(stage, content, data) is called as each stage finishes.
+    With a site_id, unchanged imagery reuses the site's last analysis.
+    """
+    def progress(stage, content, data=None):
+        logger.info(f"[{stage}] {content} {data or ''}")
+        if on_progress:
+            on_progress(stage, content, data or {})
+
+    try:
+        image_bytes = base64.b64decode(img_base64)
+        progress('decode', "Decoded satellite image.", {'bytes': len(image_bytes), 'tiled': tiled})
+        if site_id:
+            return analyze_site(image_bytes, site_id, progress, tiled, refresh)
+        return analyze_full(image_bytes, progress, tiled)
 
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return {"error": str(e)}, None
 
-def generate_status_stream():
-    """Generate simple status stream with delays"""
-    def generate():
-        messages = [
-            ("Initializing satellite image analysis...", 0.5),
-            ("Processing high-resolution imagery...", 1.5),
-            ("Scanning for vehicle signatures...", 2),
-            ("Analyzing site activity patterns...", 2),
-            ("Validating detection results...", 1.5),
-            ("Generating activity report...", 1),
-            ("Finalizing analysis...", 1.5)  # Changed from "Analysis complete"
-        ]
-        
-        total_delay = sum(delay for _, delay in messages)
-        logger.info(f"Total streaming delay: {total_delay} seconds")
-        
-        for msg, delay in messages:
-            yield f'data: {{"type":"status","content":"{msg}"}}\n\n'
-            time.sleep(delay)  # Longer delays to better match analysis time
-            
-    return generate()
+def run_site_check(job_id, image_data, tiled=TILED_ANALYSIS, site_id=None, refresh=False):
+    """Analyze the image for a job, recording stage events and the result"""
+    def on_progress(stage, content, data):
+        add_event_to_job(job_id, 'status', content, data, stage=stage)
+
+    try:
+        analysis, annotated_image = analyze_image_stream(image_data, on_progress, tiled, site_id, refresh)
+        if 'error' in analysis:
+            add_event_to_job(job_id, 'error', analysis['error'], status='error')
+            return
+
+        # The annotated image is too large for an event; the stream attaches it to the result
+        get_job_ref(job_id).collection(RESULTS_SUBCOLLECTION).document('annotated').set(annotated_document(annotated_image))
+        add_event_to_job(job_id, 'result', "Analysis complete.", {'vehicle_analysis': analysis}, status='completed')
+    except Exception as e:
+        logger.error(f"Error processing job {job_id}: {str(e)}")
+        add_event_to_job(job_id, 'error', str(e), status='error')
+
+# Batch site checks
+#
+# A batch is one job. Sites are analyzed BATCH_WORKERS at a time, each retried
+# with backoff, and a site_result or site_error event is recorded as each
+# finishes. The job's result is a summary ranked by activity and cluster count.
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '4'))
+BATCH_MAX_SITES = int(os.environ.get('BATCH_MAX_SITES', '500'))
+BATCH_MAX_ATTEMPTS = int(os.environ.get('BATCH_MAX_ATTEMPTS', '3'))
+BATCH_RETRY_BASE_SECONDS = 2.0
+# function-get-map endpoint, used for sites given by address instead of image
+GET_MAP_URL = os.environ.get('GET_MAP_URL')
+GET_MAP_TIMEOUT_SECONDS = 30
+# Summary order, most active first
+ACTIVITY_RANK = {'high': 0, 'moderate': 1, 'low': 2}
+
+def parse_batch_sites(sites):
+    """Validate a batch request's sites; returns them as dicts or raises ValueError"""
+    if not isinstance(sites, list) or not sites:
+        raise ValueError("'sites' must be a non-empty array")
+    if len(sites) > BATCH_MAX_SITES:
+        raise ValueError(f"At most {BATCH_MAX_SITES} sites per batch")
+    parsed = []
+    for index, site in enumerate(sites):
+        if not isinstance(site, dict) or not (site.get('image') or site.get('address')):
+            raise ValueError(f"Site {index} needs an 'image' or an 'address'")
+        if not site.get('image') and not GET_MAP_URL:
+            raise ValueError(f"Site {index} is given by address but GET_MAP_URL is not configured")
+        parsed.append({
+            'site_id': site.get('site_id') or site.get('address'),
+            'image': site.get('image'),
+            'address': site.get('address')
+        })
+    return parsed
+
+def fetch_map_image(address):
+    """Satellite image for an address from function-get-map, as base64"""
+    map_request = urllib.request.Request(
+        GET_MAP_URL,
+        data=json.dumps({'address': address}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(map_request, timeout=GET_MAP_TIMEOUT_SECONDS) as response:
+        map_image = json.loads(response.read()).get('mapImage')
+    if not map_image:
+        raise ValueError(f"No satellite image for {address}")
+    return map_image
+
+def check_batch_site(site, tiled, refresh):
+    """Analyze one batch site, retrying with backoff; returns (analysis, annotated_image, attempts)"""
+    for attempt in range(1, BATCH_MAX_ATTEMPTS + 1):
+        try:
+            image_data = site['image'] or fetch_map_image(site['address'])
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
+            analysis, annotated_image = analyze_image_stream(image_data, None, tiled, site['site_id'], refresh)
+            if 'error' not in analysis:
+                return analysis, annotated_image, attempt
+            error = analysis['error']
+        except Exception as e:
+            error = str(e)
+        logger.warning(f"Site {site['site_id']} attempt {attempt} failed: {error}")
+        if attempt < BATCH_MAX_ATTEMPTS:
+            time.sleep(BATCH_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    raise RuntimeError(f"Failed after {BATCH_MAX_ATTEMPTS} attempts: {error}")
+
+def rank_batch_rows(rows):
+    """Completed sites by activity level then cluster count, most active first; failures last"""
+    def sort_key(row):
+        if row['status'] != 'completed':
+            return (1, len(ACTIVITY_RANK), 0, row['index'])
+        return (0, ACTIVITY_RANK.get(row['activity_level'], len(ACTIVITY_RANK)), -row['total_clusters'], row['index'])
+    ranked = sorted(rows, key=sort_key)
+    for rank, row in enumerate(ranked, 1):
+        row['rank'] = rank
+    return ranked
+
+def run_batch_site_check(job_id, sites, tiled=TILED_ANALYSIS, refresh=False):
+    """Analyze a batch of sites, recording each site's result as it completes"""
+    start_time = time.time()
+    job_ref = get_job_ref(job_id)
+    add_event_to_job(job_id, 'status', f"Queued {len(sites)} sites.", {'sites': len(sites), 'workers': BATCH_WORKERS}, stage='batch_queued')
+
+    # Sites finish in any order; events are only recorded from this thread
+    rows = []
+    pool = ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(sites)), thread_name_prefix='site')
+    try:
+        futures = {pool.submit(check_batch_site, site, tiled, refresh): index for index, site in enumerate(sites)}
+        for completed, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            site_id = sites[index]['site_id']
+            try:
+                analysis, annotated_image, attempts = future.result()
+            except Exception as e:
+                rows.append({'index': index, 'site_id': site_id, 'status': 'error', 'error': str(e)})
+                add_event_to_job(job_id, 'site_error', f"Site {completed} of {len(sites)} failed.", {
+                    'index': index,
+                    'site_id': site_id,
+                    'error': str(e),
+                    'completed': completed,
+                    'total': len(sites)
+                })
+                continue
+
+            annotated_ref = f"site-{index:05d}"
+            job_ref.collection(RESULTS_SUBCOLLECTION).document(annotated_ref).set(annotated_document(annotated_image))
+            rows.append({
+                'index': index,
+                'site_id': site_id,
+                'status': 'completed',
+                'activity_level': analysis['activity_level'],
+                'total_clusters': len(analysis['clusters']),
+                'attempts': attempts
+            })
+            add_event_to_job(job_id, 'site_result', f"Analyzed site {completed} of {len(sites)}.", {
+                'index': index,
+                'site_id': site_id,
+                'vehicle_analysis': analysis,
+                'attempts': attempts,
+                'completed': completed,
+                'total': len(sites),
+                'annotated_ref': annotated_ref
+            })
+    except Exception as e:
+        logger.error(f"Error processing batch {job_id}: {str(e)}")
+        add_event_to_job(job_id, 'error', str(e), status='error')
+        return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    ranked = rank_batch_rows(rows)
+    failed = sum(1 for row in rows if row['status'] != 'completed')
+    add_event_to_job(job_id, 'result', f"Batch complete: {len(rows) - failed} of {len(sites)} sites analyzed.", {
+        'batch_summary': {
+            'sites': len(sites),
+            'completed': len(rows) - failed,
+            'failed': failed,
+            'elapsed_ms': int((time.time() - start_time) * 1000),
+            'rows': ranked
+        }
+    }, status='completed')
+
+def generate_status_stream(job_id, last_event_id=0):
+    """Stream a job's stage and site events, ending with its result or error"""
+    job_ref = get_job_ref(job_id)
+    last_seq = last_event_id
+    deadline = time.time() + STREAM_TIMEOUT_SECONDS
+    last_sent_time = time.time()
+
+    if not job_ref.get().exists:
+        yield f'data: {json.dumps({"type": "error", "content": "Job not found"})}\n\n'
+        return
+
+    while time.time() < deadline:
+        new_events = (
+            job_ref.collection(EVENTS_SUBCOLLECTION)
+            .where(filter=FieldFilter('seq', '>', last_seq))
+            .order_by('seq')
+            .stream()
+        )
+        for event_doc in new_events:
+            event = event_doc.to_dict()
+            last_seq = event['seq']
+            # Batch site results name their image; a single check's result uses 'annotated'
+            annotated_ref = event['data'].pop('annotated_ref', 'annotated' if event['type'] == 'result' else None)
+            if annotated_ref:
+                annotated = job_ref.collection(RESULTS_SUBCOLLECTION).document(annotated_ref).get()
+                if annotated.exists:
+                    event['data']['annotated_image'] = (
+                        f"data:image/jpeg;base64,{base64.b64encode(annotated.get('image')).decode('utf-8')}"
+                    )
+            yield f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+            last_sent_time = time.time()
+            if event['type'] in ('result', 'error'):
+                return
+
+        if time.time() - last_sent_time >= HEARTBEAT_INTERVAL_SECONDS:
+            yield ': heartbeat\n\n'
+            last_sent_time = time.time()
+        time.sleep(STREAM_POLL_INTERVAL_SECONDS)
+
+    # Only the stream window has ended; the job may still be running
+    if job_stopped(job_ref.get().to_dict() or {}):
+        yield f'data: {json.dumps({"type": "error", "content": "Job stopped before finishing"})}\n\n'
+        return
+    reconnect = {"type": "reconnect", "content": "Reconnect with Last-Event-ID to continue.", "last_event_id": last_seq}
+    yield f'retry: {STREAM_RETRY_MS}\nevent: reconnect\ndata: {json.dumps(reconnect)}\n\n'
 
 @functions_framework.http
 def analyze_site_precheck(request):
@@ -257,7 +1003,7 @@ def analyze_site_precheck(request):
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Headers': 'Content-Type, Last-Event-ID',
         'Access-Control-Max-Age': '3600'
     }
 
@@ -271,7 +1017,17 @@ def analyze_site_precheck(request):
         headers['Connection'] = 'keep-alive'
         headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
         
-        return generate_status_stream(), 200, headers
+        job_id = request.args.get('job_id')
+        if not job_id:
+            return jsonify({'error': 'Missing job_id parameter'}), 400, headers
+        
+        # EventSource sends Last-Event-ID when it reconnects
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400, headers
+        
+        return flask.Response(generate_status_stream(job_id, last_event_id), 200, headers)
 
     # Handle regular POST request for image analysis
     try:
@@ -279,6 +1035,20 @@ def analyze_site_precheck(request):
         if not request_json:
             return jsonify({'error': 'No JSON data received'}), 400, headers
 
+        # Tiling is opt-in per request and defaults to TILED_ANALYSIS
+        tiled = bool(request_json.get('tiled', TILED_ANALYSIS))
+        refresh = bool(request_json.get('refresh', False))
+
+        # Batch of sites; per-site results and the ranked summary are delivered on /stream
+        if request.path.endswith('/batch'):
+            try:
+                sites = parse_batch_sites(request_json.get('sites'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400, headers
+            job_id = create_job()
+            start_job(job_id, run_batch_site_check, sites, tiled, refresh)
+            return jsonify({'job_id': job_id, 'sites': len(sites)}), 200, headers
+
         image_data = request_json.get('image', '')
         if not image_data:
             return jsonify({'error': 'Missing image data'}), 400, headers
@@ -287,16 +1057,14 @@ def analyze_site_precheck(request):
         if ',' in image_data:
             image_data = image_data.split(',')[1]
 
-        # Analyze image and get vehicle boxes
-        analysis, annotated_image = analyze_image_stream(image_data)
-        if 'error' in analysis:
-            return jsonify(analysis), 500, headers
+        # With a site_id, rechecks of unchanged imagery reuse the site's last analysis unless refresh is set
+        site_id = request_json.get('site_id') or None
+
+        # Analyze in the background; progress and the result are delivered on /stream
+        job_id = create_job()
+        start_job(job_id, run_site_check, image_data, tiled, site_id, refresh)
 
-        # Return analysis results and annotated image
-        return jsonify({
-            'vehicle_analysis': analysis,
-            'annotated_image': annotated_image
-        }), 200, headers
+        return jsonify({'job_id': job_id}), 200, headers
 
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -0,0 +1,88 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Box validation, suppression and merging."""
+
+import numpy as np
+
+from boxes import iou_matrix, nms, prepare_boxes, union_overlapping
+
+def test_iou_matrix():
+    boxes = np.array([[0, 0, 10, 10], [0, 5, 10, 15], [20, 20, 30, 30]], dtype=float)
+
+    ious = iou_matrix(boxes)
+
+    np.testing.assert_allclose(ious.diagonal(), 1)
+    assert ious[0, 1] == ious[1, 0] == 50 / 150
+    assert ious[0, 2] == 0
+
+def test_nms_keeps_highest_score_of_each_overlapping_group():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30], [0, 0, 10, 11]], dtype=float)
+    scores = np.array([0.5, 0.9, 0.7, 0.1])
+
+    keep = nms(boxes, scores, 0.5)
+
+    assert keep.tolist() == [1, 2]
+
+def test_nms_threshold_and_ties():
+    boxes = np.array([[0, 0, 10, 10], [0, 5, 10, 15]], dtype=float)
+
+    # IoU of one third is below the threshold, so both survive
+    assert nms(boxes, np.array([0.2, 0.8]), 0.5).tolist() == [1, 0]
+    # Equal scores keep the earlier box
+    assert nms(boxes, np.zeros(2), 0.3).tolist() == [0]
+    assert nms(np.zeros((0, 4)), np.zeros(0), 0.5).tolist() == []
+
+def test_union_overlapping_merges_connected_boxes():
+    boxes = np.array([
+        [0, 0, 10, 10],
+        [18, 18, 28, 28],
+        [5, 5, 15, 15],
+        [12, 12, 22, 22],
+    ], dtype=float)
+
+    merged = union_overlapping(boxes, 0.05)
+
+    # 0-2 and 2-3 overlap and 3-1 overlaps, so everything is one group
+    assert merged.tolist() == [[0, 0, 28, 28]]
+
+def test_union_overlapping_uses_the_smaller_box():
+    boxes = np.array([[0, 0, 100, 100], [90, 90, 92, 92], [95, 95, 110, 110], [200, 200, 210, 210]], dtype=float)
+
+    # The small box lies inside the large one; the third covers a third of itself
+    merged = union_overlapping(boxes, 0.5)
+
+    assert merged.tolist() == [[0, 0, 100, 100], [95, 95, 110, 110], [200, 200, 210, 210]]
+    assert union_overlapping(np.zeros((0, 4)), 0.5).shape == (0, 4)
+
+def test_prepare_boxes_drops_invalid_and_duplicate_boxes():
+    coords = [
+        [100, 200, 300, 400],
+        'not a box',
+        [300, 400, 100, 200],  # the first box with its corners swapped
+        [0, 0, 1001, 10],
+        [500, 500, 500, 600],
+        [600, 0, 1000, 500],
+    ]
+
+    kept, pixels = prepare_boxes(coords, 2000, 1000)
+
+    assert kept.tolist() == [0, 2, 5]
+    # [y1, x1, y2, x2] scaled to a 2000x1000 image
+    assert pixels.tolist() == [[100, 400, 300, 800], [100, 400, 300, 800], [600, 0, 1000, 1000]]
+
+    kept, pixels = prepare_boxes(coords, 2000, 1000, iou_threshold=0.9)
+
+    assert kept.tolist() == [0, 5]
+    assert prepare_boxes([], 10, 10, iou_threshold=0.9)[0].tolist() == []
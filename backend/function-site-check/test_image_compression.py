@@ -0,0 +1,74 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JPEG quality search and compression to the model's byte budget."""
+
+import io
+import random
+
+from PIL import Image
+
+import main
+
+def noise_image(width, height, seed=0):
+    generator = random.Random(seed)
+    return Image.frombytes('RGB', (width, height), bytes(generator.getrandbits(8) for _ in range(width * height * 3)))
+
+def test_encode_within_budget_picks_the_highest_fitting_quality():
+    img = noise_image(128, 128)
+    sizes = {quality: len(main.encode_jpeg(img, quality)) for quality in main.JPEG_QUALITIES}
+    max_bytes = (sizes[50] + sizes[55]) // 2
+
+    jpeg_bytes, encoded, quality = main.encode_within_budget(img, max_bytes)
+
+    assert quality == 50
+    assert encoded.size == img.size
+    assert len(jpeg_bytes) == sizes[50] <= max_bytes
+
+def test_encode_within_budget_shrinks_when_lowest_quality_is_too_large():
+    img = noise_image(128, 128)
+    max_bytes = len(main.encode_jpeg(img, main.JPEG_QUALITIES[0])) // 2
+
+    jpeg_bytes, encoded, quality = main.encode_within_budget(img, max_bytes)
+
+    assert len(jpeg_bytes) <= max_bytes
+    assert encoded.width < img.width and encoded.height < img.height
+    assert Image.open(io.BytesIO(jpeg_bytes)).size == encoded.size
+
+def test_estimate_jpeg_quality():
+    img = noise_image(64, 64)
+    for quality in (30, 75, 90):
+        assert abs(main.estimate_jpeg_quality(main.encode_jpeg(img, quality)) - quality) <= 1
+    png = io.BytesIO()
+    img.save(png, format='PNG')
+    assert main.estimate_jpeg_quality(png.getvalue()) == main.DEFAULT_JPEG_QUALITY
+
+def test_compress_image_passes_small_jpegs_through():
+    jpeg_bytes = main.encode_jpeg(noise_image(64, 64), 80)
+
+    compressed, img, quality = main.compress_image(jpeg_bytes, max_size_kb=100)
+
+    assert compressed is jpeg_bytes
+    assert img.size == (64, 64) and img.mode == 'RGB'
+    assert quality == 80
+
+def test_compress_image_resizes_to_max_dimension():
+    png = io.BytesIO()
+    noise_image(200, 100).save(png, format='PNG')
+
+    compressed, img, quality = main.compress_image(png.getvalue(), max_size_kb=100, max_dimension=50)
+
+    assert img.size == (50, 25)
+    assert Image.open(io.BytesIO(compressed)).format == 'JPEG'
+    assert quality == main.JPEG_QUALITIES[-1]
@@ -0,0 +1,62 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Status stream endings"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import main
+
+def stream_ending(monkeypatch, job):
+    db = mock.Mock()
+    db.collection.return_value.document.return_value.get.return_value.to_dict.return_value = job
+    monkeypatch.setattr(main, 'db', db)
+    # The stream window ends before the first poll
+    monkeypatch.setattr(main, 'STREAM_TIMEOUT_SECONDS', 0)
+    return list(main.generate_status_stream('job-1', last_event_id=7))
+
+def test_timeout_of_running_job_asks_client_to_reconnect(monkeypatch):
+    messages = stream_ending(monkeypatch, {'status': 'processing', 'heartbeat_at': datetime.now(timezone.utc)})
+
+    lines = messages[-1].splitlines()
+    assert lines[0] == f'retry: {main.STREAM_RETRY_MS}'
+    assert lines[1] == 'event: reconnect'
+    assert json.loads(lines[2][len('data: '):]) == {
+        'type': 'reconnect', 'content': 'Reconnect with Last-Event-ID to continue.', 'last_event_id': 7}
+
+def test_timeout_of_stopped_job_is_an_error(monkeypatch):
+    stale = datetime.now(timezone.utc) - timedelta(seconds=main.JOB_STALE_SECONDS + 1)
+    messages = stream_ending(monkeypatch, {'status': 'processing', 'heartbeat_at': stale})
+
+    assert json.loads(messages[-1][len('data: '):]) == {'type': 'error', 'content': 'Job stopped before finishing'}
+
+def test_start_job_records_heartbeats_while_running(monkeypatch):
+    db = mock.Mock()
+    monkeypatch.setattr(main, 'db', db)
+    monkeypatch.setattr(main, 'JOB_HEARTBEAT_SECONDS', 0.05)
+    done = mock.Mock()
+    unblock = threading.Event()
+    main.start_job('job-2', lambda job_id: (unblock.wait(1), done(job_id)))
+
+    time.sleep(0.3)
+    beats = db.collection.return_value.document.return_value.update.call_count
+    assert beats >= 2
+    unblock.set()
+    time.sleep(0.2)
+    done.assert_called_once_with('job-2')
+    assert db.collection.return_value.document.return_value.update.call_count <= beats + 1
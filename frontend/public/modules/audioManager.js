@@ -21,6 +21,13 @@ export class AudioManager {
         this.currentEventSource = null;
         this.audioQueue = [];
         this.isStreamPlaying = false;
+        // Low-latency streaming schedules raw PCM chunks with the Web Audio API as they arrive
+        this.AudioContextClass = window.AudioContext || window.webkitAudioContext;
+        this.audioContext = null;
+        this.pcmFormat = null;
+        this.pcmSources = [];
+        this.pcmPlayback = null;
+        this.pcmNextStartTime = 0;
     }
 
     stopAudio() {
@@ -57,6 +64,22 @@ export class AudioManager {
         this.audioQueue = [];
         this.isStreamPlaying = false;
         console.log('AudioManager: Audio queue cleared and stream playing flag reset');
+
+        // Stop scheduled PCM playback
+        this._stopPcmSources();
+        this.pcmFormat = null;
+        this.pcmNextStartTime = 0;
+    }
+
+    _stopPcmSources() {
+        this.pcmSources.forEach(source => {
+            try {
+                source.stop();
+            } catch (e) {
+                // Already stopped
+            }
+        });
+        this.pcmSources = [];
     }
 
     async playAudio(text) {
@@ -106,6 +129,17 @@ export class AudioManager {
         this.currentStreamController = new AbortController();
         const signal = this.currentStreamController.signal;
 
+        // Request raw PCM when it can be played as it arrives, otherwise one WAV per sentence
+        const format = this.AudioContextClass ? 'pcm' : 'wav';
+        if (format === 'pcm') {
+            if (!this.audioContext) {
+                this.audioContext = new this.AudioContextClass();
+            }
+            if (this.audioContext.state === 'suspended') {
+                this.audioContext.resume();
+            }
+        }
+
         try {
             console.log('AudioManager: Starting new audio stream');
             
@@ -115,7 +149,7 @@ export class AudioManager {
                     'Content-Type': 'application/json',
                     'Accept': 'text/event-stream'  // Signal that we want streaming
                 },
-                body: JSON.stringify({ text }),
+                body: JSON.stringify({ text, format }),
                 signal: signal // Pass the signal to fetch
             });
 
@@ -185,7 +219,12 @@ export class AudioManager {
             return;
         }
 
-        if (data.audio) {
+        if (data.sample_rate) {
+            // Header for the next utterance's PCM chunks
+            this.pcmFormat = { sampleRate: data.sample_rate };
+        } else if (data.pcm) {
+            this._schedulePcmChunk(data.pcm);
+        } else if (data.audio) {
             // Add audio chunk to queue
             this.audioQueue.push(data.audio);
             console.log(`AudioManager: Added audio chunk ${data.sentence_index + 1}/${data.total_sentences} to queue. Queue size: ${this.audioQueue.length}`);
@@ -199,6 +238,49 @@ export class AudioManager {
         }
     }
 
+    _schedulePcmChunk(pcmBase64) {
+        if (!this.pcmFormat || !this.audioContext) {
+            console.error('AudioManager: PCM chunk received before its audio header');
+            return;
+        }
+
+        // Little-endian 16-bit samples to floats
+        const binary = atob(pcmBase64);
+        const samples = new Float32Array(binary.length >> 1);
+        for (let i = 0; i < samples.length; i++) {
+            let value = binary.charCodeAt(2 * i) | (binary.charCodeAt(2 * i + 1) << 8);
+            if (value >= 0x8000) value -= 0x10000;
+            samples[i] = value / 0x8000;
+        }
+
+        const buffer = this.audioContext.createBuffer(1, samples.length, this.pcmFormat.sampleRate);
+        buffer.copyToChannel(samples, 0);
+        const source = this.audioContext.createBufferSource();
+        source.buffer = buffer;
+        source.connect(this.audioContext.destination);
+
+        // Chunks play back to back; after a gap, leave a little lead time to avoid clicks
+        const startTime = Math.max(this.pcmNextStartTime, this.audioContext.currentTime + 0.05);
+        source.start(startTime);
+        this.pcmNextStartTime = startTime + buffer.duration;
+        this.pcmSources.push(source);
+
+        // PCM playback reports through the same state as queued WAV playback;
+        // currentAudio is a handle whose pause() stops the scheduled sources
+        this.isStreamPlaying = true;
+        if (!this.currentAudio) {
+            this.pcmPlayback = { pause: () => this._stopPcmSources(), currentTime: 0 };
+            this.currentAudio = this.pcmPlayback;
+        }
+        source.onended = () => {
+            this.pcmSources = this.pcmSources.filter(s => s !== source);
+            if (this.pcmSources.length === 0 && this.currentAudio === this.pcmPlayback) {
+                this.isStreamPlaying = false;
+                this.currentAudio = null;
+            }
+        };
+    }
+
     _playNextFromQueue() {
         // If already playing or queue is empty, return
         if (this.isStreamPlaying || this.audioQueue.length === 0) {
@@ -257,10 +257,17 @@ export async function processInspection(audioManager) {
 
         // Now connect to stream with job_id
         const streamUrl = `https://us-central1-fda-genai-for-food.cloudfunctions.net/function-image-inspection/stream?job_id=${jobId}`;
-        analysisStream = new EventSource(streamUrl);
+        // Dropped connections are reopened after the last event received, with backoff
+        const MAX_STREAM_RECONNECTS = 5;
+        let lastEventId = 0;
+        let reconnects = 0;
 
         // Handle streaming events
-        analysisStream.onmessage = (event) => {
+        const handleStreamMessage = (event) => {
+            if (event.lastEventId) {
+                lastEventId = event.lastEventId;
+            }
+            reconnects = 0;
             try {
                 const data = JSON.parse(event.data);
                 console.log('Received stream event:', data.type, data);
@@ -407,6 +414,8 @@ export async function processInspection(audioManager) {
                         `;
                         break;
                         
+                    case 'JOB_INTERRUPTED':
+                    case 'JOB_RESUMED':
                     case 'status':
                         // Fallback for any status messages
                         statusElement.innerHTML = `
@@ -431,15 +440,36 @@ export async function processInspection(audioManager) {
             }
         };
 
-        analysisStream.onerror = (error) => {
+        const handleStreamError = (error) => {
             console.error('Stream error:', error);
             analysisStream.close();
+            if (reconnects >= MAX_STREAM_RECONNECTS) {
+                statusElement.innerHTML = `
+                    <div style="color: var(--error);">
+                        Connection lost. Please try again.
+                    </div>
+                `;
+                return;
+            }
+            reconnects += 1;
             statusElement.innerHTML = `
-                <div style="color: var(--error);">
-                    Connection lost. Please try again.
+                <div class="streaming-loading">
+                    <span>Connection lost. Reconnecting...</span>
+                    <div class="loading-dots">
+                        <span>.</span><span>.</span><span>.</span>
+                    </div>
                 </div>
             `;
+            setTimeout(connectStream, 1000 * 2 ** (reconnects - 1));
+        };
+
+        // The server resumes after last_event_id, so no event is shown twice
+        const connectStream = () => {
+            analysisStream = new EventSource(lastEventId ? `${streamUrl}&last_event_id=${lastEventId}` : streamUrl);
+            analysisStream.onmessage = handleStreamMessage;
+            analysisStream.onerror = handleStreamError;
         };
+        connectStream();
         
         // Keep retake button visible after processing
         retakeButton.style.display = 'flex';
@@ -68,26 +68,31 @@ async function loadSatelliteImage(address) {
     }
 }
 
-// Analyze site image
-async function analyzeSite(mapImage) {
+// Start site image analysis and return its job ID; siteId lets rechecks reuse unchanged results
+async function startSiteAnalysis(mapImage, siteId) {
     console.log('Starting vehicle detection analysis...');
-    try {
-        const analysisResult = await fetch('https://us-central1-fda-genai-for-food.cloudfunctions.net/site-check-py', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ image: mapImage })
-        });
+    const response = await fetch('https://us-central1-fda-genai-for-food.cloudfunctions.net/site-check-py', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ image: mapImage, site_id: siteId })
+    });
 
-        if (!analysisResult.ok) {
-            const errorText = await analysisResult.text();
-            console.error('Analysis failed:', errorText);
-            throw new Error(`Failed to analyze image: ${errorText}`);
-        }
+    if (!response.ok) {
+        const errorText = await response.text();
+        console.error('Analysis failed:', errorText);
+        throw new Error(`Failed to analyze image: ${errorText}`);
+    }
+
+    const { job_id } = await response.json();
+    console.log('Site analysis job created:', job_id);
+    return job_id;
+}
 
-        console.log('Received analysis response');
-        const analysisData = await analysisResult.json();
+// Validate the analysis result delivered at the end of the stream
+function validateAnalysis(analysisData) {
+    try {
         console.log('Analysis data:', {
             hasVehicleAnalysis: !!analysisData.vehicle_analysis,
             hasAnnotatedImage: !!analysisData.annotated_image,
@@ -182,18 +187,12 @@ export async function analyzeLocation(address, audioManager) {
             </div>
         `;
 
-        // Start analysis in parallel with streaming
-        const analysisPromise = analyzeSite(mapImage).catch(error => {
-            console.error('Analysis failed:', error);
-            throw error;
-        });
-
-        // Start streaming status updates
+        // Start the analysis job, then follow its progress until the result arrives
+        const jobId = await startSiteAnalysis(mapImage, address);
         const streamingOutput = document.getElementById('streamingOutput');
-        const analysisStream = new EventSource('https://us-central1-fda-genai-for-food.cloudfunctions.net/site-check-py/stream');
+        const analysisStream = new EventSource(`https://us-central1-fda-genai-for-food.cloudfunctions.net/site-check-py/stream?job_id=${jobId}`);
         
-        // Wait for streaming to complete
-        await new Promise((resolve, reject) => {
+        const analysisResult = await new Promise((resolve, reject) => {
             analysisStream.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
@@ -204,11 +203,12 @@ export async function analyzeLocation(address, audioManager) {
                                 <span>.</span><span>.</span><span>.</span>
                             </div>
                         </div>`;
-                        
-                        if (data.content.includes('Finalizing analysis')) {
-                            analysisStream.close();
-                            resolve();
-                        }
+                    } else if (data.type === 'result') {
+                        analysisStream.close();
+                        resolve(validateAnalysis(data.data));
+                    } else if (data.type === 'error') {
+                        analysisStream.close();
+                        reject(new Error(`Failed to analyze image: ${data.content}`));
                     }
                 } catch (error) {
                     console.error('Error parsing stream data:', error);
@@ -229,9 +229,6 @@ export async function analyzeLocation(address, audioManager) {
             });
         });
 
-        // Wait for analysis to complete
-        const analysisResult = await analysisPromise;
-        
         // Update map with annotated image
         mapContainer.innerHTML = `
             <img src="${analysisResult.annotated_image}" alt="Analyzed satellite view" style="width: 100%; height: 100%; object-fit: cover;">